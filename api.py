@@ -6,31 +6,60 @@ allowing for integration with web front-ends and other applications.
 It uses a "Bring Your Own Key" (BYOK) model via request headers.
 """
 
-from fastapi import FastAPI, HTTPException, status, Request, File, UploadFile
+from fastapi import FastAPI, HTTPException, status, Request, File, UploadFile, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
+from fastapi.encoders import jsonable_encoder
 from fastapi.staticfiles import StaticFiles
-from fastapi.middleware.trustedhost import TrustedHostMiddleware
-from fastapi.middleware.httpsredirect import HTTPSRedirectMiddleware
-from pydantic import BaseModel, Field
-from typing import Optional, List
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field, model_validator, ValidationError
+from typing import Optional, List, Dict, Union, ClassVar
+from contextlib import asynccontextmanager
 import os
+import hmac
+import json
+import time
+import uuid
+import random
+import signal
+import asyncio
+import math
+import hashlib
+import sys
+import threading
 from datetime import datetime
-import logging
-import traceback
 
 # Security imports
+from limits import parse as parse_rate_limit
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 from starlette.middleware.base import BaseHTTPMiddleware
 
-# Import core application modules
-from core.writon import WritonCore
-from dotenv import load_dotenv
-
-# Load environment variables from .env file
-load_dotenv()
+# Import core application modules (provider clients are imported on first use)
+from core.writon import WritonCore, DeadlineExceeded, RequestCancelled, IdempotencyKeyReused, ConfigurationError, AdmissionRejected
+from core.admission import AdmissionController
+from core.context import RequestContext
+from core.idempotency import IdempotencyStore
+from core.log import configure_logging, get_logger, log_exception
+from core.profiling import SamplingProfiler, active_profile, bind_thread, save_profile
+from core.settings import RESTART_FIELDS, get_settings, reload_settings
+from core.usage import UsageTracker, summarize_usage
+
+# Optional faster serializers: orjson for JSON responses, msgpack on request
+try:
+    from fastapi.responses import ORJSONResponse as FastJSONResponse
+    import orjson  # noqa: F401 - ORJSONResponse needs it at render time
+except ImportError:
+    FastJSONResponse = JSONResponse
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Load the .env file and validate the configuration, so misconfiguration fails at boot
+startup_settings = get_settings()
 
 # --- Security Setup ---
 
@@ -65,11 +94,319 @@ class RequestSizeLimitMiddleware(BaseHTTPMiddleware):
         response = await call_next(request)
         return response
 
+# Client disconnect monitoring middleware
+class DisconnectMonitorMiddleware:
+    """
+    Pure ASGI middleware that notices a client disconnect while the request
+    is still being processed. Once the request body has been read, it keeps
+    listening on the connection and sets `request.state.disconnected` when
+    the client goes away, so long-running handlers can cancel upstream work.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        disconnected = asyncio.Event()
+        scope.setdefault("state", {})["disconnected"] = disconnected
+        body_complete = False
+        listener = None
+
+        async def listen_for_disconnect():
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    disconnected.set()
+                    return
+
+        async def wrapped_receive():
+            nonlocal body_complete, listener
+            if body_complete:
+                await disconnected.wait()
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                disconnected.set()
+            elif not message.get("more_body", False):
+                body_complete = True
+                listener = asyncio.ensure_future(listen_for_disconnect())
+            return message
+
+        try:
+            await self.app(scope, wrapped_receive, send)
+        finally:
+            if listener:
+                listener.cancel()
+
+# Request logging middleware
+class RequestLoggingMiddleware:
+    """
+    Pure ASGI middleware that emits one structured log record per request
+    with its id, route, status, duration and sizes, plus any fields the
+    handler added through `add_log_fields`. The request id is taken from an
+    incoming X-Request-ID header or generated, and echoed on the response.
+    Successful requests are subject to LOG_SAMPLE_RATE.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        request_id = headers.get(b"x-request-id", b"").decode("latin-1")[:64] or uuid.uuid4().hex
+        state = scope.setdefault("state", {})
+        state["request_id"] = request_id
+        state["log_fields"] = {}
+        start = time.perf_counter()
+        status_code = 500
+        response_bytes = 0
+
+        async def send_with_logging(message):
+            nonlocal status_code, response_bytes
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", request_id.encode("latin-1"))]
+            elif message["type"] == "http.response.body":
+                response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_logging)
+        finally:
+            route = scope.get("route")
+            fields = {
+                "request_id": request_id,
+                "method": scope["method"],
+                "route": getattr(route, "path", scope["path"]),
+                "status": status_code,
+                "duration_ms": round((time.perf_counter() - start) * 1000, 2),
+                "request_bytes": int(headers.get(b"content-length", b"0") or 0),
+                "response_bytes": response_bytes,
+                **state["log_fields"],
+            }
+            if status_code >= 500:
+                logger.error("request", extra=fields)
+            elif status_code >= 400:
+                logger.warning("request", extra=fields)
+            else:
+                logger.info("request", extra={**fields, "sample": True})
+
+# Sampled profiling middleware (only installed when PROFILING_ENABLED=true)
+class ProfilingMiddleware:
+    """
+    Pure ASGI middleware that runs selected requests under the sampling
+    profiler and writes collapsed-stack and pstats files for them. A request
+    is profiled when it carries the X-Writon-Profile header with the
+    configured token, or at random with probability `sample_rate`. At most
+    one request per worker is profiled at a time. Event-loop samples are
+    anchored to this call's frame, so concurrent requests on the same loop
+    do not show up in the profile.
+    """
+
+    def __init__(self, app, directory: str, token: str = "", sample_rate: float = 0.0,
+                 interval: float = 0.005, max_profiles: int = 50):
+        self.app = app
+        self.directory = directory
+        self.token = token
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.max_profiles = max_profiles
+        self._busy = False
+
+    def _requested(self, scope) -> bool:
+        header = dict(scope["headers"]).get(b"x-writon-profile")
+        return bool(self.token and header) and hmac.compare_digest(header.decode("latin-1"), self.token)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self._busy:
+            await self.app(scope, receive, send)
+            return
+        requested = self._requested(scope)
+        if not requested and not (self.sample_rate and random.random() < self.sample_rate):
+            await self.app(scope, receive, send)
+            return
+
+        self._busy = True
+        name = f"{datetime.now().strftime('%Y%m%dT%H%M%S%f')}_{scope['path'].strip('/').replace('/', '_') or 'root'}"
+        profile = SamplingProfiler(self.interval)
+        profile.add_thread(threading.get_ident(), "loop", anchor=sys._getframe())
+        token = active_profile.set(profile)
+
+        async def send_with_profile(message):
+            if requested and message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-writon-profile-id", name.encode("latin-1"))]
+            await send(message)
+
+        profile.start()
+        try:
+            await self.app(scope, receive, send_with_profile)
+        finally:
+            profile.stop()
+            active_profile.reset(token)
+            self._busy = False
+            try:
+                await run_in_threadpool(save_profile, profile, self.directory, name, self.max_profiles)
+            except OSError as e:
+                log_exception(logger, "Could not write profile", e, profile=name)
+
+# Traffic capture middleware (only installed when CAPTURE_ENABLED=true)
+class CaptureMiddleware:
+    """
+    Pure ASGI middleware that records the shape of each processing request
+    (see `core.capture`) for later replay. The request body is copied as it
+    is read and parsed only after the response has been sent; the record is
+    then handed to the capture's background writer.
+    """
+
+    def __init__(self, app, capture):
+        from core.capture import CAPTURE_ROUTES, capture_record
+
+        self.app = app
+        self.capture = capture
+        self.routes = CAPTURE_ROUTES
+        self.capture_record = capture_record
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.routes or not self.capture.sampled():
+            await self.app(scope, receive, send)
+            return
+
+        started_at = time.time()
+        start = time.perf_counter()
+        chunks = []
+        status_code = 500
+
+        async def receive_with_copy():
+            message = await receive()
+            if message["type"] == "http.request":
+                chunks.append(message.get("body", b""))
+            return message
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive_with_copy, send_with_status)
+        finally:
+            try:
+                payload = json.loads(b"".join(chunks) or b"null")
+            except ValueError:
+                payload = None
+            provider = dict(scope["headers"]).get(b"x-provider", b"").decode("latin-1")[:32] or None
+            self.capture.write(self.capture_record(
+                scope["path"], payload, status_code, round((time.perf_counter() - start) * 1000, 2),
+                provider=provider, started_at=round(started_at, 3), keep_text=self.capture.keep_text,
+            ))
+
 # --- Application Setup ---
 
-# Configure logging for the application
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger("api")
+# Configure structured, queue-backed logging for the application
+configure_logging()
+logger = get_logger("api")
+
+# Instantiate the core logic
+core = WritonCore()
+
+# Limits on concurrent upstream-bound work (per worker process)
+admission = AdmissionController(
+    max_inflight=startup_settings.admission_max_inflight,
+    max_inflight_per_provider=startup_settings.admission_max_inflight_per_provider,
+    max_queue=startup_settings.admission_queue_size,
+    queue_timeout=startup_settings.admission_queue_timeout_seconds,
+    adaptive=startup_settings.admission_adaptive,
+    min_inflight=startup_settings.admission_min_inflight,
+    target_latency=startup_settings.admission_target_latency_seconds,
+    providers=tuple(WritonCore.PROVIDER_CLASSES),
+)
+
+# Upstream token usage and timing per provider, mode and key (per worker process)
+usage_tracker = UsageTracker(max_keys=startup_settings.usage_max_keys)
+
+# Completed responses by Idempotency-Key (per worker process)
+idempotency_store = IdempotencyStore(
+    ttl_seconds=startup_settings.idempotency_ttl_seconds,
+    max_keys=startup_settings.idempotency_max_keys,
+)
+
+# Request shapes recorded for replay (opt-in, one file per worker process)
+traffic_capture = None
+if startup_settings.capture_enabled:
+    from core.capture import TrafficCapture
+
+    traffic_capture = TrafficCapture(
+        path=startup_settings.capture_path,
+        max_bytes=startup_settings.capture_max_mb * 1024 * 1024,
+        backups=startup_settings.capture_backups,
+        sample_rate=startup_settings.capture_sample_rate,
+        keep_text=startup_settings.capture_text == "redacted",
+    )
+
+
+def get_warmup_providers() -> List[str]:
+    """Reads the providers to warm up at startup from WARMUP_PROVIDERS."""
+    value = get_settings().warmup_providers.strip().lower()
+    if value == "none":
+        return []
+    if value == "all":
+        return list(WritonCore.PROVIDER_CLASSES.keys())
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+
+def reload_configuration() -> dict:
+    """
+    Re-reads the configuration and swaps in the new settings snapshot for
+    this worker. Returns the names of the changed settings and of those that
+    only take effect after a restart. Raises ConfigurationError (keeping the
+    current settings) if the new configuration is invalid.
+    """
+    _, changed = reload_settings()
+    restart_required = sorted(set(changed) & RESTART_FIELDS)
+    logger.info("Reloaded settings", extra={"changed": changed, "restart_required": restart_required})
+    return {"changed": changed, "restart_required": restart_required}
+
+
+def handle_reload_signal() -> None:
+    try:
+        reload_configuration()
+    except ConfigurationError as e:
+        logger.error("Settings reload failed; keeping the current settings", extra={"error": str(e)})
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Warms up pooled upstream connections before the worker starts serving.
+    Uvicorn only accepts traffic once startup completes, and /ready reports
+    ready only after this point. SIGHUP reloads the settings.
+    """
+    if hasattr(signal, "SIGHUP"):
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, handle_reload_signal)
+        except (NotImplementedError, RuntimeError, ValueError):
+            # Not on the main thread (e.g. under the test client); /admin/reload still works.
+            pass
+    providers = get_warmup_providers()
+    if providers:
+        timeout = get_settings().warmup_timeout_seconds
+        app.state.warmed_providers = await run_in_threadpool(core.warm_up, providers, timeout)
+        logger.info("Warmed up upstream connections", extra={"warmed_providers": app.state.warmed_providers})
+    app.state.ready = True
+    yield
+    app.state.ready = False
+    if traffic_capture is not None:
+        traffic_capture.close()
+
 
 # Initialize the FastAPI application
 app = FastAPI(
@@ -78,34 +415,37 @@ app = FastAPI(
     version="0.1.0",
     docs_url="/docs",
     redoc_url="/redoc",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse,
 )
+app.state.ready = False
+app.state.draining = False
+app.state.warmed_providers = {}
 
 # Add rate limiter to app state
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
-# Instantiate the core logic
-core = WritonCore()
-
 # Configure security middleware (order matters!)
 # 1. Security headers (first)
 app.add_middleware(SecurityHeadersMiddleware)
 
 # 2. Request size limiting
-max_request_size = int(os.getenv("MAX_REQUEST_SIZE_MB", "1")) * 1024 * 1024
+max_request_size = startup_settings.max_request_size_mb * 1024 * 1024
 app.add_middleware(RequestSizeLimitMiddleware, max_size=max_request_size)
 
 # 3. HTTPS redirect (production only)
-if os.getenv("ENVIRONMENT") == "production":
+if startup_settings.environment == "production":
+    from fastapi.middleware.httpsredirect import HTTPSRedirectMiddleware
     app.add_middleware(HTTPSRedirectMiddleware)
 
 # 4. Trusted host (production only)
-if os.getenv("ENVIRONMENT") == "production":
-    allowed_hosts = os.getenv("ALLOWED_HOSTS", "writon.xyz,*.writon.xyz").split(",")
-    app.add_middleware(TrustedHostMiddleware, allowed_hosts=allowed_hosts)
+if startup_settings.environment == "production":
+    from fastapi.middleware.trustedhost import TrustedHostMiddleware
+    app.add_middleware(TrustedHostMiddleware, allowed_hosts=list(startup_settings.allowed_hosts))
 
 # 5. CORS (last)
-allowed_origins = os.getenv("ALLOWED_ORIGINS", "http://localhost:8000,http://127.0.0.1:8000").split(",")
+allowed_origins = list(startup_settings.allowed_origins)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=allowed_origins,
@@ -114,6 +454,28 @@ app.add_middleware(
     allow_headers=["*"]
 )
 
+# 6. Disconnect monitoring (owns the connection's receive channel)
+app.add_middleware(DisconnectMonitorMiddleware)
+
+# 7. Request logging (wraps 1-6, so durations cover the app stack; only the
+#    opt-in profiling and capture middlewares below sit outside it)
+app.add_middleware(RequestLoggingMiddleware)
+
+# 8. Sampled profiling (opt-in; wraps 1-7 so their cost is included)
+if startup_settings.profiling_enabled:
+    app.add_middleware(
+        ProfilingMiddleware,
+        directory=startup_settings.profiling_dir,
+        token=startup_settings.profiling_token,
+        sample_rate=startup_settings.profiling_sample_rate,
+        interval=startup_settings.profiling_interval_ms / 1000,
+        max_profiles=startup_settings.profiling_max_profiles,
+    )
+
+# 9. Traffic capture (opt-in, outermost; records request shapes for benchmarks/replay.py)
+if traffic_capture is not None:
+    app.add_middleware(CaptureMiddleware, capture=traffic_capture)
+
 # --- Pydantic Data Models ---
 # Define the structure and validation for API requests and responses.
 
@@ -122,8 +484,17 @@ class ProcessRequest(BaseModel):
     text: str = Field(
         ..., min_length=1, max_length=10000, description="Text to process"
     )
-    mode: str = Field(
-        ..., pattern="^(grammar|translate|summarize)$", description="Processing mode"
+    mode: Optional[str] = Field(
+        None, pattern="^(grammar|translate|summarize)$", description="Processing mode"
+    )
+    pipeline: Optional[List[str]] = Field(
+        None,
+        min_length=1,
+        max_length=WritonCore.MAX_PIPELINE_STEPS,
+        description="Modes to run back to back instead of a single mode, e.g. [\"grammar\", \"translate\"]",
+    )
+    fuse: bool = Field(
+        True, description="Let compatible pipeline steps share one prompt"
     )
     case_style: str = Field(
         "sentence",
@@ -133,6 +504,36 @@ class ProcessRequest(BaseModel):
     target_language: Optional[str] = Field(
         None, description="Target language for translation"
     )
+    force_translation: bool = Field(
+        False, description="Translate even if the text is detected to already be in the target language"
+    )
+    document_id: Optional[str] = Field(
+        None,
+        max_length=128,
+        pattern="^[A-Za-z0-9._:-]+$",
+        description="Client-chosen document id; enables incremental reprocessing of unchanged paragraphs",
+    )
+    text_format: str = Field(
+        "plain",
+        pattern="^(plain|markdown)$",
+        description="'markdown' sends only prose upstream and leaves code, URLs, tables and front matter untouched",
+    )
+
+    @model_validator(mode="after")
+    def check_mode(self):
+        if bool(self.mode) == bool(self.pipeline):
+            raise ValueError("Provide exactly one of mode or pipeline")
+        if self.pipeline:
+            unknown = [step for step in self.pipeline if step not in WritonCore.MODES]
+            if unknown:
+                raise ValueError(f"Unknown pipeline steps: {unknown}")
+            if self.document_id:
+                raise ValueError("document_id is not supported with pipeline")
+            if self.text_format == "markdown":
+                raise ValueError("text_format 'markdown' is not supported with pipeline")
+        if self.text_format == "markdown" and self.document_id:
+            raise ValueError("text_format 'markdown' is not supported with document_id")
+        return self
 
 
 class SimpleProcessRequest(BaseModel):
@@ -144,21 +545,130 @@ class SimpleProcessRequest(BaseModel):
         pattern="^(lower|sentence|title|upper)$",
         description="Case formatting style",
     )
+    document_id: Optional[str] = Field(
+        None,
+        max_length=128,
+        pattern="^[A-Za-z0-9._:-]+$",
+        description="Client-chosen document id; enables incremental reprocessing of unchanged paragraphs",
+    )
+    text_format: str = Field(
+        "plain",
+        pattern="^(plain|markdown)$",
+        description="'markdown' sends only prose upstream and leaves code, URLs, tables and front matter untouched",
+    )
+
+    @model_validator(mode="after")
+    def check_format(self):
+        if self.text_format == "markdown" and self.document_id:
+            raise ValueError("text_format 'markdown' is not supported with document_id")
+        return self
 
 
 class TranslateRequest(BaseModel):
     text: str = Field(
         ..., min_length=1, max_length=10000, description="Text to translate"
     )
-    target_language: str = Field(..., min_length=1, description="Target language")
+    target_language: Optional[str] = Field(None, min_length=1, description="Target language")
+    target_languages: Optional[List[str]] = Field(
+        None,
+        min_length=1,
+        max_length=20,
+        description="Several target languages; the response maps each language to its translation",
+    )
+    strategy: str = Field(
+        "parallel",
+        pattern="^(parallel|combined)$",
+        description="Multi-language strategy: one call per language, or one structured-output prompt for short inputs",
+    )
+    force_translation: bool = Field(
+        False, description="Translate even if the text is detected to already be in the target language"
+    )
     case_style: str = Field(
         "sentence",
         pattern="^(lower|sentence|title|upper)$",
         description="Case formatting style",
     )
+    document_id: Optional[str] = Field(
+        None,
+        max_length=128,
+        pattern="^[A-Za-z0-9._:-]+$",
+        description="Client-chosen document id; enables incremental reprocessing of unchanged paragraphs",
+    )
+    text_format: str = Field(
+        "plain",
+        pattern="^(plain|markdown)$",
+        description="'markdown' sends only prose upstream and leaves code, URLs, tables and front matter untouched",
+    )
+
+    @model_validator(mode="after")
+    def check_targets(self):
+        if bool(self.target_language) == bool(self.target_languages):
+            raise ValueError("Provide exactly one of target_language or target_languages")
+        if self.target_languages and self.document_id:
+            raise ValueError("document_id is not supported with target_languages")
+        if self.text_format == "markdown" and (self.target_languages or self.document_id):
+            raise ValueError("text_format 'markdown' is not supported with target_languages or document_id")
+        return self
+
+
+class DocumentStats(BaseModel):
+    document_id: str
+    paragraphs: int
+    processed: int
+    reused: int
+
+
+class LanguageDetection(BaseModel):
+    language: str
+    confidence: float
+    translation_skipped: bool
+
+
+class TranslationMemoryStats(BaseModel):
+    segments: int
+    exact_hits: int
+    fuzzy_hits: int
+    translated: int
+    hit_rate: float
+
+
+class CompressionStats(BaseModel):
+    original_tokens: int
+    kept_tokens: int
+    sentences: int
+    kept_sentences: int
+    removed_ratio: float
+    duration_ms: float
+
+
+class MarkdownStats(BaseModel):
+    blocks: int
+    prose_blocks: int
+    sent_chars: int
+    kept_original: int
+
+
+class UpstreamUsage(BaseModel):
+    calls: int
+    input_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
+    upstream_ms: Optional[float] = None
+    ttfb_ms: Optional[float] = None
+    model: Optional[str] = None
+    tier: Optional[str] = None
+
+
+class PipelineStep(BaseModel):
+    modes: List[str]
+    fused: bool
+    skipped: bool
+    duration_ms: float
 
 
 class ProcessResponse(BaseModel):
+    # Request echoes left out of compact responses
+    COMPACT_EXCLUDE: ClassVar[set] = {"original_text", "mode", "case_style", "target_language"}
+
     success: bool
     original_text: str
     processed_text: str
@@ -166,6 +676,32 @@ class ProcessResponse(BaseModel):
     case_style: str
     target_language: Optional[str] = None
     provider: Optional[str] = None
+    document: Optional[DocumentStats] = None
+    detected_language: Optional[LanguageDetection] = None
+    pipeline: Optional[List[PipelineStep]] = None
+    translation_memory: Optional[TranslationMemoryStats] = None
+    compression: Optional[CompressionStats] = None
+    markdown: Optional[MarkdownStats] = None
+    usage: Optional[UpstreamUsage] = None
+    timestamp: str
+
+
+class TranslationResult(BaseModel):
+    success: bool
+    processed_text: Optional[str] = None
+    error: Optional[str] = None
+
+
+class MultiTranslateResponse(BaseModel):
+    COMPACT_EXCLUDE: ClassVar[set] = {"original_text", "case_style", "strategy"}
+
+    success: bool
+    original_text: str
+    translations: Dict[str, TranslationResult]
+    case_style: str
+    strategy: str
+    provider: Optional[str] = None
+    usage: Optional[UpstreamUsage] = None
     timestamp: str
 
 
@@ -183,6 +719,13 @@ class HealthResponse(BaseModel):
     timestamp: str
 
 
+class ReadinessResponse(BaseModel):
+    ready: bool
+    draining: bool
+    warmed_providers: Dict[str, bool]
+    timestamp: str
+
+
 class ProvidersResponse(BaseModel):
     available_providers: List[str]
     current_provider: str
@@ -194,8 +737,8 @@ class ProvidersResponse(BaseModel):
 
 
 def get_current_provider() -> str:
-    """Gets the default AI provider from environment variables."""
-    return os.getenv("API_PROVIDER", "not_configured")
+    """Gets the default AI provider from the settings."""
+    return get_settings().api_provider or "not_configured"
 
 
 def extract_user_keys(request: Request) -> Optional[dict]:
@@ -227,6 +770,168 @@ def extract_user_keys(request: Request) -> Optional[dict]:
     return user_keys if user_keys else None
 
 
+def get_client_scope(request: Request, user_keys: Optional[dict] = None) -> str:
+    """
+    Returns an opaque identifier for the caller, used to keep per-client
+    server-side state (such as document sessions) apart. BYOK callers are
+    identified by a hash of their keys, everyone else by client address.
+    """
+    if user_keys:
+        material = "|".join(f"{k}={v}" for k, v in sorted(user_keys.items()) if k.endswith("_key"))
+        if material:
+            return "key:" + hashlib.sha256(material.encode("utf-8")).hexdigest()[:32]
+    return "ip:" + get_remote_address(request)
+
+
+def get_request_timeout(request: Request) -> float:
+    """
+    Returns the request's time budget in seconds: the X-Request-Timeout header
+    if present (capped at MAX_REQUEST_TIMEOUT_SECONDS), else the server default.
+    """
+    header = request.headers.get("x-request-timeout")
+    settings = get_settings()
+    if header is None:
+        return settings.request_timeout_seconds
+    try:
+        timeout = float(header)
+    except ValueError:
+        timeout = 0
+    if timeout <= 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="X-Request-Timeout must be a positive number of seconds",
+        )
+    return min(timeout, settings.max_request_timeout_seconds)
+
+
+async def run_in_context(http_request: Request, context: RequestContext, func, /, *args, slot=None, **kwargs):
+    """
+    Runs a blocking core call in the threadpool and waits for it while
+    watching the request. If the client disconnects or the deadline passes,
+    the context is cancelled (so the call makes no further upstream attempts)
+    and the worker stops waiting immediately. The thread itself cannot be
+    interrupted, so the admission `slot`, if given, is held until it returns.
+    """
+    task = asyncio.ensure_future(run_in_threadpool(bind_thread(func), *args, **kwargs))
+    # The result of an abandoned call is never read; retrieve it to keep asyncio quiet.
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    if slot is not None:
+        slot.hold_until(task)
+    waiters = {task}
+
+    disconnected = getattr(http_request.state, "disconnected", None)
+    disconnect_waiter = asyncio.ensure_future(disconnected.wait()) if disconnected else None
+    if disconnect_waiter:
+        waiters.add(disconnect_waiter)
+
+    try:
+        done, _ = await asyncio.wait(waiters, timeout=context.remaining(), return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        if disconnect_waiter:
+            disconnect_waiter.cancel()
+
+    if task in done:
+        return task.result()
+    context.cancel()
+    if disconnect_waiter in done:
+        raise RequestCancelled("Client disconnected before the AI provider responded.")
+    raise DeadlineExceeded("Request deadline exceeded while waiting for the AI provider.")
+
+
+async def run_idempotent(http_request: Request, payload: BaseModel, handler):
+    """
+    Runs `handler()` for a processing route, honouring an Idempotency-Key
+    header, and renders its response. Keys are scoped per client; a stored or
+    in-flight response for the same key and payload is returned instead of
+    processing the request again.
+    """
+    key = http_request.headers.get("idempotency-key")
+    if key is None:
+        return render_response(http_request, await handler())
+    if not key or len(key) > 255:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Idempotency-Key must be between 1 and 255 characters",
+        )
+
+    scope = get_client_scope(http_request, extract_user_keys(http_request))
+    fingerprint = hashlib.sha256(f"{http_request.url.path}\0{payload.model_dump_json()}".encode("utf-8")).hexdigest()
+    try:
+        result, replayed = await idempotency_store.run(f"{scope}:{key}", fingerprint, handler)
+    except IdempotencyKeyReused as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    add_log_fields(http_request, idempotent_replay=replayed)
+    http_request.state.idempotent_replay = replayed
+    return render_response(http_request, result)
+
+
+COMPACT_MEDIA_TYPE = "application/vnd.writon.compact+json"
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+
+
+def render_response(http_request: Request, result: BaseModel) -> Response:
+    """
+    Serializes a processing response according to the request.
+
+    `?compact=true` or `Accept: application/vnd.writon.compact+json` drops
+    the fields that only echo the request (see `COMPACT_EXCLUDE`) and any
+    null fields. `Accept: application/msgpack` returns MessagePack when the
+    msgpack package is installed. Otherwise the body is JSON, serialized
+    directly by pydantic's encoder.
+    """
+    accept = http_request.headers.get("accept", "")
+    compact = COMPACT_MEDIA_TYPE in accept or http_request.query_params.get("compact", "").lower() in ("1", "true", "yes")
+    exclude = result.COMPACT_EXCLUDE if compact else None
+
+    headers = {"Vary": "Accept"}
+    if getattr(http_request.state, "idempotent_replay", False):
+        headers["Idempotent-Replayed"] = "true"
+
+    if msgpack is not None and any(media_type in accept for media_type in MSGPACK_MEDIA_TYPES):
+        content = msgpack.packb(result.model_dump(mode="json", exclude=exclude, exclude_none=compact))
+        return Response(content=content, media_type="application/msgpack", headers=headers)
+    content = result.model_dump_json(exclude=exclude, exclude_none=compact)
+    return Response(content=content, media_type="application/json", headers=headers)
+
+
+def admission_rejected_error(http_request: Request, error: AdmissionRejected) -> HTTPException:
+    """Maps a shed request to 503 with a Retry-After hint."""
+    add_log_fields(http_request, shed=True)
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=str(error),
+        headers={"Retry-After": str(error.retry_after)},
+    )
+
+
+def usage_key(connection, user_keys: Optional[dict] = None) -> str:
+    """Groups usage by BYOK key hash; calls made with the server's own keys share one group."""
+    scope = get_client_scope(connection, user_keys)
+    return scope if scope.startswith("key:") else "server"
+
+
+def record_usage(http_request: Request, context: RequestContext, mode: str, provider: str, user_keys: Optional[dict] = None) -> Optional[UpstreamUsage]:
+    """
+    Totals the upstream calls recorded on `context`, adds them to the
+    per-provider/mode/key aggregates and the request log, and returns them
+    for the response. Requests served without an upstream call return None.
+    """
+    usage = summarize_usage(context.usage)
+    if usage is None:
+        return None
+    usage_tracker.record(provider, mode, usage_key(http_request, user_keys), usage)
+    add_log_fields(http_request, **{f"upstream_{field}": value for field, value in usage.items() if value is not None})
+    return UpstreamUsage(**usage)
+
+
+def add_log_fields(request: Request, **fields) -> None:
+    """Adds fields to the structured log record emitted for this request."""
+    log_fields = getattr(request.state, "log_fields", None)
+    if log_fields is not None:
+        log_fields.update(fields)
+
+
 def create_error_response(error_type: str, message: str) -> ErrorResponse:
     """Creates a standardized error response object."""
     return ErrorResponse(
@@ -260,6 +965,100 @@ async def health_check():
     )
 
 
+@app.get("/ready", response_model=ReadinessResponse, summary="Readiness Check")
+async def readiness_check():
+    """
+    Readiness endpoint for load balancers. Reports ready only once connection
+    warm-up has finished, and not ready again while the worker is draining.
+    """
+    ready = app.state.ready and not app.state.draining
+    body = ReadinessResponse(
+        ready=ready,
+        draining=app.state.draining,
+        warmed_providers=app.state.warmed_providers,
+        timestamp=datetime.now().isoformat(),
+    )
+    if not ready:
+        return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content=body.model_dump())
+    return body
+
+
+def prometheus_label(value) -> str:
+    """Escapes a Prometheus label value (backslash, double quote and newline)."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+@app.get("/metrics", summary="Worker Metrics", response_class=PlainTextResponse)
+async def metrics(request: Request):
+    """
+    Gauges and counters for this worker in Prometheus text format: admission
+    control (in-flight calls, queue depth and limit per pool, admitted and
+    shed totals) and upstream usage per provider and mode. When METRICS_TOKEN
+    is set, the route requires it as a bearer token and usage is also broken
+    down by key hash; without it, per-key usage is never exposed.
+    """
+    token = get_settings().metrics_token
+    if token and not hmac.compare_digest(request.headers.get("authorization", ""), f"Bearer {token}"):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid metrics token")
+    lines = []
+    pools = admission.snapshot()
+    gauges = (
+        ("writon_admission_inflight", "inflight", "Upstream calls in flight"),
+        ("writon_admission_queue_depth", "queue_depth", "Requests waiting for a slot"),
+        ("writon_admission_limit", "limit", "Current in-flight limit"),
+    )
+    for metric, field, help_text in gauges:
+        lines += [f"# HELP {metric} {help_text}.", f"# TYPE {metric} gauge"]
+        lines += [f'{metric}{{pool="{prometheus_label(pool)}"}} {values[field]}' for pool, values in pools.items()]
+    lines += ["# HELP writon_admission_admitted_total Requests admitted.", "# TYPE writon_admission_admitted_total counter"]
+    lines += [f'writon_admission_admitted_total{{pool="{prometheus_label(pool)}"}} {values["admitted_total"]}' for pool, values in pools.items()]
+    lines += ["# HELP writon_admission_shed_total Requests shed with 503.", "# TYPE writon_admission_shed_total counter"]
+    for pool, values in pools.items():
+        lines += [
+            f'writon_admission_shed_total{{pool="{prometheus_label(pool)}",reason="{prometheus_label(reason)}"}} {count}'
+            for reason, count in values["shed_total"].items()
+        ]
+
+    groups = usage_tracker.snapshot(by_key=bool(token))
+    counters = (
+        ("writon_upstream_requests_total", "requests", 1, "Requests that made upstream calls"),
+        ("writon_upstream_calls_total", "calls", 1, "Upstream calls"),
+        ("writon_upstream_input_tokens_total", "input_tokens", 1, "Input tokens reported by providers"),
+        ("writon_upstream_output_tokens_total", "output_tokens", 1, "Output tokens reported by providers"),
+        ("writon_upstream_seconds_total", "upstream_ms", 1000, "Time spent in upstream calls"),
+        ("writon_upstream_ttfb_seconds_total", "ttfb_ms", 1000, "Time to first byte of the first upstream call"),
+    )
+    for metric, field, divisor, help_text in counters:
+        lines += [f"# HELP {metric} {help_text}.", f"# TYPE {metric} counter"]
+        for g in groups:
+            labels = f'provider="{prometheus_label(g["provider"])}",mode="{prometheus_label(g["mode"])}"'
+            if "key" in g:
+                labels += f',key="{prometheus_label(g["key"])}"'
+            lines.append(f"{metric}{{{labels}}} {g[field] / divisor if divisor > 1 else g[field]}")
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+
+@app.post("/admin/reload", include_in_schema=False)
+@limiter.limit("10/minute")
+async def admin_reload(request: Request):
+    """
+    Reloads this worker's settings from .env and the environment. Requires
+    the ADMIN_TOKEN in X-Admin-Token; without a configured token the route
+    does not exist. To reload every worker of `writon-serve`, send SIGHUP to
+    the master process instead.
+    """
+    token = get_settings().admin_token
+    if not token:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if not hmac.compare_digest(request.headers.get("x-admin-token", ""), token):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid admin token")
+    try:
+        result = await run_in_threadpool(reload_configuration)
+    except ConfigurationError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    return {"reloaded": True, "pid": os.getpid(), **result}
+
+
 @app.get("/providers", response_model=ProvidersResponse, summary="Get Provider Info")
 async def get_providers():
     """Returns a list of available providers and supported configurations."""
@@ -282,11 +1081,12 @@ async def upload_file(request: Request, file: UploadFile = File(...)):
         raise HTTPException(status_code=400, detail="Invalid file type. Please upload a .txt, .md, or .rtf file.")
     
     # Check file size (5MB limit)
-    max_file_size = int(os.getenv("MAX_FILE_SIZE_MB", "5")) * 1024 * 1024
+    max_file_size_mb = get_settings().max_file_size_mb
+    max_file_size = max_file_size_mb * 1024 * 1024
     if file.size and file.size > max_file_size:
         raise HTTPException(
             status_code=413, 
-            detail=f"File too large. Maximum size: {max_file_size} bytes ({os.getenv('MAX_FILE_SIZE_MB', '5')}MB)"
+            detail=f"File too large. Maximum size: {max_file_size} bytes ({max_file_size_mb}MB)"
         )
     
     try:
@@ -296,11 +1096,12 @@ async def upload_file(request: Request, file: UploadFile = File(...)):
         if len(contents) > max_file_size:
             raise HTTPException(
                 status_code=413, 
-                detail=f"File too large. Maximum size: {max_file_size} bytes ({os.getenv('MAX_FILE_SIZE_MB', '5')}MB)"
+                detail=f"File too large. Maximum size: {max_file_size} bytes ({max_file_size_mb}MB)"
             )
         
         decoded_contents = contents.decode('utf-8')
-        return {"filename": file.filename, "content": decoded_contents}
+        text_format = "markdown" if file.filename.endswith(".md") else "plain"
+        return {"filename": file.filename, "content": decoded_contents, "text_format": text_format}
     except UnicodeDecodeError:
         raise HTTPException(status_code=400, detail="Invalid file encoding. Please upload a UTF-8 encoded file.")
     except Exception as e:
@@ -313,11 +1114,17 @@ async def _process_request(
     case_style: str,
     http_request: Request,
     target_language: Optional[str] = None,
+    document_id: Optional[str] = None,
+    force_translation: bool = False,
+    pipeline: Optional[List[str]] = None,
+    fuse: bool = True,
+    text_format: str = "plain",
 ) -> ProcessResponse:
     """Helper function to process text requests."""
     try:
-        logger.info(f"Processing text with mode: {mode}, case: {case_style}")
         user_keys = extract_user_keys(http_request)
+        used_provider = user_keys.get("provider") if user_keys else get_current_provider()
+        add_log_fields(http_request, mode=mode, case_style=case_style, provider=used_provider, text_chars=len(text))
 
         if mode == "translate" and not target_language:
             raise HTTPException(
@@ -325,31 +1132,148 @@ async def _process_request(
                 detail="target_language is required when mode is 'translate'",
             )
 
-        final_text = core.process_text(
-            text=text,
-            mode=mode,
-            case_style=case_style,
-            target_language=target_language,
-            user_keys=user_keys,
-        )
-
-        used_provider = user_keys.get("provider") if user_keys else get_current_provider()
+        context = RequestContext(timeout=get_request_timeout(http_request))
+        started = time.perf_counter()
+        document_stats = None
+        detected_language = None
+        pipeline_steps = None
+        memory_stats = None
+        markdown_stats = None
+        if pipeline:
+            add_log_fields(http_request, pipeline="+".join(pipeline))
+            async with admission.admit(used_provider, congestion_errors=(DeadlineExceeded,)) as slot:
+                final_text, steps = await run_in_context(
+                    http_request,
+                    context,
+                    core.run_pipeline,
+                    slot=slot,
+                    text=text,
+                    steps=pipeline,
+                    case_style=case_style,
+                    target_language=target_language,
+                    user_keys=user_keys,
+                    context=context,
+                    fuse=fuse,
+                    force_translation=force_translation,
+                )
+            pipeline_steps = [PipelineStep(**step) for step in steps]
+            add_log_fields(http_request, pipeline_calls=sum(1 for step in steps if not step["skipped"]))
+        elif document_id:
+            async with admission.admit(used_provider, congestion_errors=(DeadlineExceeded,)) as slot:
+                final_text, stats = await run_in_context(
+                    http_request,
+                    context,
+                    core.process_document,
+                    slot=slot,
+                    text=text,
+                    mode=mode,
+                    case_style=case_style,
+                    document_id=f"{get_client_scope(http_request, user_keys)}:{document_id}",
+                    target_language=target_language,
+                    user_keys=user_keys,
+                    context=context,
+                )
+            document_stats = DocumentStats(document_id=document_id, **stats)
+        elif text_format == "markdown":
+            async with admission.admit(used_provider, congestion_errors=(DeadlineExceeded,)) as slot:
+                final_text, stats = await run_in_context(
+                    http_request,
+                    context,
+                    core.process_markdown,
+                    slot=slot,
+                    text=text,
+                    mode=mode,
+                    case_style=case_style,
+                    target_language=target_language,
+                    user_keys=user_keys,
+                    context=context,
+                    force_translation=force_translation,
+                )
+            markdown_stats = MarkdownStats(**stats)
+            add_log_fields(http_request, markdown_blocks=stats["prose_blocks"], markdown_sent_chars=stats["sent_chars"])
+        else:
+            if mode == "translate":
+                detection = core.detect_source_language(text, target_language)
+                if detection:
+                    detected_language = LanguageDetection(
+                        language=detection["language"],
+                        confidence=detection["confidence"],
+                        translation_skipped=detection["matches_target"] and not force_translation,
+                    )
+                    add_log_fields(http_request, translation_skipped=detected_language.translation_skipped)
+            use_memory = (
+                mode == "translate"
+                and core.translation_memory is not None
+                and not (detected_language and detected_language.translation_skipped)
+            )
+            if use_memory:
+                async with admission.admit(used_provider, congestion_errors=(DeadlineExceeded,)) as slot:
+                    final_text, stats = await run_in_context(
+                        http_request,
+                        context,
+                        core.translate_with_memory,
+                        slot=slot,
+                        text=text,
+                        target_language=target_language,
+                        case_style=case_style,
+                        user_keys=user_keys,
+                        context=context,
+                        namespace=get_client_scope(http_request, user_keys),
+                    )
+                memory_stats = TranslationMemoryStats(**stats)
+                add_log_fields(http_request, tm_segments=stats["segments"], tm_hit_rate=stats["hit_rate"])
+            else:
+                async with admission.admit(used_provider, congestion_errors=(DeadlineExceeded,)) as slot:
+                    final_text = await run_in_context(
+                        http_request,
+                        context,
+                        core.process_text,
+                        slot=slot,
+                        text=text,
+                        mode=mode,
+                        case_style=case_style,
+                        target_language=target_language,
+                        user_keys=user_keys,
+                        context=context,
+                        force_translation=force_translation,
+                    )
+        add_log_fields(http_request, core_ms=round((time.perf_counter() - started) * 1000, 2), output_chars=len(final_text))
+        usage = record_usage(http_request, context, mode or "pipeline", used_provider, user_keys)
+        compression = None
+        if context.compression:
+            compression = CompressionStats(**context.compression)
+            add_log_fields(http_request, compressed_tokens=compression.original_tokens - compression.kept_tokens)
 
         return ProcessResponse(
             success=True,
             original_text=text,
             processed_text=final_text,
-            mode=mode,
+            mode=mode or "pipeline",
             case_style=case_style,
             target_language=target_language,
             provider=used_provider,
+            document=document_stats,
+            detected_language=detected_language,
+            pipeline=pipeline_steps,
+            translation_memory=memory_stats,
+            compression=compression,
+            markdown=markdown_stats,
+            usage=usage,
             timestamp=datetime.now().isoformat(),
         )
+    except HTTPException:
+        raise
+    except AdmissionRejected as e:
+        raise admission_rejected_error(http_request, e)
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail=str(e))
+    except RequestCancelled as e:
+        add_log_fields(http_request, cancelled=True)
+        raise HTTPException(status_code=499, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
-        traceback.print_exc()
-        logger.error(f"Unexpected error in _process_request: {str(e)}")
+        log_exception(logger, "Unexpected error in _process_request", e, request_id=getattr(http_request.state, "request_id", None))
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"An unexpected internal error occurred: {str(e)}",
@@ -360,50 +1284,390 @@ async def _process_request(
 @limiter.limit("30/minute")
 async def process_text(request: Request, process_request: ProcessRequest):
     """Main endpoint to process text in any supported mode."""
-    return await _process_request(
+    return await run_idempotent(request, process_request, lambda: _process_request(
         text=process_request.text,
         mode=process_request.mode,
         case_style=process_request.case_style,
         http_request=request,
         target_language=process_request.target_language,
-    )
+        document_id=process_request.document_id,
+        force_translation=process_request.force_translation,
+        pipeline=process_request.pipeline,
+        fuse=process_request.fuse,
+        text_format=process_request.text_format,
+    ))
 
 
 @app.post("/grammar", response_model=ProcessResponse, summary="Fix Grammar")
 @limiter.limit("30/minute")
 async def fix_grammar(request: Request, grammar_request: SimpleProcessRequest):
     """Dedicated endpoint for grammar correction."""
-    return await _process_request(
+    return await run_idempotent(request, grammar_request, lambda: _process_request(
         text=grammar_request.text,
         mode="grammar",
         case_style=grammar_request.case_style,
         http_request=request,
+        document_id=grammar_request.document_id,
+        text_format=grammar_request.text_format,
+    ))
+
+
+async def _process_translate_many(
+    text: str,
+    target_languages: List[str],
+    case_style: str,
+    strategy: str,
+    http_request: Request,
+    force_translation: bool = False,
+) -> MultiTranslateResponse:
+    """Helper function to translate one text into several languages."""
+    user_keys = extract_user_keys(http_request)
+    used_provider = user_keys.get("provider") if user_keys else get_current_provider()
+    add_log_fields(
+        http_request,
+        mode="translate",
+        case_style=case_style,
+        provider=used_provider,
+        text_chars=len(text),
+        target_languages=len(target_languages),
+        strategy=strategy,
+    )
+
+    context = RequestContext(timeout=get_request_timeout(http_request))
+    try:
+        async with admission.admit(used_provider, congestion_errors=(DeadlineExceeded,)) as slot:
+            results, errors = await run_in_context(
+                http_request,
+                context,
+                core.translate_many,
+                slot=slot,
+                text=text,
+                target_languages=target_languages,
+                case_style=case_style,
+                user_keys=user_keys,
+                strategy=strategy,
+                context=context,
+                force_translation=force_translation,
+            )
+    except AdmissionRejected as e:
+        raise admission_rejected_error(http_request, e)
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail=str(e))
+    except RequestCancelled as e:
+        add_log_fields(http_request, cancelled=True)
+        raise HTTPException(status_code=499, detail=str(e))
+
+    translations = {language: TranslationResult(success=True, processed_text=translated) for language, translated in results.items()}
+    translations.update({language: TranslationResult(success=False, error=error) for language, error in errors.items()})
+
+    return MultiTranslateResponse(
+        success=not errors,
+        original_text=text,
+        translations=translations,
+        case_style=case_style,
+        strategy=strategy,
+        provider=used_provider,
+        usage=record_usage(http_request, context, "translate", used_provider, user_keys),
+        timestamp=datetime.now().isoformat(),
     )
 
 
-@app.post("/translate", response_model=ProcessResponse, summary="Translate Text")
+@app.post("/translate", response_model=Union[ProcessResponse, MultiTranslateResponse], summary="Translate Text")
 @limiter.limit("30/minute")
 async def translate_text(request: Request, translate_request: TranslateRequest):
-    """Dedicated endpoint for translation."""
-    return await _process_request(
+    """
+    Dedicated endpoint for translation. Pass `target_languages` instead of
+    `target_language` to translate into several languages in one request.
+    """
+    if translate_request.target_languages:
+        return await run_idempotent(request, translate_request, lambda: _process_translate_many(
+            text=translate_request.text,
+            target_languages=translate_request.target_languages,
+            case_style=translate_request.case_style,
+            strategy=translate_request.strategy,
+            http_request=request,
+            force_translation=translate_request.force_translation,
+        ))
+    return await run_idempotent(request, translate_request, lambda: _process_request(
         text=translate_request.text,
         mode="translate",
         case_style=translate_request.case_style,
         http_request=request,
         target_language=translate_request.target_language,
-    )
+        document_id=translate_request.document_id,
+        force_translation=translate_request.force_translation,
+        text_format=translate_request.text_format,
+    ))
 
 
 @app.post("/summarize", response_model=ProcessResponse, summary="Summarize Text")
 @limiter.limit("30/minute")
 async def summarize_text(request: Request, summarize_request: SimpleProcessRequest):
     """Dedicated endpoint for text summarization."""
-    return await _process_request(
+    return await run_idempotent(request, summarize_request, lambda: _process_request(
         text=summarize_request.text,
         mode="summarize",
         case_style=summarize_request.case_style,
         http_request=request,
-    )
+        document_id=summarize_request.document_id,
+        text_format=summarize_request.text_format,
+    ))
+
+
+# --- WebSocket Sessions ---
+
+# WebSocket close codes (4000-4999 are reserved for applications)
+WS_CLOSE_UNAUTHORIZED = 4401
+WS_CLOSE_FORBIDDEN_ORIGIN = 4403
+WS_CLOSE_MESSAGE_TOO_BIG = 1009
+
+# Per-IP limit for WebSocket requests served with the server's own provider
+# keys, matching the processing routes (slowapi does not see socket messages).
+WS_SERVER_KEY_LIMIT = "30/minute"
+
+
+def websocket_rate_limited(websocket: WebSocket) -> Optional[int]:
+    """Counts one server-key request from this client; returns Retry-After seconds if over the limit."""
+    if not limiter.enabled:
+        return None
+    item = parse_rate_limit(WS_SERVER_KEY_LIMIT)
+    address = get_remote_address(websocket)
+    if limiter.limiter.hit(item, "ws", address):
+        return None
+    reset_at, _ = limiter.limiter.get_window_stats(item, "ws", address)
+    return max(1, math.ceil(reset_at - time.time()))
+
+
+class WebSocketAuth(BaseModel):
+    type: str = Field(..., pattern="^auth$")
+    provider: Optional[str] = Field(None, pattern="^(openai|groq|google|anthropic)$")
+    api_key: Optional[str] = Field(None, min_length=1)
+    model: Optional[str] = Field(None, min_length=1)
+
+
+class WebSocketProcess(ProcessRequest):
+    type: str = Field(..., pattern="^process$")
+    id: str = Field(..., min_length=1, max_length=128, description="Client-chosen correlation id")
+    stream: bool = Field(True, description="Send partial output as it is generated")
+
+
+class WritonSession:
+    """
+    One client's WebSocket session: the provider resolved at authentication
+    and the in-flight requests by correlation id. All sends go through one
+    lock so messages from concurrent requests never interleave.
+    """
+
+    def __init__(self, websocket: WebSocket, provider, provider_name: str, usage_key: str = "server"):
+        self.websocket = websocket
+        self.provider = provider
+        self.provider_name = provider_name
+        self.usage_key = usage_key
+        self.tasks = {}
+        self.contexts = {}
+        self._send_lock = asyncio.Lock()
+
+    async def send(self, message: dict) -> None:
+        async with self._send_lock:
+            await self.websocket.send_json(message)
+
+    def start(self, request: WebSocketProcess) -> None:
+        """Starts a request, superseding any in-flight one with the same id."""
+        self.cancel(request.id, superseded=True)
+        context = RequestContext(timeout=get_settings().request_timeout_seconds)
+        task = asyncio.ensure_future(self._run(request, context))
+        self.tasks[request.id] = task
+        self.contexts[request.id] = context
+        task.add_done_callback(lambda done, request_id=request.id: self._finished(request_id, done))
+
+    def cancel(self, request_id: str, superseded: bool = False) -> bool:
+        task = self.tasks.get(request_id)
+        if task is None:
+            return False
+        # Stop the upstream stream at its next chunk, then drop the waiting task.
+        self.contexts[request_id].cancel()
+        task.cancel()
+        self._finished(request_id, task)
+        asyncio.ensure_future(self._send_quietly({"type": "cancelled", "id": request_id, "superseded": superseded}))
+        return True
+
+    def cancel_all(self) -> None:
+        for request_id in list(self.tasks):
+            self.contexts[request_id].cancel()
+            self.tasks[request_id].cancel()
+        self.tasks.clear()
+        self.contexts.clear()
+
+    def _finished(self, request_id: str, task) -> None:
+        if self.tasks.get(request_id) is task:
+            del self.tasks[request_id]
+            del self.contexts[request_id]
+
+    async def _send_quietly(self, message: dict) -> None:
+        try:
+            await self.send(message)
+        except Exception:
+            pass
+
+    async def _run(self, request: WebSocketProcess, context: RequestContext) -> None:
+        """Runs the blocking stream in the threadpool, relaying its events as they arrive."""
+        loop = asyncio.get_running_loop()
+        events = asyncio.Queue()
+        started = time.perf_counter()
+
+        def produce():
+            try:
+                for event in core.stream_text(
+                    text=request.text,
+                    mode=request.mode,
+                    case_style=request.case_style,
+                    target_language=request.target_language,
+                    context=context,
+                    force_translation=request.force_translation,
+                    provider=self.provider,
+                ):
+                    loop.call_soon_threadsafe(events.put_nowait, event)
+            except Exception as e:
+                loop.call_soon_threadsafe(events.put_nowait, {"error": e})
+            finally:
+                loop.call_soon_threadsafe(events.put_nowait, None)
+
+        try:
+            if request.mode == "translate" and not request.target_language:
+                raise ValueError("target_language is required when mode is 'translate'")
+            if request.document_id or request.pipeline or request.text_format == "markdown":
+                raise ValueError("document_id, pipeline and text_format 'markdown' are not supported over WebSocket")
+            async with admission.admit(self.provider_name, congestion_errors=(DeadlineExceeded, asyncio.TimeoutError)) as slot:
+                producer = asyncio.ensure_future(run_in_threadpool(produce))
+                # The stream ends on its own once the context is cancelled; keep asyncio quiet about it.
+                producer.add_done_callback(lambda t: t.cancelled() or t.exception())
+                slot.hold_until(producer)
+                while True:
+                    event = await asyncio.wait_for(events.get(), timeout=context.remaining())
+                    if event is None:
+                        break
+                    if "error" in event:
+                        raise event["error"]
+                    if "delta" in event:
+                        if request.stream:
+                            await self.send({"type": "delta", "id": request.id, "text": event["delta"]})
+                        continue
+                    usage = summarize_usage(context.usage)
+                    if usage:
+                        usage_tracker.record(self.provider_name, request.mode, self.usage_key, usage)
+                    await self.send({
+                        "type": "result",
+                        "id": request.id,
+                        "processed_text": event["text"],
+                        "mode": request.mode,
+                        "case_style": request.case_style,
+                        "target_language": request.target_language,
+                        "provider": self.provider_name,
+                        "compression": context.compression,
+                        "usage": usage,
+                        "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+                    })
+        except asyncio.CancelledError:
+            context.cancel()
+            raise
+        except AdmissionRejected as e:
+            await self._send_quietly({"type": "error", "id": request.id, "status": 503, "message": str(e), "retry_after": e.retry_after})
+        except (asyncio.TimeoutError, DeadlineExceeded):
+            context.cancel()
+            await self._send_quietly({"type": "error", "id": request.id, "status": 504, "message": "Request deadline exceeded."})
+        except RequestCancelled as e:
+            await self._send_quietly({"type": "error", "id": request.id, "status": 499, "message": str(e)})
+        except ValueError as e:
+            await self._send_quietly({"type": "error", "id": request.id, "status": 400, "message": str(e)})
+        except Exception as e:
+            log_exception(logger, "Unexpected error in WebSocket request", e, request_id=request.id)
+            await self._send_quietly({"type": "error", "id": request.id, "status": 500, "message": "An unexpected internal error occurred."})
+
+
+def websocket_origin_allowed(websocket: WebSocket) -> bool:
+    """Browsers always send Origin on WebSocket handshakes; CORS does not cover them."""
+    origin = websocket.headers.get("origin")
+    return origin is None or origin in allowed_origins
+
+
+@app.websocket("/ws")
+async def websocket_session(websocket: WebSocket):
+    """
+    Persistent editing session. The first message authenticates:
+    `{"type": "auth", "provider": ..., "api_key": ..., "model": ...}` (all
+    optional, falling back to server configuration); credentials are resolved
+    once for the session. Then any number of
+    `{"type": "process", "id": ..., "text": ..., "mode": ...}` requests may
+    be in flight, each answered with `delta` events and a final `result` (or
+    `error`) carrying the same id. Reusing an id cancels the earlier request;
+    `{"type": "cancel", "id": ...}` cancels explicitly. Sessions using the
+    server's own keys are held to the processing routes' per-IP rate limit.
+    """
+    if not websocket_origin_allowed(websocket):
+        await websocket.close(code=WS_CLOSE_FORBIDDEN_ORIGIN)
+        return
+    await websocket.accept()
+
+    settings = get_settings()
+    max_message_bytes = settings.max_request_size_mb * 1024 * 1024
+    max_inflight = settings.ws_max_inflight
+
+    try:
+        auth = WebSocketAuth.model_validate(
+            await asyncio.wait_for(websocket.receive_json(), timeout=settings.ws_auth_timeout_seconds)
+        )
+        user_keys = None
+        if auth.provider:
+            user_keys = {"provider": auth.provider}
+            if auth.api_key:
+                user_keys[f"{auth.provider}_key"] = auth.api_key
+            if auth.model:
+                user_keys[f"{auth.provider}_model"] = auth.model
+        provider = core.create_provider(user_keys)
+    except (asyncio.TimeoutError, ValidationError, ValueError, ConfigurationError) as e:
+        message = str(e) if isinstance(e, ConfigurationError) else "First message must be a valid auth message."
+        await websocket.send_json({"type": "error", "status": 401, "message": message})
+        await websocket.close(code=WS_CLOSE_UNAUTHORIZED)
+        return
+    except WebSocketDisconnect:
+        return
+
+    provider_name = auth.provider or get_current_provider()
+    session = WritonSession(websocket, provider, provider_name, usage_key(websocket, user_keys))
+    await session.send({"type": "ready", "provider": provider_name})
+
+    try:
+        while True:
+            raw = await websocket.receive_text()
+            if len(raw) > max_message_bytes:
+                await websocket.close(code=WS_CLOSE_MESSAGE_TOO_BIG)
+                break
+            message = None
+            try:
+                message = json.loads(raw)
+                message_type = message.get("type") if isinstance(message, dict) else None
+                if message_type == "cancel":
+                    request_id = str(message.get("id", ""))
+                    if not session.cancel(request_id):
+                        await session.send({"type": "error", "id": request_id, "status": 404, "message": "No such request in flight."})
+                    continue
+                request = WebSocketProcess.model_validate(message)
+            except (ValueError, ValidationError) as e:
+                detail = e.errors(include_url=False, include_input=False) if isinstance(e, ValidationError) else str(e)
+                await session.send({"type": "error", "id": message.get("id") if isinstance(message, dict) else None, "status": 422, "message": "Invalid message.", "detail": jsonable_encoder(detail)})
+                continue
+            if request.id not in session.tasks and len(session.tasks) >= max_inflight:
+                await session.send({"type": "error", "id": request.id, "status": 429, "message": f"At most {max_inflight} requests may be in flight per session."})
+                continue
+            retry_after = websocket_rate_limited(websocket) if session.usage_key == "server" else None
+            if retry_after is not None:
+                await session.send({"type": "error", "id": request.id, "status": 429, "message": f"Rate limit exceeded: {WS_SERVER_KEY_LIMIT}", "retry_after": retry_after})
+                continue
+            session.start(request)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        session.cancel_all()
 
 
 # --- Custom Exception Handlers ---
@@ -415,14 +1679,14 @@ async def http_exception_handler(request: Request, exc: HTTPException):
     return JSONResponse(
         status_code=exc.status_code,
         content=create_error_response("http_error", exc.detail).model_dump(),
+        headers=exc.headers,
     )
 
 
 @app.exception_handler(Exception)
 async def general_exception_handler(request: Request, exc: Exception):
     """Catches any unhandled exceptions and returns a generic 500 error."""
-    logger.error(f"Unhandled exception for request {request.url.path}: {str(exc)}")
-    traceback.print_exc()  # Log the full traceback for debugging
+    log_exception(logger, "Unhandled exception", exc, path=request.url.path, request_id=getattr(request.state, "request_id", None))
     return JSONResponse(
         status_code=500,
         content=create_error_response(
@@ -558,7 +1822,7 @@ if __name__ == "__main__":
             "API_PROVIDER not set in .env. Server-side processing will fail without BYOK headers."
         )
     else:
-        logger.info(f"🚀 Starting API with default provider: {provider}")
+        logger.info("🚀 Starting API", extra={"provider": provider})
 
-    # Run the Uvicorn server
+    # Run the Uvicorn development server (use `writon-serve` in production)
     uvicorn.run("api:app", host="0.0.0.0", port=8000, reload=True, log_level="info")
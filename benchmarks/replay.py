@@ -0,0 +1,129 @@
+"""
+Replays captured traffic against a Writon instance.
+
+Reads capture files written with CAPTURE_ENABLED=true (see core/capture.py),
+re-issues every request with its original inter-arrival time divided by
+`--speed`, and reports latency percentiles overall and per mode. Texts that
+were captured by length only are replaced by filler prose of the same length.
+
+Usage:
+    python benchmarks/replay.py output/capture/traffic.*.ndjson* \
+        [--target http://localhost:8000] [--speed 2] [--limit 1000] \
+        [--header "X-Provider: groq" --header "X-Groq-Key: ..."] [--json]
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+
+from core.capture import latency_report, load_capture, replay_payload
+
+
+def parse_headers(values: list) -> dict:
+    headers = {}
+    for value in values or []:
+        name, sep, content = value.partition(":")
+        if not sep:
+            raise SystemExit(f"Invalid header {value!r}; expected 'Name: value'")
+        headers[name.strip()] = content.strip()
+    return headers
+
+
+def replay(records: list, target: str, speed: float, headers: dict, workers: int, timeout: float) -> tuple:
+    """
+    Sends `records` on their original schedule (scaled by `speed`) and
+    returns `(results, lag_ms)`, where lag is how far the send loop fell
+    behind the schedule at its worst.
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    results = []
+    lock = threading.Lock()
+
+    def send(record):
+        started = time.perf_counter()
+        try:
+            status = session.post(target.rstrip("/") + record["path"], json=replay_payload(record),
+                                   headers=headers, timeout=timeout).status_code
+        except requests.RequestException:
+            status = None
+        result = {
+            "mode": record.get("mode"),
+            "status": status,
+            "latency_ms": round((time.perf_counter() - started) * 1000, 2),
+            "captured_ms": record.get("duration_ms"),
+        }
+        with lock:
+            results.append(result)
+
+    max_lag = 0.0
+    first_ts = records[0]["ts"]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for record in records:
+            due = (record["ts"] - first_ts) / speed
+            delay = due - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                max_lag = max(max_lag, -delay)
+            executor.submit(send, record)
+    return results, round(max_lag * 1000, 2)
+
+
+def print_report(report: dict, records: list, elapsed: float, lag_ms: float, speed: float) -> None:
+    span = records[-1]["ts"] - records[0]["ts"]
+    print(f"Replayed {len(records)} request(s) captured over {span:.1f}s at {speed:g}x in {elapsed:.1f}s "
+          f"({len(records) / elapsed:.1f} req/s; schedule lag at worst {lag_ms:.0f} ms)\n")
+    print(f"{'mode':<12} {'requests':>8} {'errors':>7} {'p50 ms':>9} {'p90 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+
+    def row(name, stats):
+        cells = [stats[key] for key in ("p50_ms", "p90_ms", "p95_ms", "p99_ms", "max_ms")]
+        print(f"{name:<12} {stats['requests']:>8} {stats['errors']:>7} " + " ".join(f"{cell or 0:>9.0f}" for cell in cells))
+
+    for mode, stats in report["modes"].items():
+        row(mode, stats)
+    row("all", report["overall"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("files", nargs="+", help="Capture files (NDJSON, including rotated ones)")
+    parser.add_argument("--target", default="http://localhost:8000", help="Base URL of the Writon instance")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed: 2 sends the traffic twice as fast")
+    parser.add_argument("--limit", type=int, help="Replay only the first N requests")
+    parser.add_argument("--header", action="append", help="Extra request header, e.g. 'X-Provider: groq' (repeatable)")
+    parser.add_argument("--workers", type=int, default=64, help="Maximum concurrent requests")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout in seconds")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args(argv)
+
+    if args.speed <= 0:
+        parser.error("--speed must be positive")
+    records = load_capture(args.files)[:args.limit]
+    if not records:
+        parser.error("no capture records found")
+
+    started = time.perf_counter()
+    results, lag_ms = replay(records, args.target, args.speed, parse_headers(args.header), args.workers, args.timeout)
+    elapsed = time.perf_counter() - started
+
+    report = latency_report(results)
+    if args.json:
+        print(json.dumps({**report, "elapsed_s": round(elapsed, 2), "schedule_lag_ms": lag_ms}, indent=2))
+    else:
+        print_report(report, records, elapsed, lag_ms, args.speed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Benchmarks response encoding for the processing routes.
+
+Compares encode time and body size of a ProcessResponse for FastAPI's
+default path (jsonable_encoder + json.dumps), pydantic's own JSON encoder,
+orjson, the compact form, and MessagePack when it is installed.
+
+Usage:
+    python benchmarks/response_encoding.py [--chars 10000] [--number 2000]
+"""
+
+import argparse
+import json
+import os
+import sys
+import timeit
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder
+
+from api import ProcessResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def build_response(chars: int) -> ProcessResponse:
+    text = ("The quick brown fox jumps over the lazy dog. " * (chars // 45 + 1))[:chars]
+    return ProcessResponse(
+        success=True,
+        original_text=text.lower(),
+        processed_text=text,
+        mode="grammar",
+        case_style="sentence",
+        provider="groq",
+        timestamp=datetime.now().isoformat(),
+    )
+
+
+def encoders(response: ProcessResponse) -> dict:
+    compact = {"exclude": ProcessResponse.COMPACT_EXCLUDE, "exclude_none": True}
+    cases = {
+        "default (jsonable_encoder + json)": lambda: json.dumps(jsonable_encoder(response)).encode("utf-8"),
+        "pydantic model_dump_json": lambda: response.model_dump_json().encode("utf-8"),
+        "compact model_dump_json": lambda: response.model_dump_json(**compact).encode("utf-8"),
+    }
+    if orjson is not None:
+        cases["orjson(model_dump)"] = lambda: orjson.dumps(response.model_dump(mode="json"))
+    if msgpack is not None:
+        cases["msgpack"] = lambda: msgpack.packb(response.model_dump(mode="json"))
+        cases["compact msgpack"] = lambda: msgpack.packb(response.model_dump(mode="json", **compact))
+    return cases
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--chars", type=int, default=10000, help="Length of the processed text")
+    parser.add_argument("--number", type=int, default=2000, help="Encodes per measurement")
+    args = parser.parse_args(argv)
+
+    response = build_response(args.chars)
+    print(f"ProcessResponse with {args.chars} characters of text, {args.number} encodes per run\n")
+    print(f"{'encoder':<36} {'µs/encode':>10} {'bytes':>8}")
+    for name, encode in encoders(response).items():
+        seconds = min(timeit.repeat(encode, number=args.number, repeat=3))
+        print(f"{name:<36} {seconds / args.number * 1e6:>10.1f} {len(encode()):>8}")
+    if msgpack is None:
+        print("\n(msgpack is not installed; install it to include MessagePack results)")
+
+
+if __name__ == "__main__":
+    main()
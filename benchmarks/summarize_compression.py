@@ -0,0 +1,129 @@
+"""
+Benchmarks extractive pre-compression of summarize inputs.
+
+Offline (default), reports for each input size how long compression takes,
+how many estimated tokens it removes, and how many of the input's key terms
+(its top TF-IDF terms) survive. With `--live`, it also summarizes the text
+through the configured provider with and without compression and compares
+upstream latency, input tokens and the ROUGE-1 F1 overlap of the two
+summaries, taking the uncompressed summary as the reference.
+
+Usage:
+    python benchmarks/summarize_compression.py [--file article.txt] [--budget 1500]
+        [--sizes 4000,16000,64000] [--live]
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.compression import _tfidf_vectors, compress_text
+from core.context import RequestContext
+from core.usage import summarize_usage
+from core.writon import WritonCore
+
+_TOPICS = [
+    "The city council approved a larger budget for public transport, adding bus lines and longer tram hours.",
+    "Ridership fell during the pandemic but has recovered to about ninety percent of earlier levels.",
+    "Critics argue the plan ignores cyclists, who asked for protected lanes on the main avenues.",
+    "The transport authority expects the new lines to cut average commute times by eight minutes.",
+    "Funding comes partly from a congestion charge that starts next spring in the city centre.",
+]
+_FILLER = [
+    "As mentioned before, the meeting ran late.",
+    "Several people attended, and coffee was served.",
+    "The weather that evening was mild.",
+    "Some residents repeated points that had already been made.",
+]
+
+
+def build_text(chars: int) -> str:
+    """Builds a redundant article: topic sentences reworded and mixed with filler."""
+    sentences, i = [], 0
+    while sum(len(s) + 1 for s in sentences) < chars:
+        topic = _TOPICS[i % len(_TOPICS)]
+        sentences.append(topic if i < len(_TOPICS) else f"Again, {topic[0].lower()}{topic[1:]}")
+        sentences.append(_FILLER[i % len(_FILLER)])
+        i += 1
+    return " ".join(sentences)[:chars].rsplit(".", 1)[0] + "."
+
+
+def key_terms(text: str, count: int = 20) -> set:
+    """The `count` terms with the highest total TF-IDF weight across the text's sentences."""
+    sentences = [s for s in re.split(r"(?<=[.!?])\s+", text) if s]
+    totals = Counter()
+    for vector in _tfidf_vectors(sentences):
+        totals.update(vector)
+    return {term for term, _ in totals.most_common(count)}
+
+
+def rouge1_f1(candidate: str, reference: str) -> float:
+    tokenize = lambda text: Counter(re.findall(r"\w+", text.lower()))
+    cand, ref = tokenize(candidate), tokenize(reference)
+    overlap = sum((cand & ref).values())
+    if not overlap:
+        return 0.0
+    precision, recall = overlap / sum(cand.values()), overlap / sum(ref.values())
+    return 2 * precision * recall / (precision + recall)
+
+
+def run_offline(texts: dict, budget: int) -> None:
+    print(f"{'input':<14} {'tokens':>8} {'kept':>8} {'removed':>8} {'ms':>8} {'key terms kept':>15}")
+    for name, text in texts.items():
+        started = time.perf_counter()
+        compressed, stats = compress_text(text, budget, WritonCore.estimate_tokens)
+        elapsed = (time.perf_counter() - started) * 1000
+        terms = key_terms(text)
+        kept_terms = sum(1 for term in terms if term in compressed.lower())
+        tokens = WritonCore.estimate_tokens(text)
+        kept = stats["kept_tokens"] if stats else tokens
+        print(f"{name:<14} {tokens:>8} {kept:>8} {1 - kept / tokens:>8.0%} {elapsed:>8.1f} {kept_terms:>8}/{len(terms)}")
+
+
+def summarize(core: WritonCore, text: str, compress: bool) -> tuple:
+    os.environ["SUMMARIZE_COMPRESSION"] = "true" if compress else "false"
+    context = RequestContext()
+    started = time.perf_counter()
+    summary = core.process_text(text=text, mode="summarize", case_style="sentence", context=context)
+    return summary, (time.perf_counter() - started) * 1000, summarize_usage(context.usage) or {}
+
+
+def run_live(texts: dict, budget: int) -> None:
+    core = WritonCore()
+    os.environ["SUMMARIZE_COMPRESSION_MAX_TOKENS"] = str(budget)
+    print(f"\n{'input':<14} {'full ms':>9} {'compr. ms':>10} {'full in':>9} {'compr. in':>10} {'ROUGE-1 F1':>11}")
+    for name, text in texts.items():
+        reference, full_ms, full_usage = summarize(core, text, compress=False)
+        candidate, compressed_ms, compressed_usage = summarize(core, text, compress=True)
+        print(f"{name:<14} {full_ms:>9.0f} {compressed_ms:>10.0f} {full_usage.get('input_tokens') or 0:>9} "
+              f"{compressed_usage.get('input_tokens') or 0:>10} {rouge1_f1(candidate, reference):>11.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--file", help="Summarize this text file instead of generated articles")
+    parser.add_argument("--sizes", default="4000,16000,64000", help="Generated article sizes in characters")
+    parser.add_argument("--budget", type=int, default=int(os.getenv("SUMMARIZE_COMPRESSION_MAX_TOKENS", "1500")),
+                        help="Token budget for the compressed input")
+    parser.add_argument("--live", action="store_true", help="Also call the configured provider with and without compression")
+    args = parser.parse_args(argv)
+
+    if args.file:
+        with open(args.file, encoding="utf-8") as f:
+            texts = {os.path.basename(args.file)[:14]: f.read()}
+    else:
+        texts = {f"{int(size) // 1000}k chars": build_text(int(size)) for size in args.sizes.split(",")}
+
+    print(f"Token budget {args.budget} (about four characters per token)\n")
+    run_offline(texts, args.budget)
+    if args.live:
+        run_live(texts, args.budget)
+
+
+if __name__ == "__main__":
+    main()
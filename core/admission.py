@@ -0,0 +1,223 @@
+"""
+Admission control for upstream-bound work.
+
+Each worker admits at most a fixed number of provider calls at once, both in
+total and per provider. A request over the limit waits in a short bounded
+queue; if the queue is full, or the wait exceeds its timeout, the request is
+shed immediately (the API answers 503 with Retry-After) instead of piling up
+behind a slow provider until everything times out together.
+
+Limits can optionally adapt (AIMD): each completion under the target
+latency raises a pool's limit by 1/limit (about one per round of calls), and
+a slow, timed-out or failed call cuts it multiplicatively.
+"""
+
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from core.writon import AdmissionRejected
+
+
+class AdmissionPool:
+    """In-flight limit and wait queue for one pool of calls."""
+
+    def __init__(self, name: str, limit: int, max_queue: int, adaptive: bool = False,
+                 min_limit: int = 1, target_latency: float = 10.0, decrease_factor: float = 0.7):
+        self.name = name
+        self.max_limit = limit
+        self.limit = float(limit)
+        self.max_queue = max_queue
+        self.adaptive = adaptive
+        self.min_limit = min_limit
+        self.target_latency = target_latency
+        self.decrease_factor = decrease_factor
+        self.inflight = 0
+        self.waiters = deque()
+        self.latency_ewma = None
+        self.admitted_total = 0
+        self.shed_total = {"queue_full": 0, "queue_timeout": 0}
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        """
+        Takes a slot if one is free. Otherwise returns a future to wait on
+        (resolved when a slot is handed over), or None if the queue is full.
+        """
+        with self._lock:
+            if self.inflight < int(self.limit) and not self.waiters:
+                self.inflight += 1
+                self.admitted_total += 1
+                return True
+            if len(self.waiters) >= self.max_queue:
+                self.shed_total["queue_full"] += 1
+                return None
+            loop = asyncio.get_running_loop()
+            waiter = (loop, loop.create_future())
+            self.waiters.append(waiter)
+            return waiter[1]
+
+    def abandon(self, future) -> None:
+        """Gives up waiting; a slot already handed to `future` is passed on."""
+        with self._lock:
+            for waiter in self.waiters:
+                if waiter[1] is future:
+                    self.waiters.remove(waiter)
+                    self.shed_total["queue_timeout"] += 1
+                    return
+        # The slot was granted just as the wait gave up.
+        self.release(None, congested=False)
+
+    def release(self, latency: float = None, congested: bool = False) -> None:
+        """Frees a slot, updates the adaptive limit, and hands slots to waiters."""
+        with self._lock:
+            self.inflight -= 1
+            if latency is not None:
+                self.latency_ewma = latency if self.latency_ewma is None else 0.8 * self.latency_ewma + 0.2 * latency
+                if self.adaptive:
+                    if congested or latency > self.target_latency:
+                        self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+                    else:
+                        self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            elif congested and self.adaptive:
+                self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+
+            while self.waiters and self.inflight < int(self.limit):
+                loop, future = self.waiters.popleft()
+                self.inflight += 1
+                self.admitted_total += 1
+                loop.call_soon_threadsafe(_grant, future)
+
+    def retry_after(self) -> int:
+        """Suggested Retry-After seconds: roughly one typical call's duration."""
+        return max(1, math.ceil(self.latency_ewma or 1))
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "limit": int(self.limit),
+                "inflight": self.inflight,
+                "queue_depth": len(self.waiters),
+                "admitted_total": self.admitted_total,
+                "shed_total": dict(self.shed_total),
+                "latency_ewma_seconds": round(self.latency_ewma, 3) if self.latency_ewma is not None else None,
+            }
+
+
+def _grant(future) -> None:
+    if not future.done():
+        future.set_result(True)
+
+
+class AdmissionSlot:
+    """
+    The slots held by one `admit` block. `hold_until(future)` keeps them
+    past the end of the block until `future` is done, so abandoned work that
+    is still running (a blocking call in a worker thread) stays counted.
+    """
+
+    def __init__(self):
+        self.pending = None
+
+    def hold_until(self, future) -> None:
+        self.pending = future
+
+
+class AdmissionController:
+    """
+    Admits upstream-bound work into a global pool and a per-provider pool.
+    A limit of 0 disables the corresponding pool. When `providers` is given,
+    any other provider name (e.g. from a client header) shares the single
+    `OTHER_PROVIDERS` pool, so the set of pools stays bounded.
+    """
+
+    OTHER_PROVIDERS = "other"
+
+    def __init__(self, max_inflight: int = 32, max_inflight_per_provider: int = 16, max_queue: int = 16,
+                 queue_timeout: float = 2.0, adaptive: bool = False, min_inflight: int = 2, target_latency: float = 10.0,
+                 providers: tuple = None):
+        self.providers = frozenset(providers) if providers is not None else None
+        self.queue_timeout = queue_timeout
+        self._pool_settings = dict(max_queue=max_queue, adaptive=adaptive, min_limit=min_inflight, target_latency=target_latency)
+        self.max_inflight_per_provider = max_inflight_per_provider
+        self.global_pool = AdmissionPool("global", max_inflight, **self._pool_settings) if max_inflight > 0 else None
+        self.provider_pools = {}
+        self._lock = threading.Lock()
+
+    def _provider_pool(self, provider: str):
+        if self.max_inflight_per_provider <= 0 or not provider:
+            return None
+        if self.providers is not None and provider not in self.providers:
+            provider = self.OTHER_PROVIDERS
+        with self._lock:
+            if provider not in self.provider_pools:
+                self.provider_pools[provider] = AdmissionPool(provider, self.max_inflight_per_provider, **self._pool_settings)
+            return self.provider_pools[provider]
+
+    async def _enter(self, pool: AdmissionPool) -> None:
+        waiter = pool.try_acquire()
+        if waiter is True:
+            return
+        if waiter is None:
+            raise AdmissionRejected(f"Too many requests in flight ({pool.name}); try again shortly.", pool.retry_after())
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            pool.abandon(waiter)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            raise AdmissionRejected(f"Timed out waiting for capacity ({pool.name}); try again shortly.", pool.retry_after())
+
+    @asynccontextmanager
+    async def admit(self, provider: str = None, congestion_errors: tuple = ()):
+        """
+        Holds a global and a provider slot for the duration of the block,
+        or longer if the yielded `AdmissionSlot` is told to wait for
+        unfinished work. Raises `AdmissionRejected` if either is unavailable.
+        Exceptions of the `congestion_errors` types (e.g. deadline exceeded)
+        count as congestion for the adaptive limits.
+        """
+        pools = [pool for pool in (self.global_pool, self._provider_pool(provider)) if pool is not None]
+        entered = []
+        try:
+            for pool in pools:
+                await self._enter(pool)
+                entered.append(pool)
+        except BaseException:
+            for pool in entered:
+                pool.release()
+            raise
+
+        started = time.monotonic()
+        congested = False
+        slot = AdmissionSlot()
+
+        def _release(*_):
+            latency = time.monotonic() - started
+            for pool in entered:
+                pool.release(latency, congested=congested)
+
+        try:
+            yield slot
+        except congestion_errors:
+            congested = True
+            raise
+        finally:
+            if slot.pending is not None and not slot.pending.done():
+                slot.pending.add_done_callback(_release)
+            else:
+                _release()
+
+    def snapshot(self) -> dict:
+        """Current limits, in-flight counts, queue depths and counters per pool."""
+        pools = {}
+        if self.global_pool is not None:
+            pools["global"] = self.global_pool.snapshot()
+        with self._lock:
+            provider_pools = dict(self.provider_pools)
+        for name, pool in provider_pools.items():
+            pools[f"provider:{name}"] = pool.snapshot()
+        return pools
@@ -0,0 +1,118 @@
+"""
+Micro-batching of short concurrent requests.
+
+Short texts arriving close together for the same provider, model, key, mode
+and parameters can share one upstream call: their texts are wrapped in
+numbered `<item>` tags, sent as a single prompt, and the tagged answer is
+split back into one result per request. If the answer cannot be split
+exactly, every request falls back to its own call.
+"""
+
+import re
+import threading
+
+BATCH_INSTRUCTIONS = (
+    "The input contains several independent texts, each wrapped in <item id=\"N\"> tags. "
+    "Process each text separately according to the instructions above. Return every result "
+    "wrapped in the same <item id=\"N\"> tags, one per input item, in the same order, "
+    "with nothing outside the tags."
+)
+
+_ITEM_PATTERN = re.compile(r"<item id=\"(\d+)\">(.*?)</item>", re.DOTALL)
+
+
+def format_batch(texts: list) -> str:
+    """Wraps each text in a numbered `<item>` tag."""
+    return "\n".join(f"<item id=\"{i}\">{text.strip()}</item>" for i, text in enumerate(texts, start=1))
+
+
+def split_batch(answer: str, count: int):
+    """
+    Splits a tagged answer into `count` results, or returns None unless every
+    id from 1 to `count` appears exactly once with non-empty content.
+    """
+    found = {}
+    for item_id, content in _ITEM_PATTERN.findall(answer):
+        index = int(item_id)
+        if index in found or not 1 <= index <= count or not content.strip():
+            return None
+        found[index] = content.strip()
+    if len(found) != count:
+        return None
+    return [found[i] for i in range(1, count + 1)]
+
+
+def can_batch(text: str, max_chars: int) -> bool:
+    """Whether a text is short enough and safe to embed in a tagged batch."""
+    return len(text) <= max_chars and "<item" not in text and "</item>" not in text
+
+
+class _Batch:
+    def __init__(self):
+        self.items = []
+        self.results = None
+        self.full = threading.Event()
+        self.done = threading.Event()
+
+
+class MicroBatcher:
+    """
+    Groups items submitted under the same key within `window_seconds`.
+
+    The first submitter of a batch waits for the window (or until the batch
+    holds `max_size` items), then runs `run_batch(items)` on behalf of all
+    of them. `submit` returns the item's result, or None when the caller
+    should make its own call instead: the batch had a single item, the batch
+    call failed or could not be split, or the caller's context expired or was
+    cancelled while waiting.
+    """
+
+    # How often waiting submitters check their own context for cancellation.
+    POLL_SECONDS = 0.05
+
+    def __init__(self, window_seconds: float, max_size: int = 8):
+        self.window_seconds = window_seconds
+        self.max_size = max_size
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key, item, run_batch, context=None):
+        with self._lock:
+            batch = self._pending.get(key)
+            leader = batch is None
+            if leader:
+                batch = self._pending[key] = _Batch()
+            index = len(batch.items)
+            batch.items.append(item)
+            if len(batch.items) >= self.max_size:
+                del self._pending[key]
+                batch.full.set()
+
+        if leader:
+            return self._lead(key, batch, run_batch)
+        return self._follow(batch, index, context)
+
+    def _lead(self, key, batch, run_batch):
+        batch.full.wait(self.window_seconds)
+        with self._lock:
+            if self._pending.get(key) is batch:
+                del self._pending[key]
+        # No more items can join once the batch is out of `_pending`.
+        try:
+            if len(batch.items) > 1:
+                results = run_batch(list(batch.items))
+                if results is not None and len(results) == len(batch.items):
+                    batch.results = results
+        finally:
+            batch.done.set()
+        return batch.results[0] if batch.results else None
+
+    def _follow(self, batch, index, context):
+        while not batch.done.wait(self.POLL_SECONDS):
+            if context is not None and (context.cancelled or context.expired):
+                return None
+        return batch.results[index] if batch.results else None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pending)
@@ -0,0 +1,102 @@
+"""
+Offline bulk jobs through provider batch APIs.
+
+Providers with an asynchronous batch API (OpenAI, Anthropic) process large
+jobs at a discount within a day. `run_batch_job` submits prompts in as few
+batches as the provider allows, polls each batch with a growing interval
+until it reaches a final state, and maps the results back to the prompts by
+their position. `run_direct` is the fallback for providers without a batch
+API: one concurrent call per prompt. Both return one entry per prompt,
+`{"text": str}` or `{"error": str}`, so a failed item never fails the job.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from core.writon import AIProviderError
+
+# Each poll waits this much longer than the previous one, up to the maximum.
+POLL_BACKOFF = 1.5
+
+# Consecutive failed status checks tolerated before the job gives up.
+MAX_POLL_ERRORS = 5
+
+
+def custom_id(index: int) -> str:
+    """The id that ties a batch request back to its prompt (valid for every provider)."""
+    return f"writon-{index}"
+
+
+def wait_for_batch(provider, batch_id: str, poll_seconds: float, max_poll_seconds: float, timeout_seconds: float,
+                   on_status=None, sleep=time.sleep, clock=time.monotonic) -> dict:
+    """
+    Polls a batch until it is done and returns its final state. The interval
+    starts at `poll_seconds` and grows by `POLL_BACKOFF` up to
+    `max_poll_seconds`. Raises AIProviderError if the batch is still running
+    after `timeout_seconds`, or if status checks keep failing.
+    """
+    deadline = clock() + timeout_seconds
+    delay = poll_seconds
+    errors = 0
+    while True:
+        try:
+            batch = provider.get_batch(batch_id)
+            errors = 0
+        except AIProviderError:
+            errors += 1
+            if errors >= MAX_POLL_ERRORS:
+                raise
+            batch = None
+        if batch is not None:
+            if on_status:
+                on_status(batch)
+            if batch["done"]:
+                return batch
+        if clock() + delay > deadline:
+            raise AIProviderError(f"Batch {batch_id} did not finish within {timeout_seconds:.0f}s")
+        sleep(delay)
+        delay = min(delay * POLL_BACKOFF, max_poll_seconds)
+
+
+def run_batch_job(provider, prompts: list, poll_seconds: float, max_poll_seconds: float, timeout_seconds: float,
+                  on_status=None, sleep=time.sleep, clock=time.monotonic) -> tuple:
+    """
+    Runs `prompts` (dicts with `user` and optional `system`) through the
+    provider's batch API. Every chunk of `MAX_BATCH_REQUESTS` is submitted
+    before any is awaited, so they run side by side. Returns the results in
+    prompt order and the final state of every batch.
+    """
+    size = provider.MAX_BATCH_REQUESTS or len(prompts)
+    batch_ids = []
+    for start in range(0, len(prompts), size):
+        requests = [
+            (custom_id(index), prompt["user"], prompt.get("system"))
+            for index, prompt in enumerate(prompts[start:start + size], start=start)
+        ]
+        batch_ids.append(provider.submit_batch(requests))
+
+    results, batches = {}, []
+    for batch_id in batch_ids:
+        batch = wait_for_batch(provider, batch_id, poll_seconds, max_poll_seconds, timeout_seconds,
+                               on_status=on_status, sleep=sleep, clock=clock)
+        batches.append(batch)
+        results.update(provider.batch_results(batch))
+    missing = {"error": "No result returned for this request"}
+    return [results.get(custom_id(index), missing) for index in range(len(prompts))], batches
+
+
+def run_direct(call, prompts: list, max_workers: int) -> list:
+    """
+    Sends every prompt with `call(prompt)` on up to `max_workers` threads.
+    Returns the results in prompt order; a failed call becomes an error entry.
+    """
+    def _run(prompt):
+        try:
+            return {"text": call(prompt)}
+        except Exception as e:
+            return {"error": str(e)}
+
+    if not prompts:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(prompts))) as executor:
+        return list(executor.map(_run, prompts))
@@ -0,0 +1,205 @@
+"""
+Traffic capture and replay helpers.
+
+With CAPTURE_ENABLED=true the API records the shape of every processing
+request (route, mode, case style, target language, text length, status and
+duration, but never keys) as one JSON object per line. The text itself is
+only kept in redacted form when CAPTURE_TEXT=redacted. Records are written by
+a background thread to a size-rotated file per worker process, so capturing
+never blocks a request on disk I/O.
+
+`benchmarks/replay.py` loads these files and re-issues the requests against
+any Writon instance with the original inter-arrival times; the loading,
+payload and reporting helpers it uses live here.
+"""
+
+import json
+import logging
+import logging.handlers
+import math
+import os
+import queue
+import random
+import re
+import threading
+
+from core.settings import DEFAULT_CAPTURE_PATH
+
+# Routes whose requests are captured, and the mode implied by each.
+CAPTURE_ROUTES = {"/process": None, "/grammar": "grammar", "/translate": "translate", "/summarize": "summarize"}
+
+_EMAIL = re.compile(r"[\w.+-]+@[\w-]+(\.[\w-]+)+")
+_URL = re.compile(r"https?://\S+|www\.\S+")
+_DIGIT = re.compile(r"\d")
+
+# Filler used to rebuild texts that were captured by length only.
+_FILLER = (
+    "The quarterly report shows steady growth across all regions, although "
+    "shipping delays affected two of our largest customers. We expect the new "
+    "warehouse to resolve most of these issues before the end of the year. "
+)
+
+
+def redact_text(text: str) -> str:
+    """Masks email addresses, URLs and digits, keeping the language and roughly the length of the text."""
+    text = _EMAIL.sub("<email>", text)
+    text = _URL.sub("<url>", text)
+    return _DIGIT.sub("0", text)
+
+
+def capture_record(path: str, payload, status: int, duration_ms: float, provider: str = None,
+                   started_at: float = None, keep_text: bool = False) -> dict:
+    """
+    Builds the capture record for one request from its parsed JSON body.
+    Only the fields that shape the workload are kept.
+    """
+    payload = payload if isinstance(payload, dict) else {}
+    text = payload.get("text") if isinstance(payload.get("text"), str) else None
+    languages = payload.get("target_languages")
+    record = {
+        "ts": started_at,
+        "path": path,
+        "status": status,
+        "duration_ms": duration_ms,
+        "mode": payload.get("mode") or CAPTURE_ROUTES.get(path),
+        "pipeline": payload.get("pipeline"),
+        "case_style": payload.get("case_style"),
+        "target_language": payload.get("target_language"),
+        "target_languages": languages if isinstance(languages, list) else None,
+        "provider": provider,
+        "text_chars": len(text) if text is not None else None,
+    }
+    if keep_text and text is not None:
+        record["text"] = redact_text(text)
+    return {key: value for key, value in record.items() if value is not None}
+
+
+class TrafficCapture:
+    """
+    Writes capture records to a size-rotated NDJSON file from a background
+    thread. Each process writes its own file (the pid is added to the name),
+    so pre-forked workers never rotate the same file.
+    """
+
+    def __init__(self, path: str = DEFAULT_CAPTURE_PATH, max_bytes: int = 50 * 1024 * 1024,
+                 backups: int = 5, sample_rate: float = 1.0, keep_text: bool = False):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.sample_rate = sample_rate
+        self.keep_text = keep_text
+        self._queue = None
+        self._listener = None
+        self._handler = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def file_path(self) -> str:
+        root, ext = os.path.splitext(self.path)
+        return f"{root}.{os.getpid()}{ext or '.ndjson'}"
+
+    def _start(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._queue = queue.SimpleQueue()
+        self._handler = logging.handlers.RotatingFileHandler(
+            self.file_path(), maxBytes=self.max_bytes, backupCount=self.backups, encoding="utf-8"
+        )
+        self._handler.setFormatter(logging.Formatter("%(message)s"))
+        self._listener = logging.handlers.QueueListener(self._queue, self._handler)
+        self._listener.start()
+        self._pid = os.getpid()
+
+    def sampled(self) -> bool:
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    def write(self, record: dict) -> None:
+        """Queues one record for writing; the file is opened on first use in each process."""
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._start()
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+        self._queue.put(logging.makeLogRecord({"msg": line}))
+
+    def close(self) -> None:
+        """Flushes pending records and closes the file."""
+        with self._lock:
+            if self._listener and self._pid == os.getpid():
+                self._listener.stop()
+                self._handler.close()
+            self._listener = self._handler = self._queue = self._pid = None
+
+
+# --- Replay ---
+
+
+def load_capture(paths: list) -> list:
+    """Reads capture files (including rotated ones) and returns their records ordered by time."""
+    records = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if "ts" in record and "path" in record:
+                    records.append(record)
+    records.sort(key=lambda record: record["ts"])
+    return records
+
+
+def synthetic_text(chars: int) -> str:
+    """Returns filler prose of exactly `chars` characters."""
+    chars = max(1, int(chars))
+    return (_FILLER * (chars // len(_FILLER) + 1))[:chars].rstrip().ljust(chars, ".")
+
+
+def replay_payload(record: dict) -> dict:
+    """Rebuilds a request body from a capture record, using filler text when only the length was kept."""
+    payload = {"text": record.get("text") or synthetic_text(record.get("text_chars") or 200)}
+    for field in ("mode", "pipeline", "case_style", "target_language", "target_languages"):
+        if field in record:
+            payload[field] = record[field]
+    if record["path"] != "/process":
+        payload.pop("mode", None)
+        payload.pop("pipeline", None)
+    elif "pipeline" in payload:
+        payload.pop("mode", None)
+    payload.setdefault("case_style", "sentence")
+    return payload
+
+
+def percentile(values: list, q: float):
+    """Nearest-rank percentile of `values` (q in 0-100), or None if empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = math.ceil(q / 100 * len(ordered))
+    return ordered[max(0, min(len(ordered), rank) - 1)]
+
+
+def latency_report(results: list) -> dict:
+    """
+    Summarizes replay results (dicts with `mode`, `status` and `latency_ms`)
+    overall and per mode: request and error counts and latency percentiles.
+    """
+    def summarize(group):
+        latencies = [result["latency_ms"] for result in group]
+        errors = sum(1 for result in group if not result["status"] or result["status"] >= 400)
+        return {
+            "requests": len(group),
+            "errors": errors,
+            **{f"p{q}_ms": percentile(latencies, q) for q in (50, 90, 95, 99)},
+            "max_ms": max(latencies) if latencies else None,
+        }
+
+    by_mode = {}
+    for result in results:
+        by_mode.setdefault(result.get("mode") or "pipeline", []).append(result)
+    return {"overall": summarize(results), "modes": {mode: summarize(group) for mode, group in sorted(by_mode.items())}}
@@ -0,0 +1,151 @@
+"""
+Local extractive pre-compression for summarize inputs.
+
+Long inputs are often mostly redundant, and sending all of them costs input
+tokens and latency. `compress_text` scores every sentence and keeps the best
+ones, in their original order, until a token budget is filled. No network
+is involved and no dependencies beyond the standard library.
+
+Sentences are scored with TextRank over TF-IDF cosine similarity. Above
+`MAX_TEXTRANK_SENTENCES` the quadratic similarity graph gets too slow in
+pure Python, so each sentence is instead scored by its similarity to the
+TF-IDF centroid of the whole text. The first sentence usually sets the topic
+and gets a small bonus.
+"""
+
+import math
+import re
+from collections import Counter
+
+MAX_TEXTRANK_SENTENCES = 120
+DAMPING = 0.85
+ITERATIONS = 30
+TOLERANCE = 1e-6
+LEAD_BONUS = 0.1
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+# Frequent English function words carry no topic; other languages rely on IDF.
+_STOPWORDS = frozenset("""
+a an and are as at be been but by can could did do does for from had has have he her his i if in into is it its
+more most no not of on or our she so than that the their them then there these they this those to was we were
+what when which who will with would you your
+""".split())
+
+
+def _terms(sentence: str) -> list:
+    return [word for word in _WORD.findall(sentence.lower()) if word not in _STOPWORDS and not word.isdigit()]
+
+
+def _tfidf_vectors(sentences: list) -> list:
+    counts = [Counter(_terms(sentence)) for sentence in sentences]
+    document_frequency = Counter(term for count in counts for term in count)
+    total = len(sentences)
+    vectors = []
+    for count in counts:
+        vector = {term: (1 + math.log(tf)) * math.log((1 + total) / (1 + document_frequency[term])) + 1e-9
+                  for term, tf in count.items()}
+        norm = math.sqrt(sum(weight * weight for weight in vector.values())) or 1.0
+        vectors.append({term: weight / norm for term, weight in vector.items()})
+    return vectors
+
+
+def _cosine(a: dict, b: dict) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(weight * b.get(term, 0.0) for term, weight in a.items())
+
+
+def _textrank(vectors: list) -> list:
+    n = len(vectors)
+    neighbours = [[] for _ in range(n)]
+    for i in range(n):
+        for j in range(i + 1, n):
+            weight = _cosine(vectors[i], vectors[j])
+            if weight > 0:
+                neighbours[i].append((j, weight))
+                neighbours[j].append((i, weight))
+    out_weight = [sum(weight for _, weight in links) or 1.0 for links in neighbours]
+    scores = [1.0 / n] * n
+    for _ in range(ITERATIONS):
+        updated = [
+            (1 - DAMPING) / n + DAMPING * sum(weight / out_weight[j] * scores[j] for j, weight in links)
+            for links in neighbours
+        ]
+        converged = max(abs(new - old) for new, old in zip(updated, scores)) < TOLERANCE
+        scores = updated
+        if converged:
+            break
+    return scores
+
+
+def _centroid_scores(vectors: list) -> list:
+    centroid = Counter()
+    for vector in vectors:
+        centroid.update(vector)
+    norm = math.sqrt(sum(weight * weight for weight in centroid.values())) or 1.0
+    centroid = {term: weight / norm for term, weight in centroid.items()}
+    return [_cosine(vector, centroid) for vector in vectors]
+
+
+def score_sentences(sentences: list) -> list:
+    """Returns one relevance score per sentence (higher is more central)."""
+    vectors = _tfidf_vectors(sentences)
+    scores = _textrank(vectors) if len(sentences) <= MAX_TEXTRANK_SENTENCES else _centroid_scores(vectors)
+    if scores:
+        scores[0] += LEAD_BONUS * max(scores)
+    return scores
+
+
+def _join(kept: list, segments: list, separators: list) -> str:
+    """Rejoins kept sentences, keeping a paragraph break if any skipped separator had one."""
+    parts = []
+    for position, index in enumerate(kept):
+        parts.append(segments[index])
+        if position + 1 < len(kept):
+            skipped = separators[index:kept[position + 1]]
+            parts.append(next((sep for sep in skipped if "\n" in sep), skipped[0] if skipped else " "))
+    return "".join(parts)
+
+
+def compress_text(text: str, max_tokens: int, estimate_tokens) -> tuple:
+    """
+    Trims `text` to about `max_tokens` (as counted by `estimate_tokens`) by
+    keeping its highest-scoring sentences in their original order. Returns
+    `(text, stats)`, where stats is None if the text already fits.
+    """
+    original_tokens = estimate_tokens(text)
+    if original_tokens <= max_tokens:
+        return text, None
+
+    # Shares the translation memory's sentence splitting; imported here so
+    # the API does not load the memory (and sqlite3) unless it is used.
+    from core.translation_memory import split_segments
+
+    segments, separators = split_segments(text)
+    candidates = [index for index, segment in enumerate(segments) if segment.strip()]
+    if len(candidates) < 2:
+        return text, None
+
+    scores = score_sentences([segments[index] for index in candidates])
+    ranked = sorted(zip(scores, candidates), key=lambda pair: (-pair[0], pair[1]))
+    kept, used = [], 0
+    for _, index in ranked:
+        cost = estimate_tokens(segments[index]) + 1
+        if used + cost <= max_tokens:
+            kept.append(index)
+            used += cost
+    if not kept:
+        # Not even the best sentence fits; keep it anyway rather than sending nothing.
+        kept = [ranked[0][1]]
+    kept.sort()
+
+    compressed = _join(kept, segments, separators)
+    kept_tokens = estimate_tokens(compressed)
+    return compressed, {
+        "original_tokens": original_tokens,
+        "kept_tokens": kept_tokens,
+        "sentences": len(candidates),
+        "kept_sentences": len(kept),
+        "removed_ratio": round(1 - kept_tokens / original_tokens, 3),
+    }
@@ -0,0 +1,63 @@
+"""
+Per-request context carried from the API through WritonCore to the providers.
+
+A `RequestContext` holds the request's deadline and a cancellation flag. The
+providers use the remaining budget as the timeout for each upstream attempt
+and to decide whether a retry still fits, and stop as soon as the request is
+cancelled (for example because the client disconnected). Providers also
+record the usage of each call on it (see `core.usage`), and WritonCore the
+extractive compression applied to a summarize input (see `core.compression`).
+"""
+
+import threading
+import time
+
+
+class RequestContext:
+    """Deadline and cancellation state for one request."""
+
+    def __init__(self, timeout: float = None):
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self._cancelled = threading.Event()
+        self.usage = []
+        self.compression = None
+        self._usage_lock = threading.Lock()
+
+    def remaining(self):
+        """Seconds left before the deadline, or None when there is no deadline."""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self) -> None:
+        """Marks the request as cancelled; pending and future attempts stop."""
+        self._cancelled.set()
+
+    def attempt_timeout(self, cap: float) -> float:
+        """Timeout for the next upstream attempt: the cap, bounded by the remaining budget."""
+        remaining = self.remaining()
+        return cap if remaining is None else min(cap, remaining)
+
+    def can_retry(self, delay: float, min_attempt: float) -> bool:
+        """Whether waiting `delay` seconds still leaves `min_attempt` seconds for another attempt."""
+        if self.cancelled:
+            return False
+        remaining = self.remaining()
+        return remaining is None or remaining > delay + min_attempt
+
+    def wait(self, delay: float) -> bool:
+        """Sleeps up to `delay` seconds; returns early (True) if the request is cancelled."""
+        return self._cancelled.wait(delay)
+
+    def record_usage(self, result) -> None:
+        """Records the `AIResult` of one upstream call made for this request."""
+        with self._usage_lock:
+            self.usage.append(result)
@@ -0,0 +1,98 @@
+"""
+Document sessions for incremental reprocessing.
+
+Editors resubmit the whole document after every small change. A document
+session remembers, per paragraph, a fingerprint of the input and the raw AI
+output for it, so that on resubmission only paragraphs whose fingerprint
+changed need to go back to the provider.
+"""
+
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# Paragraphs are separated by one or more blank lines; the separators are kept
+# so the document can be reassembled exactly.
+_PARAGRAPH_BREAK = re.compile(r"(\n[ \t]*\n\s*)")
+
+
+def split_paragraphs(text: str) -> tuple:
+    """
+    Splits `text` into paragraphs and the separators between them, such that
+    `paragraphs[0] + separators[0] + paragraphs[1] + ...` equals `text`.
+    """
+    parts = _PARAGRAPH_BREAK.split(text)
+    return parts[0::2], parts[1::2]
+
+
+def join_paragraphs(paragraphs: list, separators: list) -> str:
+    """Reassembles paragraphs with their original separators."""
+    pieces = []
+    for i, paragraph in enumerate(paragraphs):
+        pieces.append(paragraph)
+        if i < len(separators):
+            pieces.append(separators[i])
+    return "".join(pieces)
+
+
+def fingerprint(paragraph: str, scope: tuple) -> str:
+    """Hashes a paragraph together with everything that affects its AI output."""
+    digest = hashlib.sha256()
+    for part in scope:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    digest.update(paragraph.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class DocumentSessionStore:
+    """
+    Thread-safe in-memory store of per-document paragraph results.
+
+    Each document maps paragraph fingerprints to raw AI output. Only the
+    paragraphs of the latest submission are kept, documents idle for longer
+    than `ttl_seconds` are dropped, and the least recently used documents are
+    evicted once there are more than `max_documents`.
+    """
+
+    def __init__(self, ttl_seconds: float = 1800, max_documents: int = 1000):
+        self.ttl_seconds = ttl_seconds
+        self.max_documents = max_documents
+        self._documents = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, document_id: str) -> dict:
+        """Returns a copy of the stored `fingerprint -> output` map for a document."""
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            entry = self._documents.get(document_id)
+            if entry is None:
+                return {}
+            self._documents[document_id] = (now, entry[1])
+            self._documents.move_to_end(document_id)
+            return dict(entry[1])
+
+    def put(self, document_id: str, results: dict) -> None:
+        """Replaces the stored results for a document with those of its latest version."""
+        now = time.monotonic()
+        with self._lock:
+            self._documents[document_id] = (now, dict(results))
+            self._documents.move_to_end(document_id)
+            self._evict_expired(now)
+            while len(self._documents) > self.max_documents:
+                self._documents.popitem(last=False)
+
+    def _evict_expired(self, now: float) -> None:
+        # Entries are ordered by last use, so expired ones are at the front.
+        while self._documents:
+            document_id, (updated_at, _) = next(iter(self._documents.items()))
+            if now - updated_at <= self.ttl_seconds:
+                break
+            del self._documents[document_id]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._documents)
@@ -0,0 +1,178 @@
+"""
+Local history of processed results for the CLI.
+
+Results are kept in an SQLite database (WAL mode) with the original text,
+output, mode, provider, timing and a hash of everything that determines the
+output, so an exact repeat can be served without calling the provider. An
+FTS5 index over originals and outputs backs `search`; on SQLite builds
+without FTS5, search falls back to a substring scan.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+from datetime import datetime
+
+from core.settings import DEFAULT_HISTORY_PATH
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    input_hash TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    case_style TEXT NOT NULL,
+    target_language TEXT,
+    provider TEXT,
+    model TEXT,
+    original TEXT NOT NULL,
+    output TEXT NOT NULL,
+    duration_ms REAL
+);
+CREATE INDEX IF NOT EXISTS results_input_hash ON results (input_hash);
+"""
+
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS results_fts USING fts5(
+    original, output, content='results', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS results_fts_insert AFTER INSERT ON results BEGIN
+    INSERT INTO results_fts (rowid, original, output) VALUES (new.id, new.original, new.output);
+END;
+CREATE TRIGGER IF NOT EXISTS results_fts_delete AFTER DELETE ON results BEGIN
+    INSERT INTO results_fts (results_fts, rowid, original, output) VALUES ('delete', old.id, old.original, old.output);
+END;
+"""
+
+# Sections of the text files the CLI used to write to output/
+_LEGACY_SECTION = re.compile(r"^--- (Original Text|Processed Text|Stats) ---$", re.MULTILINE)
+_LEGACY_NAME = re.compile(r"^(gram|trans|summ)_(?:(.+)_)?(\d{8}_\d{6})\.txt$")
+_LEGACY_MODES = {"gram": "grammar", "trans": "translate", "summ": "summarize"}
+
+
+def input_hash(text: str, mode: str, case_style: str, target_language: str = None, provider: str = None, model: str = None) -> str:
+    """Hashes the input text together with every setting that affects the output."""
+    digest = hashlib.sha256()
+    for part in (mode, case_style, target_language or "", provider or "", model or "", text):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class HistoryStore:
+    """SQLite-backed store of CLI results."""
+
+    def __init__(self, path: str = DEFAULT_HISTORY_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+        try:
+            self.conn.executescript(_FTS_SCHEMA)
+            self.has_fts = True
+        except sqlite3.OperationalError:
+            self.has_fts = False
+        self.conn.commit()
+
+    def record(self, original: str, output: str, mode: str, case_style: str, target_language: str = None,
+               provider: str = None, model: str = None, duration_ms: float = None, created_at: str = None) -> int:
+        """Stores a result and returns its id."""
+        with self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO results (created_at, input_hash, mode, case_style, target_language, provider, model, original, output, duration_ms)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    created_at or datetime.now().isoformat(timespec="seconds"),
+                    input_hash(original, mode, case_style, target_language, provider, model),
+                    mode, case_style, target_language, provider, model, original, output, duration_ms,
+                ),
+            )
+        return cursor.lastrowid
+
+    def lookup(self, text: str, mode: str, case_style: str, target_language: str = None, provider: str = None, model: str = None):
+        """Returns the most recent stored result for exactly this input and settings, or None."""
+        row = self.conn.execute(
+            "SELECT * FROM results WHERE input_hash = ? ORDER BY id DESC LIMIT 1",
+            (input_hash(text, mode, case_style, target_language, provider, model),),
+        ).fetchone()
+        return dict(row) if row else None
+
+    def search(self, query: str, limit: int = 20) -> list:
+        """Returns the most recent results whose original or output matches `query`."""
+        if self.has_fts:
+            # Quote each term so user input is never parsed as FTS5 syntax.
+            terms = " ".join('"' + term.replace('"', '""') + '"' for term in query.split())
+            if not terms:
+                return []
+            rows = self.conn.execute(
+                "SELECT results.* FROM results_fts JOIN results ON results.id = results_fts.rowid"
+                " WHERE results_fts MATCH ? ORDER BY results.id DESC LIMIT ?",
+                (terms, limit),
+            ).fetchall()
+        else:
+            pattern = f"%{query}%"
+            rows = self.conn.execute(
+                "SELECT * FROM results WHERE original LIKE ? OR output LIKE ? ORDER BY id DESC LIMIT ?",
+                (pattern, pattern, limit),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def export_jsonl(self, fp) -> int:
+        """Writes every result as one JSON object per line, oldest first. Returns the count."""
+        count = 0
+        for row in self.conn.execute("SELECT * FROM results ORDER BY id"):
+            fp.write(json.dumps(dict(row), ensure_ascii=False) + "\n")
+            count += 1
+        return count
+
+    def import_legacy_file(self, path: str):
+        """
+        Imports a result file written by earlier CLI versions
+        (`output/<mode>_[<language>_]<timestamp>.txt`). Returns the new id, or
+        None if the file is not in that format.
+        """
+        match = _LEGACY_NAME.match(os.path.basename(path))
+        if not match:
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            content = f.read()
+
+        parts = _LEGACY_SECTION.split(content)
+        sections = {parts[i]: parts[i + 1].strip("\n") for i in range(1, len(parts) - 1, 2)}
+        if "Original Text" not in sections or "Processed Text" not in sections:
+            return None
+        stats = dict(
+            line.split(": ", 1) for line in sections.get("Stats", "").splitlines() if ": " in line
+        )
+
+        mode_code, language, timestamp = match.groups()
+        result = dict(
+            original=sections["Original Text"],
+            output=sections["Processed Text"],
+            mode=stats.get("Mode", _LEGACY_MODES[mode_code]),
+            case_style=stats.get("Case Style", "sentence"),
+            target_language=language.replace("_", " ").title() if language else None,
+            provider=stats.get("AI Provider"),
+            created_at=datetime.strptime(timestamp, "%Y%m%d_%H%M%S").isoformat(),
+        )
+        # Importing the same directory twice must not duplicate results.
+        existing = self.conn.execute(
+            "SELECT id FROM results WHERE input_hash = ? AND created_at = ?",
+            (input_hash(result["original"], result["mode"], result["case_style"], result["target_language"], result["provider"]), result["created_at"]),
+        ).fetchone()
+        if existing:
+            return existing["id"]
+        return self.record(**result)
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def close(self) -> None:
+        self.conn.close()
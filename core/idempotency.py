@@ -0,0 +1,89 @@
+"""
+Idempotency keys for processing requests.
+
+Clients on unreliable networks retry POSTs whose responses they never saw.
+When a request carries an idempotency key, the first completed response for
+that key is kept for a while: retries get the stored response instead of
+another provider call, and retries that arrive while the original is still
+running wait for it rather than starting their own.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+
+from core.writon import IdempotencyKeyReused
+
+
+class _Entry:
+    __slots__ = ("fingerprint", "future", "created_at")
+
+    def __init__(self, fingerprint: str, future: asyncio.Future, created_at: float):
+        self.fingerprint = fingerprint
+        self.future = future
+        self.created_at = created_at
+
+
+class IdempotencyStore:
+    """
+    In-memory store of responses by idempotency key, for use from a single
+    event loop.
+
+    Each key remembers a fingerprint of the request it was first used with;
+    reusing it for a different request raises `IdempotencyKeyReused`. Only
+    successful results are stored: if the original call fails, the key is
+    released and the next caller (including any waiting duplicates) runs the
+    call again. Completed entries expire `ttl_seconds` after they were
+    created, and the oldest completed entries are evicted beyond `max_keys`.
+    """
+
+    def __init__(self, ttl_seconds: float = 3600, max_keys: int = 10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_keys = max_keys
+        self._entries = OrderedDict()
+
+    async def run(self, key: str, fingerprint: str, func) -> tuple:
+        """
+        Returns `(result, replayed)` for `key`, awaiting `func()` only if no
+        stored or in-flight result exists. `replayed` is True when the result
+        came from an earlier (or concurrent) request with the same key.
+        """
+        while True:
+            now = time.monotonic()
+            self._evict(now)
+            entry = self._entries.get(key)
+
+            if entry is None:
+                entry = _Entry(fingerprint, asyncio.get_running_loop().create_future(), now)
+                self._entries[key] = entry
+                try:
+                    result = await func()
+                except BaseException:
+                    if self._entries.get(key) is entry:
+                        del self._entries[key]
+                    # Wake any duplicates so one of them can retry the call.
+                    entry.future.set_result(None)
+                    raise
+                entry.future.set_result(result)
+                return result, False
+
+            if entry.fingerprint != fingerprint:
+                raise IdempotencyKeyReused("Idempotency-Key was already used with a different request.")
+
+            # shield(): a duplicate giving up must not cancel the original's future.
+            result = await asyncio.shield(entry.future)
+            if result is not None:
+                return result, True
+
+    def _evict(self, now: float) -> None:
+        # Entries are ordered by creation; in-flight ones are never evicted.
+        for key, entry in list(self._entries.items()):
+            if not entry.future.done():
+                continue
+            if now - entry.created_at > self.ttl_seconds or len(self._entries) >= self.max_keys:
+                del self._entries[key]
+            else:
+                break
+
+    def __len__(self):
+        return len(self._entries)
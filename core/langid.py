@@ -0,0 +1,199 @@
+"""
+Local language identification.
+
+Detects the language of a text without any network call, so translate
+requests whose text is already in the target language can skip the
+provider. Texts in a script used by a single language (Greek, Hangul, kana,
+...) are identified by script alone. Latin and Cyrillic texts are compared
+against character trigram profiles shipped in `core/data/langid_trigrams.json`
+using cosine similarity; the confidence reflects how clearly the best
+profile beats the runner-up and how much text there was to go on. Text that
+is not similar enough to any profile (most likely a language without one) is
+not identified at all.
+"""
+
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from functools import lru_cache
+
+_PROFILES_PATH = os.path.join(os.path.dirname(__file__), "data", "langid_trigrams.json")
+
+# Texts with fewer letters than this are never identified.
+MIN_LETTERS = 12
+
+# Trigram count at which the confidence is no longer scaled down for length.
+FULL_CONFIDENCE_TRIGRAMS = 40
+
+# Cosine similarity the best profile must reach. A sentence in a profiled
+# language scores about 0.2-0.6; languages without a profile (Vietnamese,
+# Welsh, Icelandic, ...) stay below 0.1, however clear their lead.
+MIN_SIMILARITY = 0.15
+
+# Language -> accepted spellings of it as a target language (besides its name).
+LANGUAGE_ALIASES = {
+    "English": ("en", "eng", "english"),
+    "Spanish": ("es", "spa", "spanish", "español", "espanol", "castellano"),
+    "French": ("fr", "fra", "fre", "french", "français", "francais"),
+    "German": ("de", "deu", "ger", "german", "deutsch"),
+    "Italian": ("it", "ita", "italian", "italiano"),
+    "Portuguese": ("pt", "por", "portuguese", "português", "portugues"),
+    "Dutch": ("nl", "nld", "dut", "dutch", "nederlands", "flemish"),
+    "Afrikaans": ("af", "afr", "afrikaans"),
+    "Swedish": ("sv", "swe", "swedish", "svenska"),
+    "Norwegian": ("no", "nor", "nb", "nob", "norwegian", "norsk", "bokmål", "bokmal"),
+    "Danish": ("da", "dan", "danish", "dansk"),
+    "Polish": ("pl", "pol", "polish", "polski"),
+    "Russian": ("ru", "rus", "russian", "русский"),
+    "Ukrainian": ("uk", "ukr", "ukrainian", "українська"),
+    "Greek": ("el", "ell", "gre", "greek", "ελληνικά"),
+    "Hebrew": ("he", "heb", "hebrew", "עברית"),
+    "Thai": ("th", "tha", "thai", "ไทย"),
+    "Georgian": ("ka", "kat", "geo", "georgian"),
+    "Armenian": ("hy", "hye", "arm", "armenian"),
+    "Korean": ("ko", "kor", "korean", "한국어"),
+    "Japanese": ("ja", "jpn", "japanese", "日本語"),
+    "Chinese": ("zh", "zho", "chi", "chinese", "mandarin", "中文"),
+    "Arabic": ("ar", "ara", "arabic", "العربية"),
+    "Hindi": ("hi", "hin", "hindi", "हिन्दी"),
+}
+
+# Scripts and the language they indicate. Confidence is lower for scripts
+# shared by several widespread languages.
+_SCRIPTS = (
+    ("Greek", "Ͱ-Ͽ", 0.99),
+    ("Hebrew", "֐-׿", 0.95),
+    ("Thai", "฀-๿", 0.99),
+    ("Georgian", "Ⴀ-ჿ", 0.99),
+    ("Armenian", "԰-֏", 0.99),
+    ("Korean", "가-힯ᄀ-ᇿ", 0.99),
+    ("Chinese", "一-鿿", 0.9),
+    ("Arabic", "؀-ۿ", 0.7),
+    ("Hindi", "ऀ-ॿ", 0.7),
+)
+_SCRIPT_PATTERNS = tuple((language, re.compile(f"[{ranges}]"), confidence) for language, ranges, confidence in _SCRIPTS)
+_KANA = re.compile("[぀-ヿ]")
+_LATIN = re.compile(r"[a-zà-ɏ]")
+_CYRILLIC = re.compile(r"[Ѐ-ӿ]")
+_NON_LETTERS = re.compile(r"[^\w']+|[\d_]+")
+
+_profiles = None
+_profiles_lock = threading.Lock()
+
+
+def _trigrams(text: str) -> list:
+    """Returns the character trigrams of each word, padded with spaces."""
+    grams = []
+    for word in _NON_LETTERS.sub(" ", text.lower()).split():
+        padded = f" {word} "
+        grams.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def _script_of(text: str) -> str:
+    """Returns "latin" or "cyrillic" if most letters of `text` are in that script."""
+    letters = [ch for ch in text if ch.isalpha()]
+    for script, pattern in (("latin", _LATIN), ("cyrillic", _CYRILLIC)):
+        if letters and len(pattern.findall(text)) > len(letters) / 2:
+            return script
+    return None
+
+
+def _load_profiles() -> dict:
+    """
+    Loads the trigram profiles once, as `language -> (counts, norm, script)`
+    with the vector norm precomputed.
+    """
+    global _profiles
+    if _profiles is None:
+        with _profiles_lock:
+            if _profiles is None:
+                with open(_PROFILES_PATH, "r", encoding="utf-8") as f:
+                    raw = json.load(f)
+                _profiles = {
+                    language: (counts, math.sqrt(sum(c * c for c in counts.values())), _script_of("".join(counts)))
+                    for language, counts in raw.items()
+                }
+    return _profiles
+
+
+def _score_profiles(text: str, languages) -> tuple:
+    """Returns `(language, confidence)` for the best matching trigram profile."""
+    counts = Counter(_trigrams(text))
+    total = sum(counts.values())
+    if not total:
+        return None, 0.0
+    norm = math.sqrt(sum(c * c for c in counts.values()))
+
+    profiles = _load_profiles()
+    scores = []
+    for language in languages:
+        profile, profile_norm, _ = profiles[language]
+        dot = sum(count * profile.get(gram, 0) for gram, count in counts.items())
+        scores.append((dot / (norm * profile_norm), language))
+    scores.sort(reverse=True)
+
+    best, language = scores[0]
+    runner_up = scores[1][0] if len(scores) > 1 else 0.0
+    if best < MIN_SIMILARITY:
+        return None, 0.0
+    margin = (best - runner_up) / best
+    # A clear lead of a third over the runner-up counts as certain.
+    confidence = min(1.0, margin * 3) * min(1.0, total / FULL_CONFIDENCE_TRIGRAMS)
+    return language, round(confidence, 3)
+
+
+@lru_cache(maxsize=256)
+def detect_language(text: str):
+    """
+    Returns `(language, confidence)` for `text`, with `confidence` between 0
+    and 1, or None if the text is too short, in an unsupported script, or
+    not similar enough to any profile.
+    """
+    letters = "".join(ch for ch in text.lower() if ch.isalpha())
+    if len(letters) < MIN_LETTERS:
+        return None
+
+    # Kana marks Japanese even when most characters are Han.
+    if _KANA.search(letters):
+        return "Japanese", 0.99
+    for language, pattern, confidence in _SCRIPT_PATTERNS:
+        if len(pattern.findall(letters)) > len(letters) / 2:
+            return language, confidence
+
+    script = _script_of(letters)
+    if script is None:
+        return None
+    candidates = [language for language, (_, _, profile_script) in _load_profiles().items() if profile_script == script]
+    language, confidence = _score_profiles(text, candidates)
+    return (language, confidence) if language else None
+
+
+def _split_language(name: str) -> tuple:
+    parts = re.split(r"[\s_\-(]", name.strip().lower(), maxsplit=1)
+    qualifier = re.sub(r"\W+", "-", parts[1]).strip("-") if len(parts) > 1 else ""
+    return parts[0], qualifier
+
+
+def normalize_language(name: str):
+    """
+    Maps a target language as written by a user ("English", "en-US",
+    "Español", "portuguese (brazil)") to a language known to the detector,
+    or None. Region and script qualifiers are dropped; see `language_qualifier`.
+    """
+    base, _ = _split_language(name)
+    for language, aliases in LANGUAGE_ALIASES.items():
+        if base in aliases:
+            return language
+    return None
+
+
+def language_qualifier(name: str) -> str:
+    """
+    The region or script part of a target language ("tw" for "zh-TW",
+    "traditional" for "Chinese (Traditional)"), or "" if there is none.
+    """
+    return _split_language(name)[1]
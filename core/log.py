@@ -0,0 +1,183 @@
+"""
+Structured logging for Writon.
+
+All modules log through children of the "writon" logger (see `get_logger`).
+Records are handed to a `QueueHandler` on the calling thread and formatted
+and written by a background `QueueListener`, so request handlers never block
+on stderr. Output is one JSON object per line by default; any `extra=` fields
+(request id, route, mode, provider, durations, sizes) become JSON keys.
+
+Two knobs keep volume down at high request rates:
+
+- records logged with `extra={"sample": True}` (routine success logs) are
+  kept with probability LOG_SAMPLE_RATE;
+- `log_exception` attaches a traceback to at most LOG_TRACEBACKS_PER_MINUTE
+  records and logs the rest without one.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+ROOT_LOGGER = "writon"
+
+# Attributes every LogRecord has; anything else was passed via `extra=`.
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener = None
+_configure_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as a single-line JSON object including its extra fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and key != "sample":
+                entry[key] = value
+        if record.exc_info:
+            entry["traceback"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps records marked with `sample=True` with probability `rate`."""
+
+    def __init__(self, rate: float = 1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, "sample", False) and self.rate < 1.0:
+            return random.random() < self.rate
+        return True
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that only resolves the message on the calling thread;
+    formatting (including tracebacks) is left to the listener thread.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class TracebackLimiter:
+    """Allows at most `per_minute` tracebacks in any rolling 60 second window."""
+
+    def __init__(self, per_minute: int = 10):
+        self.per_minute = per_minute
+        self._times = []
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            self._times = [t for t in self._times if now - t < 60]
+            if len(self._times) >= self.per_minute:
+                return False
+            self._times.append(now)
+            return True
+
+
+# Reconfigured from LOG_TRACEBACKS_PER_MINUTE by `configure_logging`.
+_traceback_limiter = TracebackLimiter()
+
+
+def get_logger(name: str = None) -> logging.Logger:
+    """Returns the shared Writon logger, or a named child of it."""
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}" if name else ROOT_LOGGER)
+
+
+def log_exception(logger: logging.Logger, message: str, exc: BaseException, **fields) -> None:
+    """Logs an error, attaching the traceback only while under the rate limit."""
+    with_traceback = _traceback_limiter.allow()
+    fields.setdefault("error", str(exc))
+    fields.setdefault("error_type", type(exc).__name__)
+    if not with_traceback:
+        fields["traceback_suppressed"] = True
+    exc_info = (type(exc), exc, exc.__traceback__) if with_traceback else None
+    logger.error(message, exc_info=exc_info, extra=fields)
+
+
+def configure_logging(stream=None, level: str = None, fmt: str = None, sample_rate: float = None) -> None:
+    """
+    Routes the "writon" logger through a queue to a background writer.
+
+    Safe to call more than once; later calls replace the earlier setup.
+    Defaults come from the settings snapshot (which loads .env): LOG_LEVEL
+    (DEBUG when DEBUG_MODE is true), LOG_FORMAT ("json" or "text"),
+    LOG_SAMPLE_RATE and LOG_TRACEBACKS_PER_MINUTE.
+    """
+    from core.settings import get_settings
+
+    global _listener
+    settings = get_settings()
+    level = (level or settings.log_level or ("DEBUG" if settings.debug_mode else "INFO")).upper()
+    fmt = fmt or settings.log_format
+    sample_rate = settings.log_sample_rate if sample_rate is None else sample_rate
+    _traceback_limiter.per_minute = settings.log_tracebacks_per_minute
+
+    writer = logging.StreamHandler(stream or sys.stderr)
+    if fmt == "json":
+        writer.setFormatter(JsonFormatter())
+    else:
+        writer.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+    with _configure_lock:
+        if _listener is not None:
+            _listener.stop()
+
+        log_queue = queue.SimpleQueue()
+        handler = _DeferredQueueHandler(log_queue)
+        handler.addFilter(SamplingFilter(sample_rate))
+
+        root = logging.getLogger(ROOT_LOGGER)
+        root.handlers = [handler]
+        root.setLevel(level)
+        root.propagate = False
+
+        _listener = logging.handlers.QueueListener(log_queue, writer, respect_handler_level=True)
+        _listener.start()
+
+
+def flush_logging() -> None:
+    """Stops the background writer after draining the queue, then restarts it."""
+    if _listener is not None:
+        _listener.stop()
+        _listener.start()
+
+
+def _restart_after_fork() -> None:
+    # Threads do not survive fork(): give each child process its own writer.
+    global _listener
+    if _listener is not None:
+        _listener._thread = None
+        _listener.start()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+@atexit.register
+def _stop_listener() -> None:
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
@@ -0,0 +1,283 @@
+"""
+Markdown-aware splitting of documents into prose and structure.
+
+`parse_markdown` splits a document into blocks. Front matter, fenced and
+indented code, tables, HTML blocks, link reference definitions, rules and
+blank lines are kept verbatim. Headings, paragraphs, list items and
+blockquotes become `ProseNode`s. Their line markers (`#`, `-`, `1.`, `>`,
+indentation) are stripped, and inline code, link targets, autolinks, HTML
+tags and bare URLs are replaced with numbered placeholders, so only the prose
+itself goes upstream. Joining the rendered nodes reproduces the document
+exactly. A node whose processed text drops, duplicates or invents a
+placeholder keeps its original text.
+"""
+
+import re
+from dataclasses import dataclass, field
+
+MARKDOWN_INSTRUCTIONS = (
+    "The text comes from a markdown document. Markers such as ⟦0⟧ stand for code, links "
+    "or URLs: keep every marker exactly as written, once each. Keep the line breaks, and keep "
+    "inline formatting such as **bold**, *emphasis* and [link text]."
+)
+
+_PLACEHOLDER = re.compile(r"⟦(\d+)⟧")
+
+_FRONT_MATTER_DELIMITERS = ("---", "+++")
+_FENCE = re.compile(r"^[ \t]*(`{3,}|~{3,})")
+_HEADING = re.compile(r"^ {0,3}#{1,6}(?:[ \t]|$)")
+_LIST_ITEM = re.compile(r"^[ \t]*(?:>[ \t]?)*[ \t]*(?:[-*+]|\d{1,9}[.)])[ \t]+\S")
+_RULE = re.compile(r"^ {0,3}(?:(?:-[ \t]*){3,}|(?:\*[ \t]*){3,}|(?:_[ \t]*){3,}|=+[ \t]*)$")
+_HTML_BLOCK = re.compile(r"^ {0,3}<(?:[A-Za-z][\w-]*(?:[\s/>]|$)|/[A-Za-z]|!--|\?|!)")
+_REFERENCE = re.compile(r"^ {0,3}\[[^\]]+\]:[ \t]*\S")
+_TABLE_ROW = re.compile(r"^[ \t]*\|")
+_TABLE_DELIMITER = re.compile(r"^[ \t]*\|?[ \t]*:?-+:?[ \t]*(?:\|[ \t]*:?-+:?[ \t]*)*\|?[ \t]*$")
+_QUOTE = re.compile(r"^[ \t]*>")
+
+# Line markers kept out of the prose: indentation, quote markers, a heading
+# or list marker and an optional task checkbox.
+_LINE_PREFIX = re.compile(
+    r"^[ \t]*(?:>[ \t]?)*[ \t]*(?:#{1,6}[ \t]+|(?:[-*+]|\d{1,9}[.)])[ \t]+(?:\[[ xX]\][ \t]+)?)?"
+)
+_HEADING_CLOSE = re.compile(r"[ \t]+#+[ \t]*$")
+
+# Inline spans that must reach the output unchanged.
+_PROTECTED_SPAN = re.compile(
+    r"(?P<ticks>`+).+?(?<!`)(?P=ticks)(?!`)"  # inline code
+    r"|<(?:https?://|mailto:)[^>\s]+>"  # autolinks
+    r"|</?[A-Za-z][\w-]*(?:\s[^<>]*)?/?>"  # inline HTML tags
+    r"|\]\([^)\s]*(?:[ \t]+\"[^\"]*\")?\)"  # link and image targets
+    r"|\]\[[^\]]*\]"  # reference link labels
+    r"|\[\^[^\]]+\]"  # footnote references
+    r"|(?:https?://|www\.)[^\s<>()\[\]]*[^\s<>()\[\].,;:!?'\"]"  # bare URLs
+)
+_LETTER = re.compile(r"[^\W\d_]")
+
+
+@dataclass
+class Block:
+    """A verbatim part of the document (code, table, front matter, ...)."""
+
+    kind: str
+    text: str
+
+    def render(self, *_) -> str:
+        return self.text
+
+
+@dataclass
+class ProseNode:
+    """
+    A heading, paragraph or list item. `lines` holds `(prefix, content,
+    suffix)` per source line; `masked` is the contents joined by newlines
+    with protected spans replaced by placeholders listed in `spans`.
+    """
+
+    kind: str
+    lines: list
+    masked: str = ""
+    spans: list = field(default_factory=list)
+
+    def __post_init__(self):
+        content = "\n".join(line[1] for line in self.lines)
+        if "⟦" in content or "⟧" in content:
+            # Text that already contains placeholder brackets cannot be masked safely.
+            self.masked, self.spans = "", []
+            return
+        spans = []
+
+        def _mask(match):
+            spans.append(match.group(0))
+            return f"⟦{len(spans) - 1}⟧"
+
+        self.masked = _PROTECTED_SPAN.sub(_mask, content)
+        self.spans = spans
+
+    @property
+    def text(self) -> str:
+        return "".join(prefix + content + suffix for prefix, content, suffix in self.lines)
+
+    @property
+    def content(self) -> str:
+        """The node's text without line markers, protected spans included."""
+        return "\n".join(line[1] for line in self.lines)
+
+    @property
+    def has_prose(self) -> bool:
+        """Whether anything besides placeholders, digits and punctuation is left to process."""
+        return bool(_LETTER.search(_PLACEHOLDER.sub("", self.masked)))
+
+    def restore(self, masked: str):
+        """
+        Puts the protected spans back into processed `masked` text. Returns
+        None unless every placeholder appears exactly once.
+        """
+        found = sorted(int(index) for index in _PLACEHOLDER.findall(masked))
+        if found != list(range(len(self.spans))):
+            return None
+        return _PLACEHOLDER.sub(lambda match: self.spans[int(match.group(1))], masked)
+
+    def render(self, masked: str = None) -> str:
+        """
+        The node with its content replaced by processed `masked` text (the
+        original when None, or when its placeholders do not match). Line
+        markers are reapplied line by line; if the line count changed, the
+        result is written on the first line's marker.
+        """
+        content = self.restore(masked.strip()) if masked is not None else None
+        if content is None:
+            return self.text
+        new_lines = content.split("\n")
+        if len(new_lines) == len(self.lines):
+            return "".join(prefix + new + suffix for (prefix, _, suffix), new in zip(self.lines, new_lines))
+        joined = " ".join(line.strip() for line in new_lines if line.strip())
+        return self.lines[0][0] + joined + self.lines[-1][2]
+
+
+def _split_line(line: str, kind: str) -> tuple:
+    body = line.rstrip("\r\n")
+    ending = line[len(body):]
+    prefix = _LINE_PREFIX.match(body).group(0)
+    content = body[len(prefix):]
+    stripped = content.rstrip()
+    if kind == "heading":
+        close = _HEADING_CLOSE.search(stripped)
+        if close:
+            stripped = stripped[:close.start()]
+    return prefix, stripped, content[len(stripped):] + ending
+
+
+def _is_blank(line: str) -> bool:
+    return not line.strip()
+
+
+def _starts_block(lines: list, i: int) -> bool:
+    """Whether line `i` starts a block other than a paragraph continuation."""
+    line = lines[i]
+    return bool(
+        _is_blank(line)
+        or _FENCE.match(line)
+        or _HEADING.match(line)
+        or _LIST_ITEM.match(line)
+        or _RULE.match(line.rstrip("\r\n"))
+        or _HTML_BLOCK.match(line)
+        or _REFERENCE.match(line)
+        or _is_table_start(lines, i)
+    )
+
+
+def _is_table_start(lines: list, i: int) -> bool:
+    if _TABLE_ROW.match(lines[i]):
+        return True
+    return "|" in lines[i] and i + 1 < len(lines) and bool(_TABLE_DELIMITER.match(lines[i + 1].rstrip("\r\n")))
+
+
+def _front_matter_end(lines: list) -> int:
+    """Index just past a closed front matter block at the top, or 0."""
+    if not lines or lines[0].rstrip("\r\n") not in _FRONT_MATTER_DELIMITERS:
+        return 0
+    delimiter = lines[0].rstrip("\r\n")
+    for j in range(1, len(lines)):
+        if lines[j].rstrip("\r\n") == delimiter:
+            return j + 1
+    return 0
+
+
+def _fence_end(lines: list, i: int) -> int:
+    opening = _FENCE.match(lines[i]).group(1)
+    for j in range(i + 1, len(lines)):
+        match = _FENCE.match(lines[j])
+        if match and match.group(1)[0] == opening[0] and len(match.group(1)) >= len(opening) and not lines[j][match.end():].strip():
+            return j + 1
+    return len(lines)
+
+
+def parse_markdown(text: str) -> list:
+    """
+    Splits `text` into `Block`s and `ProseNode`s. Joining the `text` of every
+    node gives back `text` exactly.
+    """
+    lines = text.splitlines(keepends=True)
+    nodes = []
+    i = _front_matter_end(lines)
+    if i:
+        nodes.append(Block("front_matter", "".join(lines[:i])))
+
+    def _take(kind, end):
+        nonlocal i
+        nodes.append(Block(kind, "".join(lines[i:end])))
+        i = end
+
+    previous = None
+    while i < len(lines):
+        line = lines[i]
+        if _is_blank(line):
+            end = i
+            while end < len(lines) and _is_blank(lines[end]):
+                end += 1
+            _take("blank", end)
+            continue
+        if _FENCE.match(line):
+            _take("code", _fence_end(lines, i))
+        elif line.startswith(("    ", "\t")) and previous != "list_item":
+            end = i
+            while end < len(lines) and (lines[end].startswith(("    ", "\t")) or _is_blank(lines[end])):
+                end += 1
+            while _is_blank(lines[end - 1]):
+                end -= 1
+            _take("code", end)
+        elif _HTML_BLOCK.match(line):
+            end = i + 1
+            while end < len(lines) and not _is_blank(lines[end]):
+                end += 1
+            _take("html", end)
+        elif _is_table_start(lines, i):
+            end = i + 1
+            while end < len(lines) and "|" in lines[end] and not _is_blank(lines[end]):
+                end += 1
+            _take("table", end)
+        elif _REFERENCE.match(line):
+            _take("reference", i + 1)
+        elif _RULE.match(line.rstrip("\r\n")):
+            _take("rule", i + 1)
+        elif _HEADING.match(line):
+            nodes.append(ProseNode("heading", [_split_line(line, "heading")]))
+            i += 1
+        else:
+            # Indented text after a list item continues that item.
+            continues_item = previous == "list_item" and line[:1] in (" ", "\t")
+            kind = "list_item" if _LIST_ITEM.match(line) or continues_item else "paragraph"
+            quoted = bool(_QUOTE.match(line))
+            end = i + 1
+            while end < len(lines) and not _starts_block(lines, end) and bool(_QUOTE.match(lines[end])) == quoted:
+                end += 1
+            nodes.append(ProseNode(kind, [_split_line(part, kind) for part in lines[i:end]]))
+            i = end
+        previous = nodes[-1].kind
+    return nodes
+
+
+def prose_nodes(nodes: list) -> list:
+    """The nodes that have prose to send upstream."""
+    return [node for node in nodes if isinstance(node, ProseNode) and node.has_prose]
+
+
+def batch_texts(texts: list, max_chars: int) -> list:
+    """
+    Groups consecutive texts into batches of at most `max_chars` characters.
+    A longer text, or one containing batch item tags, gets a batch of its own.
+    """
+    batches, current, size = [], [], 0
+    for text in texts:
+        alone = len(text) > max_chars or "<item" in text or "</item>" in text
+        if current and (alone or size + len(text) > max_chars):
+            batches.append(current)
+            current, size = [], 0
+        if alone:
+            batches.append([text])
+            continue
+        current.append(text)
+        size += len(text)
+    if current:
+        batches.append(current)
+    return batches
@@ -0,0 +1,190 @@
+"""
+Sampled per-request profiling.
+
+A `SamplingProfiler` wakes every few milliseconds and records the Python
+stack of each thread bound to it, so the cost of a profiled request is a
+handful of `sys._current_frames()` calls rather than cProfile's per-call
+tracing. The API binds the event-loop thread for the whole request, and
+`bind_thread` binds the threadpool worker that runs the blocking core call.
+
+The event loop is shared by every request on the worker, so a loop thread is
+bound with an anchor frame (the profiled request's own coroutine frame) and
+only samples whose stack passes through that frame are kept; time the loop
+spends on other requests is not charged to the profiled one. Tasks the
+request spawns on the loop have their own stacks and are not sampled.
+
+Samples where a worker is blocked on a socket, SSL read or lock are tagged
+with a `[wait]` frame, so upstream wait is visible next to (rather than
+mixed into) CPU time in our own code. Samples where the event loop is idle
+in its selector are dropped.
+
+`save_profile` writes two files per request: `<name>.collapsed` (one
+`frame;frame;... count` line per distinct stack, the input format of
+flamegraph.pl and speedscope) and `<name>.pstats` (loadable with
+`pstats.Stats`; call counts there are sample counts).
+"""
+
+import contextvars
+import functools
+import glob
+import marshal
+import os
+import sys
+import threading
+from collections import Counter
+
+# The profiler bound to the request being handled, if any.
+active_profile = contextvars.ContextVar("active_profile", default=None)
+
+# Files whose frames at the top of a stack mean the thread is blocked.
+_WAIT_FILES = ("socket.py", "ssl.py", "threading.py", "queue.py")
+_IDLE_FILES = ("selectors.py",)
+
+
+def _frame_key(code) -> tuple:
+    return code.co_filename, code.co_firstlineno, code.co_name
+
+
+def _frame_label(key: tuple) -> str:
+    filename, lineno, name = key
+    short = "/".join(filename.replace("\\", "/").split("/")[-2:])
+    return f"{name} ({short}:{lineno})"
+
+
+class SamplingProfiler:
+    """Samples the stacks of bound threads from a background thread."""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.samples = Counter()
+        self._threads = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = None
+
+    def add_thread(self, ident: int, role: str, anchor=None) -> None:
+        """
+        Samples thread `ident` under `role`. With an `anchor` frame, only
+        samples whose stack contains that frame are recorded.
+        """
+        with self._lock:
+            self._threads[ident] = (role, anchor)
+
+    def remove_thread(self, ident: int) -> None:
+        with self._lock:
+            self._threads.pop(ident, None)
+
+    def start(self) -> None:
+        self._sampler = threading.Thread(target=self._run, name="writon-profiler", daemon=True)
+        self._sampler.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def sample(self) -> None:
+        """Records one stack for every bound thread."""
+        with self._lock:
+            threads = dict(self._threads)
+        frames = sys._current_frames()
+        for ident, (role, anchor) in threads.items():
+            frame = frames.get(ident)
+            if frame is None:
+                continue
+            stack = []
+            anchored = anchor is None
+            while frame is not None:
+                stack.append(_frame_key(frame.f_code))
+                anchored = anchored or frame is anchor
+                frame = frame.f_back
+            if not anchored:
+                continue
+            stack.reverse()
+            leaf_file = os.path.basename(stack[-1][0])
+            if role == "loop" and leaf_file in _IDLE_FILES:
+                continue
+            self.samples[(role, tuple(stack), leaf_file in _WAIT_FILES)] += 1
+
+    def collapsed(self) -> str:
+        """Returns the samples in collapsed-stack format, one line per distinct stack."""
+        lines = Counter()
+        for (role, stack, waiting), count in self.samples.items():
+            frames = [role] + [_frame_label(key) for key in stack] + (["[wait]"] if waiting else [])
+            lines[";".join(frames)] += count
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(lines.items()))
+
+    def pstats_data(self) -> dict:
+        """
+        Returns the samples as the dict `pstats.Stats` loads: per function
+        `(calls, calls, own time, cumulative time, callers)`, with each
+        sample counted as one call lasting `interval`.
+        """
+        stats = {}
+
+        def entry(key):
+            if key not in stats:
+                stats[key] = [0, 0, 0.0, 0.0, {}]
+            return stats[key]
+
+        for (_, stack, _), count in self.samples.items():
+            elapsed = count * self.interval
+            for key in set(stack):
+                func = entry(key)
+                func[0] += count
+                func[1] += count
+                func[3] += elapsed
+            entry(stack[-1])[2] += elapsed
+            for depth, (caller, callee) in enumerate(zip(stack, stack[1:]), start=1):
+                edges = entry(callee)[4]
+                edge = edges.get(caller, (0, 0, 0.0, 0.0))
+                own = elapsed if depth == len(stack) - 1 else 0.0
+                edges[caller] = (edge[0] + count, edge[1] + count, edge[2] + own, edge[3] + elapsed)
+        return {key: (cc, nc, tt, ct, callers) for key, (cc, nc, tt, ct, callers) in stats.items()}
+
+
+def bind_thread(func):
+    """
+    Wraps `func` so the thread that runs it is sampled by the active
+    profiler. Returns `func` unchanged when no profile is active.
+    """
+    profile = active_profile.get()
+    if profile is None:
+        return func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        ident = threading.get_ident()
+        profile.add_thread(ident, "worker")
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.remove_thread(ident)
+
+    return wrapper
+
+
+def save_profile(profile: SamplingProfiler, directory: str, name: str, max_profiles: int) -> str:
+    """
+    Writes `<name>.collapsed` and `<name>.pstats` to `directory`, then
+    deletes the oldest profiles beyond `max_profiles` (names start with a
+    timestamp, so they sort oldest first). Returns the path prefix of the
+    written files.
+    """
+    os.makedirs(directory, exist_ok=True)
+    prefix = os.path.join(directory, name)
+    with open(prefix + ".collapsed", "w", encoding="utf-8") as f:
+        f.write(profile.collapsed())
+    with open(prefix + ".pstats", "wb") as f:
+        marshal.dump(profile.pstats_data(), f)
+
+    profiles = sorted(glob.glob(os.path.join(directory, "*.collapsed")))
+    for old in profiles[:max(0, len(profiles) - max_profiles)]:
+        for path in (old, old[: -len(".collapsed")] + ".pstats"):
+            if os.path.exists(path):
+                os.remove(path)
+    return prefix
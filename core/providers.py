@@ -0,0 +1,598 @@
+"""
+AI provider implementations for Writon.
+
+This module holds the HTTP client code for every supported provider. It is
+imported lazily by `WritonCore` the first time a provider is needed, so the
+CLI and API can start without paying for `requests` and its dependencies.
+"""
+
+import json
+import random
+import threading
+import time
+from datetime import timedelta
+import requests
+from requests.adapters import HTTPAdapter
+from abc import ABC, abstractmethod
+
+from core.writon import AIProviderError, ConfigurationError, DeadlineExceeded, RequestCancelled
+from core.settings import get_settings
+from core.usage import AIResult
+
+# --- Shared HTTP Session ---
+
+PROVIDER_HOSTS = {
+    "openai": "https://api.openai.com",
+    "groq": "https://api.groq.com",
+    "google": "https://generativelanguage.googleapis.com",
+    "anthropic": "https://api.anthropic.com",
+}
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_http_session() -> requests.Session:
+    """
+    Returns the process-wide HTTP session used for all upstream calls.
+
+    The session keeps a pool of keep-alive connections per provider host, so
+    only the first call to a provider pays for DNS resolution and the TLS
+    handshake. It is created lazily so that a pre-forking server never shares
+    sockets between worker processes.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                pool_size = get_settings().http_pool_size
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=len(PROVIDER_HOSTS), pool_maxsize=pool_size)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+def open_connection(url: str, timeout: float) -> bool:
+    """
+    Sends a HEAD request so the pooled connection to `url` is established.
+    Any HTTP response counts as success; only network failures return False.
+    """
+    try:
+        get_http_session().head(url, timeout=timeout)
+        return True
+    except requests.RequestException:
+        return False
+
+# --- AI Provider Abstraction ---
+
+# Upstream statuses worth retrying: rate limiting and transient server errors.
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+
+class AIProvider(ABC):
+    """
+    Abstract base class for all AI providers.
+
+    Subclasses describe how to build a request and parse a response; the base
+    class sends it over the shared session, applying the request deadline to
+    each attempt and retrying transient failures while the budget allows.
+    """
+    BASE_URL = None
+    NAME = None
+    TIMEOUT = 60
+    # Don't start a retry unless at least this many seconds remain for it.
+    MIN_ATTEMPT_SECONDS = 2.0
+    # Give up instead of waiting longer than this between attempts.
+    MAX_BACKOFF_SECONDS = 10.0
+    # Whether adjacent pipeline steps may be fused into one prompt for this
+    # provider's models (see WritonCore.run_pipeline).
+    SUPPORTS_FUSED_PROMPTS = True
+    # Whether the provider has an asynchronous batch API (see core/bulk.py),
+    # and how many requests one batch may hold.
+    SUPPORTS_BATCH = False
+    MAX_BATCH_REQUESTS = 0
+
+    def __init__(self, api_key, model):
+        if not api_key:
+            raise ConfigurationError(f"{self.__class__.__name__} API key is not configured.")
+        self.api_key = api_key
+        self.model = model
+        # Model tier chosen by WritonCore for this call, if any.
+        self.tier = None
+        self.session = get_http_session()
+        self.max_retries = get_settings().upstream_max_retries
+
+    @abstractmethod
+    def build_request(self, prompt: str, system: str = None) -> tuple:
+        """
+        Returns `(url, headers, data)` for a generation request.
+
+        `prompt` is the user turn. `system` is sent in the provider's native
+        system slot rather than inlined into the user turn, so the static
+        per-mode instructions form a stable prefix that providers can cache.
+        """
+        pass
+
+    @abstractmethod
+    def parse_response(self, result: dict) -> str:
+        """Extracts the generated text from a decoded JSON response."""
+        pass
+
+    def parse_usage(self, result: dict) -> dict:
+        """
+        Extracts `input_tokens`, `output_tokens` and the serving `model` from
+        a decoded JSON response; keys the provider does not report are left out.
+        """
+        return {}
+
+    def parse_stream_usage(self, event: dict) -> dict:
+        """Like `parse_usage`, for one decoded stream event; later events override earlier ones."""
+        return {}
+
+    def call_ai(self, prompt: str, system: str = None, context=None) -> AIResult:
+        """
+        Calls the AI provider's API and returns the text response as an
+        `AIResult` carrying token usage and timing, also recorded on `context`.
+        """
+        url, headers, data = self.build_request(prompt, system)
+        started = time.perf_counter()
+        try:
+            body, ttfb = self._post(url, headers, data, context)
+            text = self.parse_response(body)
+            usage = self.parse_usage(body)
+        except (DeadlineExceeded, RequestCancelled):
+            raise
+        except Exception as e:
+            raise AIProviderError(f"{self.NAME} API call failed: {e}")
+        result = self._result(text, usage, started, ttfb)
+        if context is not None:
+            context.record_usage(result)
+        return result
+
+    def _result(self, text: str, usage: dict, started: float, ttfb: float = None) -> AIResult:
+        return AIResult(
+            text,
+            provider=self.NAME,
+            model=usage.get("model") or self.model,
+            input_tokens=usage.get("input_tokens"),
+            output_tokens=usage.get("output_tokens"),
+            latency_ms=round((time.perf_counter() - started) * 1000, 2),
+            ttfb_ms=round(ttfb * 1000, 2) if ttfb is not None else None,
+            tier=self.tier,
+        )
+
+    def build_stream_request(self, prompt: str, system: str = None):
+        """
+        Returns `(url, headers, data)` for a streaming (server-sent events)
+        request, or None if the provider is not set up for streaming.
+        """
+        return None
+
+    def parse_stream_event(self, event: dict) -> str:
+        """Extracts the text delta, if any, from one decoded stream event."""
+        return None
+
+    def stream_ai(self, prompt: str, system: str = None, context=None):
+        """
+        Yields the response text as it is generated. Providers without a
+        streaming request yield the whole response as a single chunk.
+
+        Streams are not retried: once output has been yielded, a repeated
+        attempt could not be merged with it.
+        """
+        request = self.build_stream_request(prompt, system)
+        if request is None:
+            yield self.call_ai(prompt, system=system, context=context)
+            return
+
+        url, headers, data = request
+        self._check(context)
+        timeout = context.attempt_timeout(self.TIMEOUT) if context else self.TIMEOUT
+        started = time.perf_counter()
+        first_token = None
+        chunks = []
+        usage = {}
+        try:
+            with self.session.post(url, headers=headers, json=data, timeout=timeout, stream=True) as response:
+                response.raise_for_status()
+                for line in response.iter_lines(decode_unicode=True):
+                    self._check(context)
+                    if not line or not line.startswith("data:"):
+                        continue
+                    payload = line[len("data:"):].strip()
+                    if payload == "[DONE]":
+                        break
+                    event = json.loads(payload)
+                    usage.update(self.parse_stream_usage(event))
+                    delta = self.parse_stream_event(event)
+                    if delta:
+                        if first_token is None:
+                            first_token = time.perf_counter() - started
+                        chunks.append(delta)
+                        yield delta
+        except (DeadlineExceeded, RequestCancelled):
+            raise
+        except Exception as e:
+            raise AIProviderError(f"{self.NAME} API stream failed: {e}")
+        if context is not None:
+            # For streams, TTFB is the time to the first generated text.
+            context.record_usage(self._result("".join(chunks), usage, started, first_token))
+
+    def _post(self, url: str, headers: dict, data: dict, context=None, idempotent: bool = True) -> tuple:
+        """
+        POSTs `data` and returns the decoded JSON body and the time to first
+        byte of the successful attempt in seconds. Each attempt's timeout
+        is bounded by the remaining request budget; transient failures are
+        retried with jittered backoff only if another attempt still fits.
+
+        A POST that creates something upstream (`idempotent=False`) gets a
+        single attempt: a timeout does not tell whether it went through, and
+        repeating it could create a duplicate.
+        """
+        max_retries = self.max_retries if idempotent else 0
+        attempt = 0
+        while True:
+            self._check(context)
+            timeout = context.attempt_timeout(self.TIMEOUT) if context else self.TIMEOUT
+            retry_after = None
+            try:
+                response = self.session.post(url, headers=headers, json=data, timeout=timeout)
+                if response.status_code not in RETRYABLE_STATUSES:
+                    response.raise_for_status()
+                    # requests measures `elapsed` up to the parsed response headers.
+                    elapsed = getattr(response, "elapsed", None)
+                    return response.json(), elapsed.total_seconds() if isinstance(elapsed, timedelta) else None
+                error = requests.HTTPError(f"{response.status_code} error from upstream", response=response)
+                retry_after = response.headers.get("retry-after")
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+
+            delay = self._backoff(attempt, retry_after)
+            out_of_budget = context is not None and not context.can_retry(delay, self.MIN_ATTEMPT_SECONDS)
+            if attempt >= max_retries or delay > self.MAX_BACKOFF_SECONDS or out_of_budget:
+                self._check(context)
+                raise error
+            if context:
+                context.wait(delay)
+            else:
+                time.sleep(delay)
+            attempt += 1
+
+    @staticmethod
+    def _backoff(attempt: int, retry_after: str = None) -> float:
+        """Seconds to wait before the next attempt, honouring a numeric Retry-After."""
+        if retry_after:
+            try:
+                return max(0.0, float(retry_after))
+            except ValueError:
+                pass
+        return (0.5 * 2 ** attempt) * (0.5 + random.random() / 2)
+
+    @staticmethod
+    def _check(context) -> None:
+        if context is None:
+            return
+        if context.cancelled:
+            raise RequestCancelled("Request was cancelled before the upstream call completed.")
+        if context.expired:
+            raise DeadlineExceeded("Request deadline exceeded before the upstream call completed.")
+
+    @staticmethod
+    def _chat_messages(prompt: str, system: str = None) -> list:
+        """Builds an OpenAI-style message list with an optional system message."""
+        messages = [{"role": "system", "content": system}] if system else []
+        messages.append({"role": "user", "content": prompt})
+        return messages
+
+    # --- Batch API ---
+
+    def submit_batch(self, requests: list) -> str:
+        """
+        Submits `(custom_id, prompt, system)` requests as one asynchronous
+        batch and returns its id.
+        """
+        raise AIProviderError(f"{self.NAME} does not support batch jobs.")
+
+    def get_batch(self, batch_id: str) -> dict:
+        """
+        Returns the batch's state: `id`, provider `status`, `done` (whether
+        it reached a final state), request `counts` and whatever
+        `batch_results` needs to fetch the results.
+        """
+        raise AIProviderError(f"{self.NAME} does not support batch jobs.")
+
+    def batch_results(self, batch: dict) -> dict:
+        """
+        Fetches the results of a finished batch as `custom_id ->
+        {"text": AIResult}` or `custom_id -> {"error": str}`.
+        """
+        raise AIProviderError(f"{self.NAME} does not support batch jobs.")
+
+    def _get(self, url: str, headers: dict):
+        """GETs batch bookkeeping data, raising AIProviderError on failure."""
+        try:
+            response = self.session.get(url, headers=headers, timeout=self.TIMEOUT)
+            response.raise_for_status()
+            return response
+        except requests.RequestException as e:
+            raise AIProviderError(f"{self.NAME} batch request failed: {e}")
+
+    def _batch_result(self, body: dict) -> dict:
+        """Turns one successful response body from a batch into a result entry (without latency)."""
+        try:
+            usage = self.parse_usage(body)
+            text = AIResult(
+                self.parse_response(body),
+                provider=self.NAME,
+                model=usage.get("model") or self.model,
+                input_tokens=usage.get("input_tokens"),
+                output_tokens=usage.get("output_tokens"),
+                tier=self.tier,
+            )
+            return {"text": text}
+        except Exception as e:
+            return {"error": f"Invalid response in batch: {e}"}
+
+    @staticmethod
+    def _jsonl(text: str) -> list:
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+# --- Concrete AI Provider Implementations ---
+
+class OpenAIProvider(AIProvider):
+    BASE_URL = PROVIDER_HOSTS["openai"]
+    NAME = "OpenAI"
+    SUPPORTS_BATCH = True
+    MAX_BATCH_REQUESTS = 50000
+    # Batch states after which nothing changes any more.
+    BATCH_FINAL_STATES = ("completed", "failed", "expired", "cancelled")
+
+    def build_request(self, prompt: str, system: str = None) -> tuple:
+        headers = {"Content-Type": "application/json", "Authorization": f"Bearer {self.api_key}"}
+        data = {
+            "model": self.model, 
+            "messages": self._chat_messages(prompt, system),
+            "max_tokens": 4000,
+            "temperature": 0.7
+        }
+        return f"{self.BASE_URL}/v1/chat/completions", headers, data
+
+    def parse_response(self, result: dict) -> str:
+        return result["choices"][0]["message"]["content"].strip()
+
+    def parse_usage(self, result: dict) -> dict:
+        usage = result.get("usage") or {}
+        return {"input_tokens": usage.get("prompt_tokens"), "output_tokens": usage.get("completion_tokens"), "model": result.get("model")}
+
+    def build_stream_request(self, prompt: str, system: str = None) -> tuple:
+        url, headers, data = self.build_request(prompt, system)
+        return url, headers, {**data, "stream": True, "stream_options": {"include_usage": True}}
+
+    def parse_stream_event(self, event: dict) -> str:
+        choices = event.get("choices") or [{}]
+        return choices[0].get("delta", {}).get("content")
+
+    def parse_stream_usage(self, event: dict) -> dict:
+        return self.parse_usage(event) if event.get("usage") else {}
+
+    def submit_batch(self, requests: list) -> str:
+        """Uploads the requests as a JSONL file and creates a 24-hour batch from it."""
+        lines = []
+        for custom_id, prompt, system in requests:
+            _, _, data = self.build_request(prompt, system)
+            lines.append(json.dumps({"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions", "body": data}))
+        auth = {"Authorization": f"Bearer {self.api_key}"}
+        try:
+            upload = self.session.post(
+                f"{self.BASE_URL}/v1/files",
+                headers=auth,
+                data={"purpose": "batch"},
+                files={"file": ("writon-batch.jsonl", "\n".join(lines).encode("utf-8"), "application/jsonl")},
+                timeout=self.TIMEOUT,
+            )
+            upload.raise_for_status()
+            body, _ = self._post(
+                f"{self.BASE_URL}/v1/batches",
+                {**auth, "Content-Type": "application/json"},
+                {"input_file_id": upload.json()["id"], "endpoint": "/v1/chat/completions", "completion_window": "24h"},
+                idempotent=False,
+            )
+            return body["id"]
+        except Exception as e:
+            raise AIProviderError(f"{self.NAME} batch submission failed: {e}")
+
+    def get_batch(self, batch_id: str) -> dict:
+        body = self._get(f"{self.BASE_URL}/v1/batches/{batch_id}", {"Authorization": f"Bearer {self.api_key}"}).json()
+        counts = body.get("request_counts") or {}
+        return {
+            "id": body["id"],
+            "status": body["status"],
+            "done": body["status"] in self.BATCH_FINAL_STATES,
+            "counts": {"total": counts.get("total"), "succeeded": counts.get("completed"), "failed": counts.get("failed")},
+            "output_file_id": body.get("output_file_id"),
+            "error_file_id": body.get("error_file_id"),
+            "errors": (body.get("errors") or {}).get("data") or [],
+        }
+
+    def batch_results(self, batch: dict) -> dict:
+        if not batch.get("output_file_id") and not batch.get("error_file_id"):
+            messages = "; ".join(error.get("message", "") for error in batch.get("errors", []))
+            raise AIProviderError(f"{self.NAME} batch {batch['id']} {batch['status']} without results{': ' + messages if messages else ''}")
+        results = {}
+        for file_id in (batch.get("output_file_id"), batch.get("error_file_id")):
+            if not file_id:
+                continue
+            content = self._get(f"{self.BASE_URL}/v1/files/{file_id}/content", {"Authorization": f"Bearer {self.api_key}"}).text
+            for line in self._jsonl(content):
+                response = line.get("response") or {}
+                if response.get("status_code") == 200:
+                    results[line["custom_id"]] = self._batch_result(response.get("body") or {})
+                else:
+                    error = line.get("error") or (response.get("body") or {}).get("error") or {}
+                    results[line["custom_id"]] = {"error": error.get("message") or f"status {response.get('status_code')}"}
+        return results
+
+class GroqProvider(AIProvider):
+    BASE_URL = PROVIDER_HOSTS["groq"]
+    NAME = "Groq"
+
+    def build_request(self, prompt: str, system: str = None) -> tuple:
+        headers = {"Content-Type": "application/json", "Authorization": f"Bearer {self.api_key}"}
+        data = {
+            "model": self.model,
+            "messages": self._chat_messages(prompt, system),
+            "temperature": 0.7,
+            "max_tokens": 4000,
+        }
+        return f"{self.BASE_URL}/openai/v1/chat/completions", headers, data
+
+    def parse_response(self, result: dict) -> str:
+        return result["choices"][0]["message"]["content"].strip()
+
+    def parse_usage(self, result: dict) -> dict:
+        usage = result.get("usage") or {}
+        return {"input_tokens": usage.get("prompt_tokens"), "output_tokens": usage.get("completion_tokens"), "model": result.get("model")}
+
+    def build_stream_request(self, prompt: str, system: str = None) -> tuple:
+        url, headers, data = self.build_request(prompt, system)
+        return url, headers, {**data, "stream": True}
+
+    def parse_stream_event(self, event: dict) -> str:
+        choices = event.get("choices") or [{}]
+        return choices[0].get("delta", {}).get("content")
+
+    def parse_stream_usage(self, event: dict) -> dict:
+        # Groq reports stream usage in the final chunk under `x_groq`.
+        usage = (event.get("x_groq") or {}).get("usage")
+        return self.parse_usage({"usage": usage, "model": event.get("model")}) if usage else {}
+
+class GoogleProvider(AIProvider):
+    BASE_URL = PROVIDER_HOSTS["google"]
+    NAME = "Google"
+
+    def build_request(self, prompt: str, system: str = None) -> tuple:
+        headers = {"Content-Type": "application/json"}
+        data = {
+            "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+            "generationConfig": {"temperature": 0.7, "maxOutputTokens": 4000},
+        }
+        if system:
+            data["systemInstruction"] = {"parts": [{"text": system}]}
+        return f"{self.BASE_URL}/v1beta/models/{self.model}:generateContent?key={self.api_key}", headers, data
+
+    def parse_response(self, result: dict) -> str:
+        if "candidates" in result and len(result["candidates"]) > 0:
+            if "content" in result["candidates"][0] and "parts" in result["candidates"][0]["content"]:
+                return result["candidates"][0]["content"]["parts"][0]["text"].strip()
+        raise AIProviderError("Google API response is invalid or empty.")
+
+    def parse_usage(self, result: dict) -> dict:
+        usage = result.get("usageMetadata") or {}
+        return {
+            "input_tokens": usage.get("promptTokenCount"),
+            "output_tokens": usage.get("candidatesTokenCount"),
+            "model": result.get("modelVersion"),
+        }
+
+    def build_stream_request(self, prompt: str, system: str = None) -> tuple:
+        _, headers, data = self.build_request(prompt, system)
+        return f"{self.BASE_URL}/v1beta/models/{self.model}:streamGenerateContent?alt=sse&key={self.api_key}", headers, data
+
+    def parse_stream_event(self, event: dict) -> str:
+        parts = (event.get("candidates") or [{}])[0].get("content", {}).get("parts") or []
+        return "".join(part.get("text", "") for part in parts)
+
+    def parse_stream_usage(self, event: dict) -> dict:
+        # Each chunk carries the running totals.
+        return self.parse_usage(event) if event.get("usageMetadata") else {}
+
+class AnthropicProvider(AIProvider):
+    BASE_URL = PROVIDER_HOSTS["anthropic"]
+    NAME = "Anthropic"
+    SUPPORTS_BATCH = True
+    MAX_BATCH_REQUESTS = 100000
+
+    def build_request(self, prompt: str, system: str = None) -> tuple:
+        headers = self._headers()
+        data = {
+            "model": self.model,
+            "max_tokens": 4000,
+            "messages": [{"role": "user", "content": prompt}],
+        }
+        if system:
+            # Cache breakpoint after the static system prompt so repeat calls
+            # for the same mode can reuse the cached prefix.
+            data["system"] = [{"type": "text", "text": system, "cache_control": {"type": "ephemeral"}}]
+        return f"{self.BASE_URL}/v1/messages", headers, data
+
+    def parse_response(self, result: dict) -> str:
+        return result["content"][0]["text"].strip()
+
+    def parse_usage(self, result: dict) -> dict:
+        usage = result.get("usage") or {}
+        return {"input_tokens": usage.get("input_tokens"), "output_tokens": usage.get("output_tokens"), "model": result.get("model")}
+
+    def build_stream_request(self, prompt: str, system: str = None) -> tuple:
+        url, headers, data = self.build_request(prompt, system)
+        return url, headers, {**data, "stream": True}
+
+    def parse_stream_event(self, event: dict) -> str:
+        if event.get("type") == "error":
+            raise AIProviderError(event.get("error", {}).get("message", "stream error"))
+        if event.get("type") == "content_block_delta":
+            return event.get("delta", {}).get("text")
+        return None
+
+    def parse_stream_usage(self, event: dict) -> dict:
+        if event.get("type") == "message_start":
+            message = event.get("message", {})
+            return {"input_tokens": message.get("usage", {}).get("input_tokens"), "model": message.get("model")}
+        if event.get("type") == "message_delta":
+            return {"output_tokens": event.get("usage", {}).get("output_tokens")}
+        return {}
+
+    def _headers(self) -> dict:
+        return {
+            "x-api-key": self.api_key,
+            "anthropic-version": "2023-06-01",
+            "Content-Type": "application/json",
+        }
+
+    def submit_batch(self, requests: list) -> str:
+        """Creates a Message Batch holding every request's `params`."""
+        entries = [
+            {"custom_id": custom_id, "params": self.build_request(prompt, system)[2]}
+            for custom_id, prompt, system in requests
+        ]
+        try:
+            body, _ = self._post(f"{self.BASE_URL}/v1/messages/batches", self._headers(), {"requests": entries}, idempotent=False)
+            return body["id"]
+        except Exception as e:
+            raise AIProviderError(f"{self.NAME} batch submission failed: {e}")
+
+    def get_batch(self, batch_id: str) -> dict:
+        body = self._get(f"{self.BASE_URL}/v1/messages/batches/{batch_id}", self._headers()).json()
+        counts = body.get("request_counts") or {}
+        return {
+            "id": body["id"],
+            "status": body["processing_status"],
+            "done": body["processing_status"] == "ended",
+            "counts": {
+                "total": sum(counts.values()) if counts else None,
+                "succeeded": counts.get("succeeded"),
+                "failed": sum(counts.get(key) or 0 for key in ("errored", "canceled", "expired")) if counts else None,
+            },
+            "results_url": body.get("results_url"),
+        }
+
+    def batch_results(self, batch: dict) -> dict:
+        if not batch.get("results_url"):
+            raise AIProviderError(f"{self.NAME} batch {batch['id']} has no results")
+        results = {}
+        for line in self._jsonl(self._get(batch["results_url"], self._headers()).text):
+            result = line.get("result") or {}
+            if result.get("type") == "succeeded":
+                results[line["custom_id"]] = self._batch_result(result.get("message") or {})
+            else:
+                error = (result.get("error") or {}).get("error") or {}
+                results[line["custom_id"]] = {"error": error.get("message") or f"request {result.get('type', 'failed')}"}
+        return results
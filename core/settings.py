@@ -0,0 +1,270 @@
+"""
+Typed configuration snapshot for Writon.
+
+All configuration comes from environment variables (and the `.env` file).
+`get_settings()` parses and validates them once into a frozen `Settings`
+object shared by the API and the core, so per-request lookups are attribute
+reads, and a bad value fails at startup with every problem listed instead of
+surfacing on the first request that needs it.
+
+`reload_settings()` re-reads `.env` and the environment, validates the result
+and swaps the snapshot in one assignment; requests that already hold the old
+snapshot keep a consistent view. An invalid reload leaves the current
+snapshot in place. Values used only when the process starts (middleware,
+admission limits, connection pools and the like, see `RESTART_FIELDS`) are
+validated on reload but take effect on the next restart.
+"""
+
+import os
+import threading
+from dataclasses import dataclass, field, fields
+from types import MappingProxyType
+from typing import Optional
+
+# Default locations of the local stores. They live here, not in the modules
+# that own the stores, so that reading the settings imports none of them.
+DEFAULT_TM_PATH = os.path.join("output", "translation_memory.db")
+DEFAULT_CAPTURE_PATH = os.path.join("output", "capture", "traffic.ndjson")
+DEFAULT_HISTORY_PATH = os.path.join("output", "history.db")
+
+# Providers that can be configured with <NAME>_API_KEY and <NAME>_MODEL.
+PROVIDER_NAMES = ("openai", "groq", "google", "anthropic")
+
+_BOOLEANS = {"true": True, "1": True, "yes": True, "on": True, "false": False, "0": False, "no": False, "off": False}
+
+_env_loaded = False
+_dotenv_keys = set()
+_env_lock = threading.Lock()
+
+
+def load_env(reload: bool = False) -> None:
+    """
+    Loads the .env file once; python-dotenv is only imported when needed.
+    With `reload`, the file is read again and values it set before are
+    updated, while variables from the real environment still take precedence.
+    """
+    global _env_loaded
+    with _env_lock:
+        if _env_loaded and not reload:
+            return
+        from dotenv import dotenv_values
+
+        for key, value in dotenv_values().items():
+            if value is None:
+                continue
+            if key in _dotenv_keys or key not in os.environ:
+                os.environ[key] = value
+                _dotenv_keys.add(key)
+        _env_loaded = True
+
+
+def _setting(env: str, default, minimum=None, maximum=None, choices=None, restart: bool = False):
+    return field(default=default, metadata={
+        "env": env, "min": minimum, "max": maximum, "choices": choices, "restart": restart,
+    })
+
+
+@dataclass(frozen=True)
+class Settings:
+    """One validated, immutable view of the configuration."""
+
+    # Providers (keys and models per provider are read into `api_keys` and `models`)
+    api_provider: Optional[str] = _setting("API_PROVIDER", None, choices=PROVIDER_NAMES)
+    api_keys: MappingProxyType = field(default_factory=lambda: MappingProxyType({}))
+    models: MappingProxyType = field(default_factory=lambda: MappingProxyType({}))
+    model_tiers_enabled: bool = _setting("MODEL_TIERS_ENABLED", True)
+    upstream_max_retries: int = _setting("UPSTREAM_MAX_RETRIES", 2, minimum=0)
+    http_pool_size: int = _setting("HTTP_POOL_SIZE", 10, minimum=1, restart=True)
+    debug_mode: bool = _setting("DEBUG_MODE", False)
+    environment: Optional[str] = _setting("ENVIRONMENT", None, restart=True)
+
+    # Processing
+    langid_enabled: bool = _setting("LANGID_ENABLED", False)
+    langid_min_confidence: float = _setting("LANGID_MIN_CONFIDENCE", 0.9, minimum=0, maximum=1)
+    summarize_compression: bool = _setting("SUMMARIZE_COMPRESSION", False)
+    summarize_compression_max_tokens: int = _setting("SUMMARIZE_COMPRESSION_MAX_TOKENS", 1500, minimum=1)
+    microbatch_window_ms: float = _setting("MICROBATCH_WINDOW_MS", 0.0, minimum=0, restart=True)
+    microbatch_max_size: int = _setting("MICROBATCH_MAX_SIZE", 8, minimum=1, restart=True)
+    microbatch_max_chars: int = _setting("MICROBATCH_MAX_CHARS", 500, minimum=1)
+    document_session_ttl_seconds: float = _setting("DOCUMENT_SESSION_TTL_SECONDS", 1800.0, minimum=0, restart=True)
+    document_session_max_documents: int = _setting("DOCUMENT_SESSION_MAX_DOCUMENTS", 1000, minimum=1, restart=True)
+    document_max_concurrency: int = _setting("DOCUMENT_MAX_CONCURRENCY", 4, minimum=1)
+    markdown_batch_max_chars: int = _setting("MARKDOWN_BATCH_MAX_CHARS", 4000, minimum=1)
+    bulk_poll_seconds: float = _setting("BULK_POLL_SECONDS", 30.0, minimum=0.1)
+    bulk_poll_max_seconds: float = _setting("BULK_POLL_MAX_SECONDS", 600.0, minimum=0.1)
+    bulk_timeout_hours: float = _setting("BULK_TIMEOUT_HOURS", 25.0, minimum=0.01)
+    bulk_max_concurrency: int = _setting("BULK_MAX_CONCURRENCY", 4, minimum=1)
+    translate_combined_max_chars: int = _setting("TRANSLATE_COMBINED_MAX_CHARS", 1000, minimum=0)
+    translate_max_concurrency: int = _setting("TRANSLATE_MAX_CONCURRENCY", 5, minimum=1)
+    tm_enabled: bool = _setting("TM_ENABLED", False, restart=True)
+    tm_db_path: str = _setting("TM_DB_PATH", DEFAULT_TM_PATH, restart=True)
+    tm_fuzzy_threshold: float = _setting("TM_FUZZY_THRESHOLD", 0.8, minimum=0, maximum=1, restart=True)
+    tm_fuzzy_hints: bool = _setting("TM_FUZZY_HINTS", True)
+    tm_max_hints: int = _setting("TM_MAX_HINTS", 5, minimum=0)
+
+    # Requests
+    request_timeout_seconds: float = _setting("REQUEST_TIMEOUT_SECONDS", 60.0, minimum=0.1)
+    max_request_timeout_seconds: float = _setting("MAX_REQUEST_TIMEOUT_SECONDS", 120.0, minimum=0.1)
+    max_request_size_mb: int = _setting("MAX_REQUEST_SIZE_MB", 1, minimum=1)
+    max_file_size_mb: int = _setting("MAX_FILE_SIZE_MB", 5, minimum=1)
+    ws_max_inflight: int = _setting("WS_MAX_INFLIGHT", 8, minimum=1)
+    ws_auth_timeout_seconds: float = _setting("WS_AUTH_TIMEOUT_SECONDS", 10.0, minimum=0.1)
+    allowed_origins: tuple = _setting("ALLOWED_ORIGINS", ("http://localhost:8000", "http://127.0.0.1:8000"), restart=True)
+    allowed_hosts: tuple = _setting("ALLOWED_HOSTS", ("writon.xyz", "*.writon.xyz"), restart=True)
+    admin_token: str = _setting("ADMIN_TOKEN", "")
+    metrics_token: str = _setting("METRICS_TOKEN", "")
+
+    # Logging
+    log_level: Optional[str] = _setting("LOG_LEVEL", None, restart=True)
+    log_format: str = _setting("LOG_FORMAT", "json", choices=("json", "text"), restart=True)
+    log_sample_rate: float = _setting("LOG_SAMPLE_RATE", 1.0, minimum=0, maximum=1, restart=True)
+    log_tracebacks_per_minute: int = _setting("LOG_TRACEBACKS_PER_MINUTE", 10, minimum=0, restart=True)
+
+    # Server (read by serve.py when the master starts)
+    host: str = _setting("HOST", "0.0.0.0", restart=True)
+    port: int = _setting("PORT", 8000, minimum=1, maximum=65535, restart=True)
+    web_concurrency: int = _setting("WEB_CONCURRENCY", 0, minimum=0, restart=True)
+    graceful_timeout_seconds: float = _setting("GRACEFUL_TIMEOUT_SECONDS", 90.0, minimum=0, restart=True)
+    profile_startup: bool = _setting("PROFILE_STARTUP", False, restart=True)
+
+    # Startup and per-worker state
+    warmup_providers: str = _setting("WARMUP_PROVIDERS", "all", restart=True)
+    warmup_timeout_seconds: float = _setting("WARMUP_TIMEOUT_SECONDS", 5.0, minimum=0, restart=True)
+    admission_max_inflight: int = _setting("ADMISSION_MAX_INFLIGHT", 32, minimum=1, restart=True)
+    admission_max_inflight_per_provider: int = _setting("ADMISSION_MAX_INFLIGHT_PER_PROVIDER", 16, minimum=1, restart=True)
+    admission_queue_size: int = _setting("ADMISSION_QUEUE_SIZE", 16, minimum=0, restart=True)
+    admission_queue_timeout_seconds: float = _setting("ADMISSION_QUEUE_TIMEOUT_SECONDS", 2.0, minimum=0, restart=True)
+    admission_adaptive: bool = _setting("ADMISSION_ADAPTIVE", False, restart=True)
+    admission_min_inflight: int = _setting("ADMISSION_MIN_INFLIGHT", 2, minimum=1, restart=True)
+    admission_target_latency_seconds: float = _setting("ADMISSION_TARGET_LATENCY_SECONDS", 10.0, minimum=0.1, restart=True)
+    usage_max_keys: int = _setting("USAGE_MAX_KEYS", 10000, minimum=1, restart=True)
+    idempotency_ttl_seconds: float = _setting("IDEMPOTENCY_TTL_SECONDS", 86400.0, minimum=0, restart=True)
+    idempotency_max_keys: int = _setting("IDEMPOTENCY_MAX_KEYS", 10000, minimum=1, restart=True)
+    capture_enabled: bool = _setting("CAPTURE_ENABLED", False, restart=True)
+    capture_path: str = _setting("CAPTURE_PATH", DEFAULT_CAPTURE_PATH, restart=True)
+    capture_text: str = _setting("CAPTURE_TEXT", "length", choices=("length", "redacted"), restart=True)
+    capture_sample_rate: float = _setting("CAPTURE_SAMPLE_RATE", 1.0, minimum=0, maximum=1, restart=True)
+    capture_max_mb: int = _setting("CAPTURE_MAX_MB", 50, minimum=1, restart=True)
+    capture_backups: int = _setting("CAPTURE_BACKUPS", 5, minimum=0, restart=True)
+    profiling_enabled: bool = _setting("PROFILING_ENABLED", False, restart=True)
+    profiling_dir: str = _setting("PROFILING_DIR", os.path.join("output", "profiles"), restart=True)
+    profiling_token: str = _setting("PROFILING_TOKEN", "", restart=True)
+    profiling_sample_rate: float = _setting("PROFILING_SAMPLE_RATE", 0.0, minimum=0, maximum=1, restart=True)
+    profiling_interval_ms: float = _setting("PROFILING_INTERVAL_MS", 5.0, minimum=0.1, restart=True)
+    profiling_max_profiles: int = _setting("PROFILING_MAX_PROFILES", 50, minimum=1, restart=True)
+
+    # CLI
+    history_db_path: str = _setting("HISTORY_DB_PATH", DEFAULT_HISTORY_PATH, restart=True)
+
+    @classmethod
+    def from_env(cls, environ=None) -> "Settings":
+        """
+        Parses and validates the settings from `environ` (default
+        `os.environ`). Raises ConfigurationError listing every invalid value.
+        """
+        environ = os.environ if environ is None else environ
+        values, errors = {}, []
+        for spec in fields(cls):
+            env = spec.metadata.get("env")
+            raw = environ.get(env) if env else None
+            if raw is None or raw.strip() == "":
+                continue
+            try:
+                values[spec.name] = _parse(raw.strip(), spec)
+            except ValueError as e:
+                errors.append(f"{env}: {e}")
+
+        values["api_keys"] = MappingProxyType({
+            name: environ[f"{name.upper()}_API_KEY"] for name in PROVIDER_NAMES if environ.get(f"{name.upper()}_API_KEY")
+        })
+        values["models"] = MappingProxyType({
+            name: environ[f"{name.upper()}_MODEL"] for name in PROVIDER_NAMES if environ.get(f"{name.upper()}_MODEL")
+        })
+        if values.get("max_request_timeout_seconds", 120.0) < values.get("request_timeout_seconds", 60.0):
+            errors.append("MAX_REQUEST_TIMEOUT_SECONDS must not be lower than REQUEST_TIMEOUT_SECONDS")
+
+        if errors:
+            from core.writon import ConfigurationError
+
+            raise ConfigurationError("Invalid configuration: " + "; ".join(errors))
+        return cls(**values)
+
+    def api_key(self, provider_name: str) -> Optional[str]:
+        return self.api_keys.get(provider_name)
+
+    def model(self, provider_name: str) -> Optional[str]:
+        return self.models.get(provider_name)
+
+    def changed_fields(self, other: "Settings") -> list:
+        """Names of the settings that differ from `other` (key values are never returned)."""
+        return [spec.name for spec in fields(self) if getattr(self, spec.name) != getattr(other, spec.name)]
+
+
+# Settings only read when the process starts; reloading them needs a restart.
+RESTART_FIELDS = frozenset(spec.name for spec in fields(Settings) if spec.metadata.get("restart"))
+
+
+def _parse(raw: str, spec):
+    default = spec.default
+    rules = spec.metadata
+    if isinstance(default, bool):
+        if raw.lower() not in _BOOLEANS:
+            raise ValueError(f"expected true or false, got {raw!r}")
+        return _BOOLEANS[raw.lower()]
+    if isinstance(default, (int, float)):
+        try:
+            value = type(default)(raw)
+        except ValueError:
+            raise ValueError(f"expected {'an integer' if isinstance(default, int) else 'a number'}, got {raw!r}")
+        if rules["min"] is not None and value < rules["min"]:
+            raise ValueError(f"must be at least {rules['min']}, got {value}")
+        if rules["max"] is not None and value > rules["max"]:
+            raise ValueError(f"must be at most {rules['max']}, got {value}")
+        return value
+    if isinstance(default, tuple):
+        return tuple(item.strip() for item in raw.split(",") if item.strip())
+    value = raw.lower() if rules["choices"] else raw
+    if rules["choices"] and value not in rules["choices"]:
+        raise ValueError(f"expected one of {', '.join(rules['choices'])}, got {raw!r}")
+    return value
+
+
+_current = None
+_settings_lock = threading.Lock()
+
+
+def get_settings() -> Settings:
+    """Returns the current settings snapshot, building it on first use."""
+    settings = _current
+    if settings is None:
+        with _settings_lock:
+            if _current is None:
+                load_env()
+                _swap(Settings.from_env())
+            settings = _current
+    return settings
+
+
+def reload_settings() -> tuple:
+    """
+    Re-reads .env and the environment and swaps in the new snapshot. Returns
+    `(settings, changed_fields)`. Raises ConfigurationError, keeping the
+    current snapshot, if the new configuration is invalid.
+    """
+    with _settings_lock:
+        load_env(reload=True)
+        settings = Settings.from_env()
+        changed = settings.changed_fields(_current) if _current is not None else []
+        _swap(settings)
+    return settings, changed
+
+
+def reset_settings() -> None:
+    """Drops the snapshot so the next `get_settings()` reads the environment again (used by tests)."""
+    with _settings_lock:
+        _swap(None)
+
+
+def _swap(settings) -> None:
+    global _current
+    _current = settings
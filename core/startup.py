@@ -0,0 +1,57 @@
+"""
+Startup profiling helpers for Writon.
+
+Measures how much each module costs to import by running the import in a
+fresh interpreter with `-X importtime`, so the numbers reflect a real cold
+start rather than whatever the current process has already loaded.
+"""
+
+import os
+import subprocess
+import sys
+
+# Modules loaded on the CLI start path and on the first provider call.
+CLI_MODULES = ("main", "core.writon", "core.providers")
+
+# Modules loaded when the API server starts.
+API_MODULES = ("api",)
+
+
+def profile_imports(modules, cwd: str = None) -> list:
+    """
+    Imports `modules` in a child interpreter and returns one
+    `(module, self_us, cumulative_us)` tuple per imported module, most
+    expensive (by cumulative time) first.
+    """
+    code = "; ".join(f"import {module}" for module in modules)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=cwd or os.getcwd(),
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Failed to import {', '.join(modules)}: {result.stderr.strip().splitlines()[-1:]}")
+    return parse_importtime(result.stderr)
+
+
+def parse_importtime(output: str) -> list:
+    """Parses `-X importtime` output into sorted `(module, self_us, cumulative_us)` rows."""
+    rows = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, module = line[len("import time:"):].split("|")
+            rows.append((module.strip(), int(self_us), int(cumulative_us)))
+        except ValueError:
+            continue
+    return sorted(rows, key=lambda row: row[2], reverse=True)
+
+
+def format_import_profile(rows: list, top: int = 20) -> str:
+    """Formats profile rows as a fixed-width table of the `top` most expensive imports."""
+    lines = [f"{'cumulative ms':>14} {'self ms':>9}  module"]
+    for module, self_us, cumulative_us in rows[:top]:
+        lines.append(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {module}")
+    return "\n".join(lines)
@@ -0,0 +1,212 @@
+"""
+Segment-level translation memory.
+
+Translations are stored per sentence ("segment") in an SQLite database,
+keyed by namespace (the client scope), target language and the normalized
+source sentence. When a text is translated, segments with an exact match are
+filled locally and only the rest go to the provider.
+
+For fuzzy matches each segment also gets a MinHash signature over its
+character trigrams, split into bands (locality-sensitive hashing). Sentences
+sharing any band are candidates, and a candidate counts as a match when its
+`difflib` similarity to the new sentence reaches the threshold. Fuzzy
+matches are not reused as-is. Instead they are offered to the model as
+reference translations, so it keeps the terminology of earlier documents.
+"""
+
+import difflib
+import hashlib
+import os
+import random
+import re
+import sqlite3
+import threading
+from datetime import datetime
+
+from core.langid import language_qualifier, normalize_language
+from core.settings import DEFAULT_TM_PATH
+
+
+# MinHash signature length and its split into bands of rows. Two sentences
+# with trigram Jaccard similarity s share at least one band with probability
+# 1 - (1 - s^ROWS)^BANDS (about 0.9 at s = 0.6).
+NUM_PERMUTATIONS = 32
+BANDS = 8
+ROWS = NUM_PERMUTATIONS // BANDS
+
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20250101)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERMUTATIONS)]
+
+# Sentence boundaries (end punctuation followed by whitespace) and line
+# breaks. Separators are kept so the text can be reassembled exactly.
+_SEGMENT_BREAK = re.compile(r"((?<=[.!?。！？])[ \t]+|[ \t]*\n\s*)")
+_WHITESPACE = re.compile(r"\s+")
+
+# Appended to the system prompt when fuzzy matches are sent as hints.
+HINT_INSTRUCTIONS = (
+    "Earlier translations of similar sentences are listed below for reference. "
+    "Reuse their terminology and phrasing where the meaning is the same, but translate "
+    "the given text itself; do not copy a reference that differs from it."
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS segments (
+    id INTEGER PRIMARY KEY,
+    namespace TEXT NOT NULL,
+    target_language TEXT NOT NULL,
+    source_hash TEXT NOT NULL,
+    source TEXT NOT NULL,
+    target TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    UNIQUE (namespace, target_language, source_hash)
+);
+CREATE TABLE IF NOT EXISTS segment_bands (
+    band TEXT NOT NULL,
+    segment_id INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS segment_bands_band ON segment_bands (band);
+"""
+
+
+def split_segments(text: str) -> tuple:
+    """
+    Splits `text` into sentences and the separators between them, such that
+    `segments[0] + separators[0] + segments[1] + ...` equals `text`.
+    """
+    parts = _SEGMENT_BREAK.split(text)
+    return parts[0::2], parts[1::2]
+
+
+def normalize_segment(segment: str) -> str:
+    return _WHITESPACE.sub(" ", segment).strip()
+
+
+def _language_key(target_language: str) -> str:
+    """
+    Stores "es", "Spanish" and "español" under the same key, but keeps
+    regional and script variants apart: "pt-BR" is "portuguese-br" and
+    "Chinese (Traditional)" is "chinese-traditional".
+    """
+    language = normalize_language(target_language)
+    if language is None:
+        return re.sub(r"\W+", "-", target_language.strip().lower()).strip("-")
+    qualifier = language_qualifier(target_language)
+    return f"{language.lower()}-{qualifier}" if qualifier else language.lower()
+
+
+def _shingles(segment: str) -> set:
+    text = f" {segment.lower()} "
+    return {text[i:i + 3] for i in range(max(1, len(text) - 2))}
+
+
+def minhash(segment: str) -> list:
+    """Returns the MinHash signature of a segment's character trigrams."""
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big") for s in _shingles(segment)]
+    return [min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS]
+
+
+def band_keys(signature: list) -> list:
+    """Hashes each band of a signature into a lookup key."""
+    keys = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS:(band + 1) * ROWS]
+        digest = hashlib.blake2b(repr(rows).encode("ascii"), digest_size=8).hexdigest()
+        keys.append(f"{band}:{digest}")
+    return keys
+
+
+class TranslationMemory:
+    """Thread-safe SQLite store of translated segments with a MinHash index."""
+
+    def __init__(self, path: str = DEFAULT_TM_PATH, fuzzy_threshold: float = 0.8):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.fuzzy_threshold = fuzzy_threshold
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+        self.conn.commit()
+
+    @staticmethod
+    def _hash(segment: str) -> str:
+        return hashlib.sha256(segment.encode("utf-8")).hexdigest()
+
+    def lookup(self, segments: list, target_language: str, namespace: str = "") -> dict:
+        """Returns `normalized source -> target` for the segments with an exact match."""
+        by_hash = {self._hash(normalize_segment(s)): normalize_segment(s) for s in segments if s.strip()}
+        if not by_hash:
+            return {}
+        found = {}
+        hashes = list(by_hash)
+        with self._lock:
+            # Stay well under SQLite's bound-parameter limit.
+            for start in range(0, len(hashes), 500):
+                chunk = hashes[start:start + 500]
+                rows = self.conn.execute(
+                    "SELECT source_hash, target FROM segments WHERE namespace = ? AND target_language = ?"
+                    f" AND source_hash IN ({','.join('?' * len(chunk))})",
+                    (namespace, _language_key(target_language), *chunk),
+                ).fetchall()
+                found.update({by_hash[row["source_hash"]]: row["target"] for row in rows})
+        return found
+
+    def fuzzy(self, segment: str, target_language: str, namespace: str = "", limit: int = 3) -> list:
+        """
+        Returns up to `limit` `(source, target, similarity)` entries for stored
+        segments similar to `segment`, best first.
+        """
+        normalized = normalize_segment(segment)
+        keys = band_keys(minhash(normalized))
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT DISTINCT segments.source, segments.target FROM segment_bands"
+                " JOIN segments ON segments.id = segment_bands.segment_id"
+                f" WHERE segment_bands.band IN ({','.join('?' * len(keys))})"
+                " AND segments.namespace = ? AND segments.target_language = ?",
+                (*keys, namespace, _language_key(target_language)),
+            ).fetchall()
+        matches = []
+        for row in rows:
+            similarity = difflib.SequenceMatcher(None, normalized, row["source"]).ratio()
+            if similarity >= self.fuzzy_threshold and row["source"] != normalized:
+                matches.append((row["source"], row["target"], round(similarity, 3)))
+        matches.sort(key=lambda match: match[2], reverse=True)
+        return matches[:limit]
+
+    def store(self, pairs: dict, target_language: str, namespace: str = "") -> None:
+        """Stores `source -> target` segment pairs, replacing earlier translations."""
+        now = datetime.now().isoformat(timespec="seconds")
+        with self._lock, self.conn:
+            for source, target in pairs.items():
+                source = normalize_segment(source)
+                if not source or not target.strip():
+                    continue
+                key = (namespace, _language_key(target_language), self._hash(source))
+                existing = self.conn.execute(
+                    "SELECT id FROM segments WHERE namespace = ? AND target_language = ? AND source_hash = ?", key
+                ).fetchone()
+                if existing:
+                    self.conn.execute("UPDATE segments SET target = ? WHERE id = ?", (target.strip(), existing["id"]))
+                    continue
+                cursor = self.conn.execute(
+                    "INSERT INTO segments (namespace, target_language, source_hash, source, target, created_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (*key, source, target.strip(), now),
+                )
+                self.conn.executemany(
+                    "INSERT INTO segment_bands (band, segment_id) VALUES (?, ?)",
+                    [(band, cursor.lastrowid) for band in band_keys(minhash(source))],
+                )
+
+    def __len__(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM segments").fetchone()[0]
+
+    def close(self) -> None:
+        self.conn.close()
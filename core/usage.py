@@ -0,0 +1,98 @@
+"""
+Upstream usage accounting.
+
+Provider calls return an `AIResult`: the generated text (it is a `str`, so
+existing callers keep working) plus the token counts reported by the
+provider, the model that actually served the call, the total upstream
+latency and the time to first byte. Calls made with a `RequestContext`
+also record their result on it, so the API can total them per request and
+feed them into a `UsageTracker`, which aggregates per provider, mode and
+key.
+"""
+
+import threading
+
+
+class AIResult(str):
+    """Generated text with the usage and timing of the call that produced it."""
+
+    def __new__(cls, text: str, provider: str = None, model: str = None, input_tokens: int = None,
+                output_tokens: int = None, latency_ms: float = None, ttfb_ms: float = None, tier: str = None):
+        result = super().__new__(cls, text)
+        result.provider = provider
+        result.model = model
+        result.input_tokens = input_tokens
+        result.output_tokens = output_tokens
+        result.latency_ms = latency_ms
+        result.ttfb_ms = ttfb_ms
+        result.tier = tier
+        return result
+
+
+def summarize_usage(results: list):
+    """
+    Totals the calls of one request: tokens and latency are summed, TTFB is
+    that of the first call, and `model` and `tier` are the last reported. Returns
+    None if there were no calls.
+    """
+    if not results:
+        return None
+
+    def total(field):
+        values = [getattr(result, field) for result in results if getattr(result, field) is not None]
+        return sum(values) if values else None
+
+    latency = total("latency_ms")
+    return {
+        "calls": len(results),
+        "input_tokens": total("input_tokens"),
+        "output_tokens": total("output_tokens"),
+        "upstream_ms": round(latency, 2) if latency is not None else None,
+        "ttfb_ms": results[0].ttfb_ms,
+        "model": next((result.model for result in reversed(results) if result.model), None),
+        "tier": next((result.tier for result in reversed(results) if result.tier), None),
+    }
+
+
+class UsageTracker:
+    """Thread-safe running totals of upstream usage per (provider, mode, key)."""
+
+    FIELDS = ("requests", "calls", "input_tokens", "output_tokens", "upstream_ms", "ttfb_ms")
+
+    def __init__(self, max_keys: int = 10000):
+        self.max_keys = max_keys
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def record(self, provider: str, mode: str, key: str, usage: dict) -> None:
+        """Adds one request's usage summary (see `summarize_usage`)."""
+        group = (provider or "unknown", mode or "unknown", key)
+        with self._lock:
+            totals = self._totals.get(group)
+            if totals is None:
+                # Bound memory under many distinct keys by folding new ones together.
+                if len(self._totals) >= self.max_keys:
+                    group = (group[0], group[1], "other")
+                totals = self._totals.setdefault(group, dict.fromkeys(self.FIELDS, 0))
+            totals["requests"] += 1
+            for field in self.FIELDS[1:]:
+                totals[field] += usage.get(field) or 0
+
+    def snapshot(self, by_key: bool = True) -> list:
+        """
+        Returns one dict per group with its totals. With `by_key=False` the
+        keys are summed together into one group per provider and mode.
+        """
+        with self._lock:
+            groups = [
+                {"provider": provider, "mode": mode, "key": key, **dict(totals)}
+                for (provider, mode, key), totals in self._totals.items()
+            ]
+        if by_key:
+            return groups
+        merged = {}
+        for group in groups:
+            totals = merged.setdefault((group["provider"], group["mode"]), dict.fromkeys(self.FIELDS, 0))
+            for field in self.FIELDS:
+                totals[field] += group[field]
+        return [{"provider": provider, "mode": mode, **totals} for (provider, mode), totals in merged.items()]
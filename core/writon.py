@@ -1,13 +1,31 @@
-import os
 import json
-import requests
-from dotenv import load_dotenv
-from abc import ABC, abstractmethod
+import logging
+import time
+import importlib
+from concurrent.futures import ThreadPoolExecutor
 
 from prompts.prompt_generator import generate_prompt
 from formatter.case_converter import convert_case
+from core.documents import DocumentSessionStore, split_paragraphs, join_paragraphs, fingerprint
+from core.langid import detect_language, language_qualifier, normalize_language
+from core.batching import MicroBatcher, BATCH_INSTRUCTIONS, format_batch, split_batch, can_batch
+from core.compression import compress_text
+from core.markdown import MARKDOWN_INSTRUCTIONS, batch_texts, parse_markdown, prose_nodes
+from core.log import get_logger
+from core.settings import get_settings
 
-load_dotenv()
+logger = get_logger("core")
+
+# Provider classes live in core.providers and are imported on first use.
+_LAZY_PROVIDER_ATTRS = (
+    "AIProvider", "OpenAIProvider", "GroqProvider", "GoogleProvider",
+    "AnthropicProvider", "get_http_session",
+)
+
+def __getattr__(name):
+    if name in _LAZY_PROVIDER_ATTRS:
+        return getattr(importlib.import_module("core.providers"), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # --- Custom Exceptions ---
 
@@ -19,102 +37,24 @@ class ConfigurationError(Exception):
     """Custom exception for configuration errors."""
     pass
 
-# --- AI Provider Abstraction ---
+class DeadlineExceeded(AIProviderError):
+    """Raised when a request's deadline passes before the AI call completes."""
+    pass
 
-class AIProvider(ABC):
-    """Abstract base class for all AI providers."""
-    def __init__(self, api_key, model):
-        if not api_key:
-            raise ConfigurationError(f"{self.__class__.__name__} API key is not configured.")
-        self.api_key = api_key
-        self.model = model
-
-    @abstractmethod
-    def call_ai(self, prompt: str) -> str:
-        """Calls the AI provider's API and returns the text response."""
-        pass
-
-# --- Concrete AI Provider Implementations ---
-
-class OpenAIProvider(AIProvider):
-    def call_ai(self, prompt: str) -> str:
-        headers = {"Content-Type": "application/json", "Authorization": f"Bearer {self.api_key}"}
-        data = {
-            "model": self.model, 
-            "messages": [{"role": "user", "content": prompt}],
-            "max_tokens": 4000,
-            "temperature": 0.7
-        }
-        try:
-            response = requests.post("https://api.openai.com/v1/chat/completions", headers=headers, json=data, timeout=60)
-            response.raise_for_status()
-            result = response.json()
-            return result["choices"][0]["message"]["content"].strip()
-        except Exception as e:
-            raise AIProviderError(f"OpenAI API call failed: {e}")
-
-class GroqProvider(AIProvider):
-    def call_ai(self, prompt: str) -> str:
-        headers = {"Content-Type": "application/json", "Authorization": f"Bearer {self.api_key}"}
-        data = {
-            "model": self.model,
-            "messages": [
-                {"role": "system", "content": "You are a helpful writing assistant."},
-                {"role": "user", "content": prompt},
-            ],
-            "temperature": 0.7,
-            "max_tokens": 4000,
-        }
-        try:
-            response = requests.post("https://api.groq.com/openai/v1/chat/completions", headers=headers, json=data, timeout=60)
-            response.raise_for_status()
-            result = response.json()
-            return result["choices"][0]["message"]["content"].strip()
-        except Exception as e:
-            raise AIProviderError(f"Groq API call failed: {e}")
-
-class GoogleProvider(AIProvider):
-    def call_ai(self, prompt: str) -> str:
-        headers = {"Content-Type": "application/json"}
-        data = {
-            "contents": [{"parts": [{"text": prompt}]}],
-            "generationConfig": {"temperature": 0.7, "maxOutputTokens": 4000},
-        }
-        try:
-            response = requests.post(
-                f"https://generativelanguage.googleapis.com/v1beta/models/{self.model}:generateContent?key={self.api_key}",
-                headers=headers,
-                json=data,
-                timeout=60,
-            )
-            response.raise_for_status()
-            result = response.json()
-            if "candidates" in result and len(result["candidates"]) > 0:
-                if "content" in result["candidates"][0] and "parts" in result["candidates"][0]["content"]:
-                    return result["candidates"][0]["content"]["parts"][0]["text"].strip()
-            raise AIProviderError("Google API response is invalid or empty.")
-        except Exception as e:
-            raise AIProviderError(f"Google API call failed: {e}")
-
-class AnthropicProvider(AIProvider):
-    def call_ai(self, prompt: str) -> str:
-        headers = {
-            "x-api-key": self.api_key,
-            "anthropic-version": "2023-06-01",
-            "Content-Type": "application/json",
-        }
-        data = {
-            "model": self.model,
-            "max_tokens": 4000,
-            "messages": [{"role": "user", "content": prompt}],
-        }
-        try:
-            response = requests.post("https://api.anthropic.com/v1/messages", headers=headers, json=data, timeout=60)
-            response.raise_for_status()
-            result = response.json()
-            return result["content"][0]["text"].strip()
-        except Exception as e:
-            raise AIProviderError(f"Anthropic API call failed: {e}")
+class RequestCancelled(AIProviderError):
+    """Raised when a request is cancelled, e.g. because the client disconnected."""
+    pass
+
+class AdmissionRejected(Exception):
+    """Raised when a worker is at capacity and sheds a request instead of queueing it."""
+
+    def __init__(self, message: str, retry_after: int = 1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class IdempotencyKeyReused(Exception):
+    """Raised when an idempotency key is reused with a different request payload."""
+    pass
 
 # --- Core Logic ---
 
@@ -129,52 +69,183 @@ class WritonCore:
         "anthropic": "claude-3-haiku-20240307",
     }
 
+    # Provider name -> class name in core.providers (resolved lazily).
     PROVIDER_CLASSES = {
-        "openai": OpenAIProvider,
-        "groq": GroqProvider,
-        "google": GoogleProvider,
-        "anthropic": AnthropicProvider,
+        "openai": "OpenAIProvider",
+        "groq": "GroqProvider",
+        "google": "GoogleProvider",
+        "anthropic": "AnthropicProvider",
     }
 
-    def _get_provider(self, user_keys: dict = None) -> AIProvider:
+    MODES = ("grammar", "translate", "summarize")
+
+    # Modes whose output for a paragraph depends only on that paragraph.
+    DOCUMENT_MODES = ("grammar", "translate")
+
+    # Modes whose per-text results can be produced by one micro-batched prompt.
+    BATCH_MODES = ("grammar", "translate")
+
+    # Longest chain of modes accepted by `run_pipeline`.
+    MAX_PIPELINE_STEPS = 4
+
+    def __init__(self):
+        settings = get_settings()
+        self._mode_configs = {}
+        self.documents = DocumentSessionStore(
+            ttl_seconds=settings.document_session_ttl_seconds,
+            max_documents=settings.document_session_max_documents,
+        )
+        # Micro-batching is opt-in: a window of 0 ms disables it.
+        window_ms = settings.microbatch_window_ms
+        self.batcher = MicroBatcher(window_ms / 1000, settings.microbatch_max_size) if window_ms > 0 else None
+        # The translation memory is opt-in: it persists translated sentences.
+        self.translation_memory = None
+        if settings.tm_enabled:
+            from core.translation_memory import TranslationMemory
+
+            self.translation_memory = TranslationMemory(settings.tm_db_path, fuzzy_threshold=settings.tm_fuzzy_threshold)
+
+    def _get_provider_class(self, provider_name: str):
+        """Imports core.providers on first use and returns the provider class."""
+        providers = importlib.import_module("core.providers")
+        return getattr(providers, self.PROVIDER_CLASSES[provider_name])
+
+    def preload_providers(self) -> None:
+        """Imports the provider implementations and their HTTP dependencies up front."""
+        importlib.import_module("core.providers")
+
+    def _load_mode_config(self, mode: str) -> dict:
+        """Loads a mode configuration from `modes/`, caching it on first use."""
+        if mode not in self._mode_configs:
+            with open(f"modes/{mode}.json", "r") as f:
+                self._mode_configs[mode] = json.load(f)
+        return self._mode_configs[mode]
+
+    def preload_modes(self) -> None:
+        """Loads every known mode configuration up front."""
+        for mode in self.MODES:
+            try:
+                self._load_mode_config(mode)
+            except (FileNotFoundError, json.JSONDecodeError) as e:
+                raise ConfigurationError(f"Failed to load or parse mode configuration for '{mode}': {e}")
+
+    def warm_up(self, providers: list = None, timeout: float = 5.0) -> dict:
         """
-        Determines the AI provider and credentials to use, then returns an
-        instantiated provider object.
+        Opens pooled connections to the given provider hosts (all by default)
+        so that DNS resolution and the TLS handshake happen before the first
+        real request. Any HTTP response counts as success; only network
+        failures are reported as False.
+        """
+        providers = providers or list(self.PROVIDER_CLASSES.keys())
+        unknown = [name for name in providers if name not in self.PROVIDER_CLASSES]
+        if unknown:
+            raise ConfigurationError(f"Cannot warm up unknown providers {unknown}. Available: {list(self.PROVIDER_CLASSES.keys())}")
+
+        providers_module = importlib.import_module("core.providers")
+
+        def _warm(name):
+            base_url = self._get_provider_class(name).BASE_URL
+            return providers_module.open_connection(base_url, timeout)
+
+        with ThreadPoolExecutor(max_workers=len(providers)) as executor:
+            return dict(zip(providers, executor.map(_warm, providers)))
+
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        """Rough token count (about four characters per token) used to pick a model tier."""
+        return (len(text) + 3) // 4
+
+    def select_model_tier(self, provider_name: str, mode: str, text: str):
+        """
+        Picks the first of the mode's `model_tiers` for this provider whose
+        `max_input_tokens` covers `text`. Returns `{"tier", "model"}` (model
+        None for a tier that keeps the configured model), or None if tiers
+        are disabled (MODEL_TIERS_ENABLED=false) or none apply.
+        """
+        if not get_settings().model_tiers_enabled:
+            return None
+        try:
+            tiers = self._load_mode_config(mode).get("model_tiers", {}).get(provider_name, [])
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        tokens = self.estimate_tokens(text)
+        for tier in tiers:
+            if tier.get("max_input_tokens") is None or tokens <= tier["max_input_tokens"]:
+                return {"tier": tier["tier"], "model": tier.get("model")}
+        return None
+
+    def _resolve_provider(self, user_keys: dict = None, mode: str = None, text: str = None) -> tuple:
+        """
+        Determines the provider name, API key and model to use from the
+        request's BYOK keys, falling back to the environment. A model pinned
+        with a BYOK model header, or else set with `<PROVIDER>_MODEL`, always
+        wins; otherwise, when `mode` and `text` are given, the mode's model
+        tier for the input size applies.
         """
+        provider_name, api_key, model, _ = self._resolve_provider_tier(user_keys, mode, text)
+        return provider_name, api_key, model
+
+    def _resolve_provider_tier(self, user_keys: dict = None, mode: str = None, text: str = None) -> tuple:
+        """Like `_resolve_provider`, also returning the chosen tier name (or None)."""
         user_keys = user_keys or {}
-        provider_name = user_keys.get("provider") or os.getenv("API_PROVIDER")
+        settings = get_settings()
+        provider_name = user_keys.get("provider") or settings.api_provider
 
         if not provider_name or provider_name not in self.PROVIDER_CLASSES:
             raise ConfigurationError(f"Invalid or no provider specified. Available: {list(self.PROVIDER_CLASSES.keys())}")
 
-        api_key = user_keys.get(f"{provider_name}_key") or os.getenv(f"{provider_name.upper()}_API_KEY")
-        model = user_keys.get(f"{provider_name}_model") or os.getenv(f"{provider_name.upper()}_MODEL") or self.DEFAULT_MODELS[provider_name]
+        api_key = user_keys.get(f"{provider_name}_key") or settings.api_key(provider_name)
+        pinned = user_keys.get(f"{provider_name}_model") or settings.model(provider_name)
+        tier = self.select_model_tier(provider_name, mode, text) if mode and text is not None and not pinned else None
+        model = pinned or (tier and tier["model"]) or self.DEFAULT_MODELS[provider_name]
 
         if not api_key:
             raise ConfigurationError(f"API key for '{provider_name}' not found in headers or .env.")
 
-        provider_class = self.PROVIDER_CLASSES[provider_name]
-        return provider_class(api_key=api_key, model=model)
+        return provider_name, api_key, model, tier["tier"] if tier else None
+
+    def provider_identity(self, user_keys: dict = None, mode: str = None, text: str = None) -> tuple:
+        """Returns the `(provider_name, model)` a call with these keys (and this input) would use."""
+        provider_name, _, model = self._resolve_provider(user_keys, mode, text)
+        return provider_name, model
 
-    def _call_ai(self, prompt_data, user_keys=None) -> str:
+    def create_provider(self, user_keys: dict = None, mode: str = None, text: str = None):
         """
-        Initializes the correct AI provider and calls it.
+        Determines the AI provider and credentials to use, then returns an
+        instantiated provider object, with the model tier for `mode` and
+        `text` applied if given. The instance can be kept and passed to
+        `stream_text` to avoid resolving credentials on every call.
+        """
+        provider_name, api_key, model, tier = self._resolve_provider_tier(user_keys, mode, text)
+        provider_class = self._get_provider_class(provider_name)
+        provider = provider_class(api_key=api_key, model=model)
+        provider.tier = tier
+        return provider
+
+    def _get_provider(self, user_keys: dict = None, mode: str = None, text: str = None):
+        return self.create_provider(user_keys, mode, text)
+
+    def _call_ai(self, prompt_data, user_keys=None, context=None) -> str:
+        """
+        Initializes the correct AI provider and calls it. If the prompt names
+        its `mode`, the model tier is chosen by the size of the user prompt.
         """
         try:
-            provider = self._get_provider(user_keys)
+            if isinstance(prompt_data, dict) and prompt_data.get("mode"):
+                provider = self._get_provider(user_keys, prompt_data["mode"], prompt_data.get("user", ""))
+            else:
+                provider = self._get_provider(user_keys)
 
-            if os.getenv("DEBUG_MODE", "false").lower() == "true":
+            if logger.isEnabledFor(logging.DEBUG):
                 key_source = "user-provided" if user_keys else "environment"
-                print(f"🧪 Using AI Provider: {provider.__class__.__name__} ({key_source} keys)")
+                logger.debug("Using AI provider", extra={"provider": provider.__class__.__name__, "key_source": key_source})
 
             if isinstance(prompt_data, dict):
                 system_msg = prompt_data.get("system", "You are a helpful writing assistant.")
                 user_msg = prompt_data.get("user", "")
-                full_prompt = f"System: {system_msg}\n\nUser: {user_msg}"
-            else:
-                full_prompt = prompt_data
+                return provider.call_ai(user_msg, system=system_msg, context=context)
 
-            return provider.call_ai(full_prompt)
+            return provider.call_ai(prompt_data, context=context)
         except (ConfigurationError, AIProviderError) as e:
             # Re-raise custom exceptions to be handled by the caller
             raise e
@@ -182,22 +253,563 @@ class WritonCore:
             # Catch any other unexpected errors
             raise AIProviderError(f"An unexpected error occurred during AI call: {e}")
 
-    def process_text(self, text: str, mode: str, case_style: str, target_language: str = None, user_keys: dict = None) -> str:
-        """Processes text by generating a prompt, calling the AI, and formatting the result."""
+    def detect_source_language(self, text: str, target_language: str):
+        """
+        Identifies the language of `text` locally. Returns None when detection
+        is disabled (LANGID_ENABLED=false) or inconclusive, otherwise a dict
+        with the detected `language`, its `confidence`, and `matches_target`:
+        whether the text is already in `target_language` with at least
+        LANGID_MIN_CONFIDENCE confidence. A target with a region or script
+        qualifier ("zh-TW", "pt-BR") never matches, since the detector cannot
+        tell variants of a language apart.
+        """
+        settings = get_settings()
+        if not settings.langid_enabled:
+            return None
+        detected = detect_language(text)
+        if detected is None:
+            return None
+        language, confidence = detected
+        threshold = settings.langid_min_confidence
+        return {
+            "language": language,
+            "confidence": confidence,
+            "matches_target": (
+                normalize_language(target_language or "") == language
+                and not language_qualifier(target_language or "")
+                and confidence >= threshold
+            ),
+        }
+
+    def _already_translated(self, text: str, mode: str, target_language: str, force_translation: bool) -> bool:
+        """Whether a translate request can be answered with the input text itself."""
+        if mode != "translate" or not target_language or force_translation:
+            return False
+        detection = self.detect_source_language(text, target_language)
+        return bool(detection and detection["matches_target"])
+
+    def compress_input(self, text: str, mode: str, context=None) -> str:
+        """
+        With SUMMARIZE_COMPRESSION=true, trims summarize inputs longer than
+        SUMMARIZE_COMPRESSION_MAX_TOKENS to their most central sentences
+        (see `core.compression`) before they are sent. What was removed is
+        recorded on `context`.
+        """
+        settings = get_settings()
+        if mode != "summarize" or not settings.summarize_compression:
+            return text
+        max_tokens = settings.summarize_compression_max_tokens
+        started = time.perf_counter()
+        compressed, stats = compress_text(text, max_tokens, self.estimate_tokens)
+        if stats is None:
+            return text
+        stats["duration_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        logger.debug("Compressed summarize input", extra=stats)
+        if context is not None:
+            context.compression = stats
+        return compressed
+
+    def process_text(self, text: str, mode: str, case_style: str, target_language: str = None, user_keys: dict = None, context=None, force_translation: bool = False) -> str:
+        """
+        Processes text by generating a prompt, calling the AI, and formatting the result.
+
+        In translate mode, text already written in the target language is only
+        case-converted, without a provider call, unless `force_translation` is set.
+        """
         try:
-            with open(f"modes/{mode}.json", "r") as f:
-                vibe_config = json.load(f)
+            if self._already_translated(text, mode, target_language, force_translation):
+                return convert_case(text, case_style)
+
+            vibe_config = self._load_mode_config(mode)
+            text = self.compress_input(text, mode, context)
 
             params = {"target_language": target_language} if target_language else {}
-            prompt_data = generate_prompt(text, vibe_config, params)
 
-            ai_response = self._call_ai(prompt_data, user_keys)
+            ai_response = None
+            if self.batcher is not None and mode in self.BATCH_MODES and can_batch(text, get_settings().microbatch_max_chars):
+                ai_response = self._call_ai_batched(text, mode, vibe_config, params, user_keys, context=context)
+            if ai_response is None:
+                prompt_data = {**generate_prompt(text, vibe_config, params), "mode": mode}
+                ai_response = self._call_ai(prompt_data, user_keys, context=context)
 
             final_text = convert_case(ai_response, case_style)
 
             return final_text
         except (FileNotFoundError, json.JSONDecodeError) as e:
             raise ConfigurationError(f"Failed to load or parse mode configuration for '{mode}': {e}")
+        except (DeadlineExceeded, RequestCancelled):
+            raise
         except Exception as e:
             # Catch and re-raise exceptions from _call_ai or other issues
-            raise ValueError(f"Error processing text: {e}")
\ No newline at end of file
+            raise ValueError(f"Error processing text: {e}")
+
+    def stream_text(self, text: str, mode: str, case_style: str, target_language: str = None, user_keys: dict = None, context=None, force_translation: bool = False, provider=None):
+        """
+        Streaming counterpart of `process_text`. Yields `{"delta": str}` events
+        with raw provider output as it is generated, then a final
+        `{"text": str}` event with the complete, case-converted result.
+        `provider` may be an instance from `create_provider` to reuse.
+        """
+        try:
+            if self._already_translated(text, mode, target_language, force_translation):
+                yield {"text": convert_case(text, case_style)}
+                return
+
+            vibe_config = self._load_mode_config(mode)
+            text = self.compress_input(text, mode, context)
+            params = {"target_language": target_language} if target_language else {}
+            prompt_data = generate_prompt(text, vibe_config, params)
+            provider = provider or self._get_provider(user_keys, mode, prompt_data["user"])
+
+            chunks = []
+            system_msg = prompt_data.get("system", "You are a helpful writing assistant.")
+            for delta in provider.stream_ai(prompt_data["user"], system=system_msg, context=context):
+                chunks.append(delta)
+                yield {"delta": delta}
+            yield {"text": convert_case("".join(chunks).strip(), case_style)}
+        except (FileNotFoundError, json.JSONDecodeError) as e:
+            raise ConfigurationError(f"Failed to load or parse mode configuration for '{mode}': {e}")
+        except (DeadlineExceeded, RequestCancelled):
+            raise
+        except Exception as e:
+            raise ValueError(f"Error processing text: {e}")
+
+    def _call_ai_batched(self, text: str, mode: str, vibe_config: dict, params: dict, user_keys: dict = None, context=None):
+        """
+        Submits `text` to the micro-batcher. Only requests with the same
+        provider, model, API key, mode and parameters share a batch. Returns
+        the raw AI output, or None if the caller should make its own call.
+        """
+        provider_name, api_key, model = self._resolve_provider(user_keys, mode, text)
+        key = (provider_name, model, api_key, mode, tuple(sorted(params.items())))
+
+        def _run_batch(texts):
+            prompt_data = generate_prompt(format_batch(texts), vibe_config, params)
+            prompt_data["system"] = f"{prompt_data.get('system', '')}\n\n{BATCH_INSTRUCTIONS}".strip()
+            try:
+                answer = self._call_ai({**prompt_data, "mode": mode}, user_keys, context=context)
+            except (DeadlineExceeded, RequestCancelled):
+                raise
+            except Exception as e:
+                logger.warning("Micro-batch call failed, falling back to individual calls", extra={"mode": mode, "items": len(texts), "error": str(e)})
+                return None
+            results = split_batch(answer, len(texts))
+            if results is None:
+                logger.warning("Micro-batch answer could not be split, falling back to individual calls", extra={"mode": mode, "items": len(texts)})
+            return results
+
+        return self.batcher.submit(key, text, _run_batch, context=context)
+
+    def process_document(self, text: str, mode: str, case_style: str, document_id: str, target_language: str = None, user_keys: dict = None, context=None) -> tuple:
+        """
+        Processes a document paragraph by paragraph, reusing stored results for
+        paragraphs that have not changed since the last submission with the
+        same `document_id`. Returns the reassembled text and a stats dict.
+        """
+        if mode not in self.DOCUMENT_MODES:
+            raise ValueError(f"Document sessions are not supported for '{mode}' mode. Supported: {list(self.DOCUMENT_MODES)}")
+
+        try:
+            vibe_config = self._load_mode_config(mode)
+            provider_name, _, model = self._resolve_provider(user_keys)
+            params = {"target_language": target_language} if target_language else {}
+            scope = (mode, target_language or "", provider_name, model)
+
+            paragraphs, separators = split_paragraphs(text)
+            fingerprints = [fingerprint(p, scope) if p.strip() else None for p in paragraphs]
+            previous = self.documents.get(document_id)
+            pending = {fp: p for fp, p in zip(fingerprints, paragraphs) if fp and fp not in previous}
+
+            def _process(paragraph):
+                return self._call_ai({**generate_prompt(paragraph, vibe_config, params), "mode": mode}, user_keys, context=context)
+
+            max_workers = get_settings().document_max_concurrency
+            results = {}
+            if pending:
+                with ThreadPoolExecutor(max_workers=min(max_workers, len(pending))) as executor:
+                    results = dict(zip(pending.keys(), executor.map(_process, pending.values())))
+
+            outputs = []
+            current = {}
+            for fp, paragraph in zip(fingerprints, paragraphs):
+                if fp is None:
+                    outputs.append(paragraph)
+                    continue
+                current[fp] = results[fp] if fp in results else previous[fp]
+                outputs.append(convert_case(current[fp], case_style))
+            self.documents.put(document_id, current)
+
+            stats = {
+                "paragraphs": len(current),
+                "processed": len(results),
+                "reused": sum(1 for fp in fingerprints if fp and fp not in results),
+            }
+            return join_paragraphs(outputs, separators), stats
+        except (FileNotFoundError, json.JSONDecodeError) as e:
+            raise ConfigurationError(f"Failed to load or parse mode configuration for '{mode}': {e}")
+        except (DeadlineExceeded, RequestCancelled):
+            raise
+        except Exception as e:
+            raise ValueError(f"Error processing text: {e}")
+
+    def process_markdown(self, text: str, mode: str, case_style: str, target_language: str = None, user_keys: dict = None, context=None, force_translation: bool = False) -> tuple:
+        """
+        Processes a markdown document without sending its structure upstream.
+        Only prose (headings, paragraphs, list items, quotes) is sent, in
+        batched prompts, with code, URLs and link targets masked; case
+        conversion applies to prose only, and everything else is returned
+        byte for byte. Summarize mode summarizes the prose alone. Returns the
+        result and a stats dict.
+        """
+        nodes = parse_markdown(text)
+        prose = prose_nodes(nodes)
+        stats = {
+            "blocks": sum(1 for node in nodes if node.kind != "blank"),
+            "prose_blocks": len(prose),
+            "sent_chars": sum(len(node.masked) for node in prose),
+            "kept_original": 0,
+        }
+        if mode == "summarize":
+            prose_text = "\n\n".join(node.content for node in prose) or text
+            stats["sent_chars"] = len(prose_text)
+            return self.process_text(prose_text, mode, case_style, target_language, user_keys, context=context), stats
+        if not prose:
+            stats["sent_chars"] = 0
+            return text, stats
+
+        try:
+            if self._already_translated("\n\n".join(node.content for node in prose), mode, target_language, force_translation):
+                results = [node.masked for node in prose]
+                stats["sent_chars"] = 0
+            else:
+                results = self._process_prose([node.masked for node in prose], mode, target_language, user_keys, context)
+
+            rendered = {}
+            for node, result in zip(prose, results):
+                cased = convert_case(result.strip(), case_style)
+                if node.restore(cased) is None:
+                    stats["kept_original"] += 1
+                rendered[id(node)] = node.render(cased)
+            if stats["kept_original"]:
+                logger.warning("Markdown blocks kept unchanged: the answer lost or altered placeholders", extra={"blocks": stats["kept_original"]})
+            return "".join(rendered.get(id(node), node.text) for node in nodes), stats
+        except (FileNotFoundError, json.JSONDecodeError) as e:
+            raise ConfigurationError(f"Failed to load or parse mode configuration for '{mode}': {e}")
+        except (DeadlineExceeded, RequestCancelled):
+            raise
+        except Exception as e:
+            raise ValueError(f"Error processing text: {e}")
+
+    def _process_prose(self, texts: list, mode: str, target_language: str = None, user_keys: dict = None, context=None) -> list:
+        """
+        Processes markdown prose nodes, several per tagged prompt up to
+        `MARKDOWN_BATCH_MAX_CHARS`, falling back to one call per node for a
+        batch whose answer cannot be split. Returns one result per text.
+        """
+        config = self._load_mode_config(mode)
+        params = {"target_language": target_language} if target_language else {}
+        settings = get_settings()
+
+        def _process(text):
+            prompt_data = generate_prompt(text, config, params)
+            prompt_data["system"] = f"{prompt_data.get('system', '')}\n\n{MARKDOWN_INSTRUCTIONS}".strip()
+            prompt_data["mode"] = mode
+            return self._call_ai(prompt_data, user_keys, context=context)
+
+        def _process_batch(batch):
+            if len(batch) == 1:
+                return [_process(batch[0])]
+            prompt_data = generate_prompt(format_batch(batch), config, params)
+            prompt_data["system"] = f"{prompt_data.get('system', '')}\n\n{MARKDOWN_INSTRUCTIONS}\n\n{BATCH_INSTRUCTIONS}".strip()
+            prompt_data["mode"] = mode
+            results = split_batch(self._call_ai(prompt_data, user_keys, context=context), len(batch))
+            if results is None:
+                logger.warning("Markdown batch could not be split, processing blocks one by one", extra={"items": len(batch)})
+                results = [_process(text) for text in batch]
+            return results
+
+        batches = batch_texts(texts, settings.markdown_batch_max_chars)
+        with ThreadPoolExecutor(max_workers=min(settings.document_max_concurrency, len(batches))) as executor:
+            return [result for results in executor.map(_process_batch, batches) for result in results]
+
+    def process_bulk(self, texts: list, mode: str, case_style: str, target_language: str = None, user_keys: dict = None, use_batch_api: bool = True, on_status=None, sleep=time.sleep) -> tuple:
+        """
+        Processes many texts as one offline job. Providers with a batch API
+        get every prompt in a discounted asynchronous batch, polled until it
+        finishes; others (or `use_batch_api=False`) get concurrent direct
+        calls. The batch uses the model tier of the longest text. Returns one
+        `{"text": str}` or `{"error": str}` per text, in order, and a stats dict.
+        `on_status` is called with the batch state after every poll.
+        """
+        from core.bulk import run_batch_job, run_direct
+
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown mode '{mode}'. Supported: {list(self.MODES)}")
+        if mode == "translate" and not target_language:
+            raise ValueError("target_language is required when mode is 'translate'")
+        try:
+            config = self._load_mode_config(mode)
+        except (FileNotFoundError, json.JSONDecodeError) as e:
+            raise ConfigurationError(f"Failed to load or parse mode configuration for '{mode}': {e}")
+
+        settings = get_settings()
+        params = {"target_language": target_language} if target_language else {}
+        prompts = [{**generate_prompt(text, config, params), "mode": mode} for text in texts]
+        started = time.perf_counter()
+        provider = self._get_provider(user_keys, mode, max(texts, key=len)) if texts else None
+
+        batches = []
+        if provider is not None and use_batch_api and provider.SUPPORTS_BATCH:
+            results, batches = run_batch_job(
+                provider,
+                prompts,
+                poll_seconds=settings.bulk_poll_seconds,
+                max_poll_seconds=settings.bulk_poll_max_seconds,
+                timeout_seconds=settings.bulk_timeout_hours * 3600,
+                on_status=on_status,
+                sleep=sleep,
+            )
+        else:
+            results = run_direct(lambda prompt: self._call_ai(prompt, user_keys), prompts, settings.bulk_max_concurrency)
+
+        for result in results:
+            if "text" in result:
+                result["text"] = convert_case(result["text"], case_style)
+        stats = {
+            "texts": len(texts),
+            "succeeded": sum(1 for result in results if "text" in result),
+            "failed": sum(1 for result in results if "error" in result),
+            "method": "batch" if batches else "direct",
+            "batch_ids": [batch["id"] for batch in batches],
+            "duration_s": round(time.perf_counter() - started, 2),
+        }
+        logger.info("Bulk job finished", extra=stats)
+        return results, stats
+
+    def translate_many(self, text: str, target_languages: list, case_style: str, user_keys: dict = None, strategy: str = "parallel", context=None, force_translation: bool = False) -> tuple:
+        """
+        Translates `text` into several languages in one call.
+
+        With the "parallel" strategy each language is a separate upstream call,
+        run concurrently under TRANSLATE_MAX_CONCURRENCY. With "combined", short
+        inputs are translated into all languages by a single structured-output
+        prompt; any language missing from that answer falls back to its own
+        call. Returns `(results, errors)`, both keyed by target language, so one
+        failing language does not fail the batch.
+        """
+        languages = []
+        for language in target_languages:
+            language = language.strip()
+            if language and language.lower() not in (l.lower() for l in languages):
+                languages.append(language)
+
+        results, errors = {}, {}
+        max_combined = get_settings().translate_combined_max_chars
+        if strategy == "combined" and len(languages) > 1 and len(text) <= max_combined:
+            try:
+                combined = self._translate_combined(text, languages, user_keys, context=context)
+                for language in languages:
+                    if language in combined:
+                        results[language] = convert_case(combined[language], case_style)
+            except Exception:
+                # Fall back to one call per language below.
+                results = {}
+
+        remaining = [language for language in languages if language not in results]
+        if remaining:
+            def _translate(language):
+                try:
+                    return language, self.process_text(text, "translate", case_style, language, user_keys, context=context, force_translation=force_translation), None
+                except Exception as e:
+                    return language, None, str(e)
+
+            max_workers = get_settings().translate_max_concurrency
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(remaining))) as executor:
+                for language, translated, error in executor.map(_translate, remaining):
+                    if error is None:
+                        results[language] = translated
+                    else:
+                        errors[language] = error
+
+        return results, errors
+
+    def _translate_combined(self, text: str, languages: list, user_keys: dict = None, context=None) -> dict:
+        """
+        Asks for all translations in one prompt and parses the JSON object
+        answer. Returns only the languages present in the answer.
+        """
+        config = self._load_mode_config("translate")
+        multi_config = {"system": config["multi_system"], "template": config["multi_template"]}
+        prompt_data = {**generate_prompt(text, multi_config, {"target_languages": ", ".join(languages)}), "mode": "translate"}
+        answer = self._call_ai(prompt_data, user_keys, context=context)
+
+        # Tolerate code fences or stray text around the JSON object.
+        start, end = answer.find("{"), answer.rfind("}")
+        if start < 0 or end < start:
+            raise ValueError("Combined translation answer does not contain a JSON object.")
+        parsed = json.loads(answer[start:end + 1])
+
+        by_name = {str(key).strip().lower(): value for key, value in parsed.items()}
+        return {
+            language: by_name[language.lower()].strip()
+            for language in languages
+            if isinstance(by_name.get(language.lower()), str) and by_name[language.lower()].strip()
+        }
+
+    def translate_with_memory(self, text: str, target_language: str, case_style: str, user_keys: dict = None, context=None, namespace: str = "") -> tuple:
+        """
+        Translates `text` sentence by sentence through the translation memory.
+        Sentences translated before (into the same language, for the same
+        namespace) are filled from the memory; the rest are sent upstream in
+        one tagged prompt, with similar earlier translations as hints when
+        TM_FUZZY_HINTS is on, and stored for next time. Returns the
+        case-converted text and hit statistics.
+        """
+        from core.translation_memory import normalize_segment, split_segments
+
+        memory = self.translation_memory
+        try:
+            segments, separators = split_segments(text)
+            keys = [normalize_segment(segment) for segment in segments]
+            exact = memory.lookup(segments, target_language, namespace)
+            pending = list(dict.fromkeys(key for key in keys if key and key not in exact))
+
+            hints = []
+            fuzzy_hits = 0
+            settings = get_settings()
+            if pending and settings.tm_fuzzy_hints:
+                max_hints = settings.tm_max_hints
+                for segment in pending:
+                    matches = memory.fuzzy(segment, target_language, namespace)
+                    fuzzy_hits += bool(matches)
+                    hints.extend((source, target) for source, target, _ in matches if (source, target) not in hints)
+                hints = hints[:max_hints]
+
+            translated = self._translate_segments(pending, target_language, hints, user_keys, context=context) if pending else {}
+            memory.store(translated, target_language, namespace)
+
+            outputs = [exact.get(key) or translated.get(key) or segment for key, segment in zip(keys, segments)]
+            filled = sum(1 for key in keys if key in exact)
+            total = sum(1 for key in keys if key)
+            stats = {
+                "segments": total,
+                "exact_hits": filled,
+                "fuzzy_hits": fuzzy_hits,
+                "translated": len(pending),
+                "hit_rate": round(filled / total, 3) if total else 0.0,
+            }
+            return convert_case(join_paragraphs(outputs, separators), case_style), stats
+        except (FileNotFoundError, json.JSONDecodeError) as e:
+            raise ConfigurationError(f"Failed to load or parse mode configuration for 'translate': {e}")
+        except (DeadlineExceeded, RequestCancelled):
+            raise
+        except Exception as e:
+            raise ValueError(f"Error processing text: {e}")
+
+    def _translate_segments(self, segments: list, target_language: str, hints: list, user_keys: dict = None, context=None) -> dict:
+        """
+        Translates sentences in one tagged prompt, falling back to one call
+        per sentence if the answer cannot be split. Returns `source -> target`.
+        """
+        from core.translation_memory import HINT_INSTRUCTIONS
+
+        config = self._load_mode_config("translate")
+        params = {"target_language": target_language}
+        hint_text = ""
+        if hints:
+            hint_text = "\n\n" + HINT_INSTRUCTIONS + "\n" + "\n".join(f"- {source} => {target}" for source, target in hints)
+
+        if len(segments) > 1:
+            prompt_data = generate_prompt(format_batch(segments), config, params)
+            prompt_data["system"] = f"{prompt_data.get('system', '')}{hint_text}\n\n{BATCH_INSTRUCTIONS}".strip()
+            prompt_data["mode"] = "translate"
+            results = split_batch(self._call_ai(prompt_data, user_keys, context=context), len(segments))
+            if results is not None:
+                return dict(zip(segments, results))
+            logger.warning("Translation memory batch could not be split, translating sentences one by one", extra={"items": len(segments)})
+
+        def _translate(segment):
+            prompt_data = generate_prompt(segment, config, params)
+            prompt_data["system"] = f"{prompt_data.get('system', '')}{hint_text}".strip()
+            prompt_data["mode"] = "translate"
+            return self._call_ai(prompt_data, user_keys, context=context).strip()
+
+        max_workers = get_settings().document_max_concurrency
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(segments))) as executor:
+            return dict(zip(segments, executor.map(_translate, segments)))
+
+    def _supports_fusion(self, user_keys: dict = None) -> bool:
+        """Whether the request's provider accepts fused pipeline prompts."""
+        provider_name = (user_keys or {}).get("provider") or get_settings().api_provider
+        if provider_name not in self.PROVIDER_CLASSES:
+            return False
+        return getattr(self._get_provider_class(provider_name), "SUPPORTS_FUSED_PROMPTS", False)
+
+    def _plan_pipeline(self, text: str, steps: list, target_language: str, fuse: bool, force_translation: bool) -> list:
+        """
+        Groups pipeline steps into calls. A step is fused with the one before
+        it when its mode config has a `fused` prompt for that mode (e.g.
+        translate absorbs grammar). A translate step is not fused if the input
+        is already in the target language, so it can be skipped on its own.
+        """
+        groups = []
+        i = 0
+        while i < len(steps):
+            if fuse and i + 1 < len(steps):
+                fused = self._load_mode_config(steps[i + 1]).get("fused", {})
+                skip_translate = i == 0 and self._already_translated(text, steps[i + 1], target_language, force_translation)
+                if steps[i] in fused and not skip_translate:
+                    groups.append([steps[i], steps[i + 1]])
+                    i += 2
+                    continue
+            groups.append([steps[i]])
+            i += 1
+        return groups
+
+    def run_pipeline(self, text: str, steps: list, case_style: str, target_language: str = None, user_keys: dict = None, context=None, fuse: bool = True, force_translation: bool = False) -> tuple:
+        """
+        Runs several modes back to back (e.g. grammar then translate), feeding
+        each step's raw output to the next and applying `case_style` once at
+        the end. Where the provider allows it, compatible adjacent steps are
+        fused into one prompt, saving a round trip. Returns the final text and
+        one stats dict per call: its `modes`, whether it was `fused` or
+        `skipped`, and `duration_ms`.
+        """
+        if not steps or len(steps) > self.MAX_PIPELINE_STEPS:
+            raise ValueError(f"A pipeline must have between 1 and {self.MAX_PIPELINE_STEPS} steps.")
+        unknown = [step for step in steps if step not in self.MODES]
+        if unknown:
+            raise ValueError(f"Unknown pipeline steps: {unknown}. Supported: {list(self.MODES)}")
+        if "translate" in steps and not target_language:
+            raise ValueError("target_language is required when the pipeline includes 'translate'")
+
+        try:
+            fuse = fuse and len(steps) > 1 and self._supports_fusion(user_keys)
+            params = {"target_language": target_language} if target_language else {}
+            current = text
+            stats = []
+            for group in self._plan_pipeline(text, steps, target_language, fuse, force_translation):
+                started = time.perf_counter()
+                if len(group) == 1 and self._already_translated(current, group[0], target_language, force_translation):
+                    stats.append({"modes": group, "fused": False, "skipped": True, "duration_ms": 0.0})
+                    continue
+                if "summarize" in group:
+                    current = self.compress_input(current, "summarize", context)
+                config = self._load_mode_config(group[-1])
+                if len(group) > 1:
+                    config = config["fused"][group[0]]
+                prompt_data = {**generate_prompt(current, config, params), "mode": group[-1]}
+                current = self._call_ai(prompt_data, user_keys, context=context).strip()
+                stats.append({
+                    "modes": group,
+                    "fused": len(group) > 1,
+                    "skipped": False,
+                    "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+                })
+            return convert_case(current, case_style), stats
+        except (FileNotFoundError, json.JSONDecodeError) as e:
+            raise ConfigurationError(f"Failed to load or parse mode configuration: {e}")
+        except (DeadlineExceeded, RequestCancelled):
+            raise
+        except Exception as e:
+            raise ValueError(f"Error processing text: {e}")
@@ -3,11 +3,20 @@ Writon CLI - AI-powered text formatter
 """
 
 import os
-from datetime import datetime
-from core.writon import WritonCore
+import time
 import argparse
 import sys
 
+# ANSI escape codes for colors
+GREEN = "\033[92m"
+BLUE = "\033[94m"
+YELLOW = "\033[93m"
+ENDC = "\033[0m"
+RED = "\033[91m"
+
+MODES = ("grammar", "translate", "summarize")
+CASE_STYLES = ("lower", "sentence", "title", "upper")
+
 
 def safe_input(prompt):
     """
@@ -20,13 +29,362 @@ def safe_input(prompt):
         exit(0)
 
 
+def configure_cli_logging():
+    """
+    Sends log records to stderr as text: DEBUG with DEBUG_MODE=true, else
+    warnings only. Loads the settings snapshot (and .env) first.
+    """
+    from core.log import configure_logging
+    from core.settings import get_settings
+
+    configure_logging(fmt="text", level="DEBUG" if get_settings().debug_mode else "WARNING")
+
+
+def open_history():
+    """Opens the local result history at HISTORY_DB_PATH."""
+    from core.history import HistoryStore
+    from core.settings import get_settings
+
+    return HistoryStore(get_settings().history_db_path)
+
+
+def run_history_command(args):
+    """Runs the --history-* commands, which work without an AI provider."""
+    history = open_history()
+    try:
+        if args.history_import:
+            imported = 0
+            for name in sorted(os.listdir(args.history_import)):
+                if history.import_legacy_file(os.path.join(args.history_import, name)) is not None:
+                    imported += 1
+            print(f"Imported {imported} result file(s) into {history.path}")
+
+        if args.history_search:
+            results = history.search(args.history_search)
+            if not results:
+                print("No matching results.")
+            for row in results:
+                target = f" -> {row['target_language']}" if row["target_language"] else ""
+                print(f"#{row['id']} {row['created_at']} {row['mode']}{target} ({row['provider'] or 'unknown'})")
+                print(f"   {row['original'][:100]!r}")
+                print(f"   {row['output'][:100]!r}")
+
+        if args.history_export:
+            if args.history_export == "-":
+                history.export_jsonl(sys.stdout)
+            else:
+                with open(args.history_export, "w", encoding="utf-8") as f:
+                    count = history.export_jsonl(f)
+                print(f"Exported {count} result(s) to {args.history_export}")
+    finally:
+        history.close()
+
+
+def process_with_history(core, history, args, raw_text, mode, case_style, target_language=None):
+    """
+    Processes `raw_text`, serving an exact repeat from the history unless
+    --no-cache is given and recording new results unless --no-history is.
+    Returns `(output, cached_row, result_id, duration_ms)`.
+    """
+    try:
+        provider, model = core.provider_identity(mode=mode, text=raw_text)
+    except Exception:
+        # process_text reports configuration problems itself.
+        from core.settings import get_settings
+
+        provider, model = get_settings().api_provider, None
+
+    settings = dict(mode=mode, case_style=case_style, target_language=target_language, provider=provider, model=model)
+    cached = history.lookup(raw_text, **settings) if history and not args.no_cache else None
+    if cached:
+        return cached["output"], cached, None, None
+
+    started = time.perf_counter()
+    output = core.process_text(text=raw_text, mode=mode, case_style=case_style, target_language=target_language)
+    duration_ms = round((time.perf_counter() - started) * 1000, 2)
+
+    result_id = None
+    if history and not args.no_history:
+        result_id = history.record(raw_text, output, duration_ms=duration_ms, **settings)
+    return output, None, result_id, duration_ms
+
+
+SESSION_HELP = f"""{BLUE}Type or paste text to process it with the current settings.{ENDC}
+  {YELLOW}:mode grammar|translate|summarize [language]{ENDC}  switch mode
+  {YELLOW}:lang <language>{ENDC}                              set the translation target
+  {YELLOW}:case lower|sentence|title|upper{ENDC}              set the case style
+  {YELLOW}:paste{ENDC}      enter several lines; finish with a line containing only "." or Ctrl+D
+  {YELLOW}:settings{ENDC}   show the current settings
+  {YELLOW}:help{ENDC}       show this help
+  {YELLOW}:quit{ENDC}       end the session (or Ctrl+D)"""
+
+
+class CliSession:
+    """
+    State of an interactive `writon --session`: the current mode, case and
+    target language, plus the latency of every call made so far.
+    """
+
+    def __init__(self, mode: str = "grammar", case_style: str = "sentence", target_language: str = None):
+        self.mode = mode
+        self.case_style = case_style
+        self.target_language = target_language
+        self.latencies = []
+
+    @property
+    def prompt(self) -> str:
+        target = f" -> {self.target_language}" if self.mode == "translate" and self.target_language else ""
+        return f"{GREEN}writon [{self.mode}{target}, {self.case_style}]>{ENDC} "
+
+    def describe(self) -> str:
+        target = f", target {self.target_language}" if self.target_language else ""
+        return f"mode {self.mode}, case {self.case_style}{target}"
+
+    def command(self, line: str) -> str:
+        """
+        Applies a `:command` line and returns the message to show. Raises
+        ValueError for an unknown command or invalid value.
+        """
+        name, _, value = line[1:].strip().partition(" ")
+        name, value = name.lower(), value.strip()
+        if name == "mode":
+            mode, _, language = value.partition(" ")
+            if mode.lower() not in MODES:
+                raise ValueError(f"Unknown mode '{mode}'. Choose from: {', '.join(MODES)}.")
+            self.mode = mode.lower()
+            if language.strip():
+                self.target_language = language.strip()
+        elif name in ("lang", "language"):
+            if not value:
+                raise ValueError("Give a target language, e.g. ':lang Spanish'.")
+            self.target_language = value
+        elif name == "case":
+            if value.lower() not in CASE_STYLES:
+                raise ValueError(f"Unknown case style '{value}'. Choose from: {', '.join(CASE_STYLES)}.")
+            self.case_style = value.lower()
+        elif name in ("settings", "show"):
+            return f"{BLUE}Current settings: {self.describe()}.{ENDC}"
+        elif name in ("help", "?"):
+            return SESSION_HELP
+        else:
+            raise ValueError(f"Unknown command ':{name}'. Type :help for the list.")
+        return f"{BLUE}Now using {self.describe()}.{ENDC}"
+
+    def latency_summary(self) -> str:
+        if not self.latencies:
+            return "No texts processed."
+        first, warm = self.latencies[0], sorted(self.latencies[1:])
+        summary = f"{len(self.latencies)} text(s) processed; first call {first:.0f} ms"
+        if warm:
+            summary += f", median after that {warm[len(warm) // 2]:.0f} ms"
+        return summary
+
+
+def read_session_line(prompt: str):
+    """Reads one line; returns None on Ctrl+D and "" when Ctrl+C clears the line."""
+    try:
+        return input(prompt)
+    except EOFError:
+        return None
+    except KeyboardInterrupt:
+        print()
+        return ""
+
+
+def read_paste() -> str:
+    """Reads lines until one containing only "." or Ctrl+D, and joins them."""
+    print(f"{BLUE}Paste your text; finish with a line containing only \".\" or Ctrl+D.{ENDC}")
+    lines = []
+    while True:
+        try:
+            line = input()
+        except EOFError:
+            break
+        if line.strip() == ".":
+            break
+        lines.append(line)
+    return "\n".join(lines).strip()
+
+
+def run_session(args):
+    """
+    Runs the interactive session: one WritonCore and one set of pooled
+    upstream connections serve every text, so only the first call pays for
+    imports and the TLS handshake.
+    """
+    import threading
+
+    from core.writon import WritonCore
+
+    configure_cli_logging()
+    core = WritonCore()
+    history = None if args.no_history and args.no_cache else open_history()
+    session = CliSession()
+
+    try:
+        provider, _ = core.provider_identity()
+        # Open the upstream connection while the user types the first text.
+        threading.Thread(target=core.warm_up, args=([provider],), daemon=True).start()
+    except Exception as e:
+        print(f"{RED}Warning: {e}{ENDC}")
+
+    print(f"{BLUE}Writon session ({session.describe()}). Type :help for commands, :quit or Ctrl+D to exit.{ENDC}")
+    try:
+        while True:
+            line = read_session_line(session.prompt)
+            if line is None or line.strip().lower() in (":quit", ":q", ":exit"):
+                break
+            line = line.strip()
+            if not line:
+                continue
+            if line.lower() == ":paste":
+                line = read_paste()
+                if not line:
+                    continue
+            elif line.startswith(":"):
+                try:
+                    print(session.command(line))
+                except ValueError as e:
+                    print(f"{RED}{e}{ENDC}")
+                continue
+
+            if session.mode == "translate" and not session.target_language:
+                print(f"{RED}Set a target language first, e.g. ':lang Spanish'.{ENDC}")
+                continue
+
+            try:
+                output, cached, _, duration_ms = process_with_history(
+                    core, history, args, line, session.mode, session.case_style, session.target_language
+                )
+            except KeyboardInterrupt:
+                print(f"\n{RED}Cancelled.{ENDC}")
+                continue
+            except ValueError as e:
+                print(f"{RED}Error: {e}{ENDC}")
+                continue
+            except Exception as e:
+                print(f"{RED}An unexpected error occurred: {e}{ENDC}")
+                continue
+
+            print(output)
+            if cached:
+                print(f"{BLUE}(from history #{cached['id']}){ENDC}")
+            else:
+                session.latencies.append(duration_ms)
+                print(f"{BLUE}({duration_ms:.0f} ms){ENDC}")
+    finally:
+        if history:
+            history.close()
+    print(f"\n{session.latency_summary()}\nGoodbye!")
+
+
+def read_bulk_inputs(path: str) -> list:
+    """
+    Reads the texts of a bulk job: one per line, or the `text` field of each
+    line for a `.jsonl` file. Blank lines are skipped.
+    """
+    import json
+
+    with open(path, encoding="utf-8") as f:
+        lines = [line.rstrip("\n") for line in f if line.strip()]
+    if path.endswith(".jsonl"):
+        return [json.loads(line)["text"] for line in lines]
+    return lines
+
+
+def run_bulk(args):
+    """
+    Runs a bulk job: every input goes through the provider's batch API (or
+    concurrent direct calls), and the results are written as JSON Lines in
+    input order, one `{"index", "input", "text" | "error"}` object per text.
+    """
+    import json
+
+    from core.writon import WritonCore
+
+    if args.mode == "translate" and not args.lang:
+        print(f"{RED}--lang is required for translate bulk jobs.{ENDC}", file=sys.stderr)
+        sys.exit(2)
+    configure_cli_logging()
+    texts = read_bulk_inputs(args.bulk)
+
+    def on_status(batch):
+        counts = batch["counts"]
+        progress = f"{counts['succeeded'] or 0}/{counts['total']}" if counts.get("total") else "pending"
+        print(f"{BLUE}Batch {batch['id']}: {batch['status']} ({progress}){ENDC}", file=sys.stderr)
+
+    print(f"{BLUE}Processing {len(texts)} text(s) in {args.mode} mode...{ENDC}", file=sys.stderr)
+    try:
+        results, stats = WritonCore().process_bulk(
+            texts, args.mode, args.case, target_language=args.lang, use_batch_api=not args.bulk_direct, on_status=on_status
+        )
+    except Exception as e:
+        print(f"{RED}Bulk job failed: {e}{ENDC}", file=sys.stderr)
+        sys.exit(1)
+
+    output = sys.stdout if args.bulk_output == "-" else open(args.bulk_output, "w", encoding="utf-8")
+    try:
+        for index, (text, result) in enumerate(zip(texts, results)):
+            output.write(json.dumps({"index": index, "input": text, **result}, ensure_ascii=False) + "\n")
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    print(
+        f"{GREEN}Done via {stats['method']} calls in {stats['duration_s']:.1f}s: "
+        f"{stats['succeeded']} succeeded, {stats['failed']} failed.{ENDC}",
+        file=sys.stderr,
+    )
+
+
 def main():
-    # ANSI escape codes for colors
-    GREEN = "\033[92m"
-    BLUE = "\033[94m"
-    YELLOW = "\033[93m"
-    ENDC = "\033[0m"
-    RED = "\033[91m"
+    # Parse arguments before printing anything so `--version` stays instant
+    parser = argparse.ArgumentParser(description="Writon CLI - AI-powered text processor")
+    parser.add_argument(
+        "-v", "--version", action="version", version=f"%(prog)s 0.1.0" # Use the version from pyproject.toml
+    )
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="Report the import-time cost of each module on the CLI start path and exit",
+    )
+    parser.add_argument(
+        "-s",
+        "--session",
+        action="store_true",
+        help="Start an interactive session that processes many texts with one warm connection",
+    )
+    history_group = parser.add_argument_group("history")
+    history_group.add_argument("--history-search", metavar="QUERY", help="Search past results and exit")
+    history_group.add_argument("--history-export", metavar="FILE", help="Export all past results as JSON Lines ('-' for stdout) and exit")
+    history_group.add_argument("--history-import", metavar="DIR", help="Import result files saved by earlier versions (e.g. output/) and exit")
+    history_group.add_argument("--no-history", action="store_true", help="Do not record this result in the history")
+    history_group.add_argument("--no-cache", action="store_true", help="Always call the AI provider, even for a repeated input")
+    bulk_group = parser.add_argument_group("bulk jobs")
+    bulk_group.add_argument("--bulk", metavar="FILE", help="Process every line of FILE (or the 'text' field of each .jsonl line) as one offline job and exit")
+    bulk_group.add_argument("--bulk-output", metavar="FILE", default="-", help="Write bulk results as JSON Lines to FILE (default: stdout)")
+    bulk_group.add_argument("--bulk-direct", action="store_true", help="Use concurrent direct calls instead of the provider's batch API")
+    bulk_group.add_argument("--mode", choices=MODES, default="grammar", help="Processing mode for --bulk (default: grammar)")
+    bulk_group.add_argument("--case", choices=CASE_STYLES, default="sentence", help="Case style for --bulk (default: sentence)")
+    bulk_group.add_argument("--lang", help="Target language for --bulk translate jobs")
+    args = parser.parse_args() # Use parse_args() directly as we want it to exit if version is requested
+
+    if args.profile_startup:
+        from core.startup import CLI_MODULES, profile_imports, format_import_profile
+
+        print(format_import_profile(profile_imports(CLI_MODULES)))
+        return
+
+    if args.history_search or args.history_export or args.history_import:
+        run_history_command(args)
+        return
+
+    if args.session:
+        run_session(args)
+        return
+
+    if args.bulk:
+        run_bulk(args)
+        return
 
     # Display the professional logo and introduction
     print("███          █████   ███   █████            ███   █████                             █████████  █████       █████")
@@ -45,20 +403,11 @@ def main():
         f"{BLUE}It's a clean, fast, and reliable tool that transforms your text while preserving your intent and applying consistent case formatting.{ENDC}"
     )
 
-    # --- New argument parsing logic ---
-    parser = argparse.ArgumentParser(description="Writon CLI - AI-powered text processor")
-    parser.add_argument(
-        "-v", "--version", action="version", version=f"%(prog)s 0.1.0" # Use the version from pyproject.toml
-    )
-    args = parser.parse_args() # Use parse_args() directly as we want it to exit if version is requested
-
-    # --- End of new argument parsing logic ---
-
     print("\n" + "How to use Writon:")
     print(f"1. {YELLOW}Enter your text when prompted.{ENDC}")
     print(f"2. {YELLOW}Select a processing mode and case style.{ENDC}")
     print(f"3. {YELLOW}Confirm to process the text with AI.{ENDC}")
-    print(f"4. {YELLOW}Optionally save the result to a file.{ENDC}")
+    print(f"4. {YELLOW}The result is saved to your local history; find past results with --history-search.{ENDC}")
     print(f"\n{BLUE}To exit at any time, press Ctrl+C or Ctrl+D.{ENDC}")
 
     # Input validation
@@ -174,52 +523,32 @@ def main():
 
     # Process with AI
     print("\n" + f"{BLUE}Processing with AI...{ENDC}")
+    # Imported here so the banner and prompts appear without waiting on provider dependencies
+    from core.writon import WritonCore
+
+    configure_cli_logging()
     core = WritonCore()
+    history = None if args.no_history and args.no_cache else open_history()
     try:
-        final_output = core.process_text(
-            text=raw_text,
-            mode=selected_mode,
-            case_style=case_style,
-            target_language=target_language,
+        final_output, cached, result_id, _ = process_with_history(
+            core, history, args, raw_text, selected_mode, case_style, target_language
         )
 
         print("\n" + f"{GREEN}Formatted text:{ENDC}")
         print(final_output)
 
-        # Ask if user wants to save to file
-        save = safe_input(f"\n{GREEN}> Save to file? (y/n):{ENDC} ").strip().lower()
-        if save in ["y", "yes"]:
-            output_dir = "output"
-            if not os.path.exists(output_dir):
-                os.makedirs(output_dir)
-
-            # Auto-generate filename
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            mode_short = {"grammar": "gram", "translate": "trans", "summarize": "summ"}
-
-            if selected_mode == "translate" and target_language:
-                clean_target = target_language.lower().replace(" ", "_")
-                filename = f"{mode_short[selected_mode]}_{clean_target}_{timestamp}.txt"
-            else:
-                filename = f"{mode_short[selected_mode]}_{timestamp}.txt"
-
-            filepath = os.path.join(output_dir, filename)
-
-            try:
-                with open(filepath, "w", encoding="utf-8") as f:
-                    provider = os.getenv("API_PROVIDER", "not_configured")
-                    stats = f"""--- Original Text ---\n{raw_text}\n\n--- Processed Text ---\n{final_output}\n\n--- Stats ---\nMode: {selected_mode}\nCase Style: {case_style}\nAI Provider: {provider}\nOriginal Character Count: {len(raw_text)}
-Processed Character Count: {len(final_output)}
-Original Word Count: {len(raw_text.split())}\nProcessed Word Count: {len(final_output.split())}"""
-                    f.write(stats)
-                print(f"{GREEN}Saved to {filepath}{ENDC}")
-            except Exception as e:
-                print(f"{RED}Failed to save file: {e}{ENDC}")
+        if cached:
+            print(f"\n{BLUE}Served from history (#{cached['id']}, {cached['created_at']}); use --no-cache to process again.{ENDC}")
+        elif result_id is not None:
+            print(f"\n{BLUE}Saved to history (#{result_id}). Search with --history-search, export with --history-export.{ENDC}")
 
     except ValueError as e:
         print(f"\n{RED}Error: {e}{ENDC}")
     except Exception as e:
         print(f"\n{RED}An unexpected error occurred: {e}{ENDC}")
+    finally:
+        if history:
+            history.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,230 @@
+"""
+Writon production server.
+
+Runs the Writon API behind a small pre-forking supervisor: the application
+modules and mode configurations are loaded once in the master process, the
+listening socket is bound once, and then the requested number of Uvicorn
+workers are forked to share it. Each worker warms up its own pooled upstream
+connections (see the API lifespan) before it starts accepting traffic.
+
+On SIGTERM/SIGINT the master forwards the signal to every worker. Workers
+stop accepting new connections, report not-ready on /ready, and let in-flight
+requests (including upstream LLM calls) finish before exiting.
+
+The master exits non-zero if any worker exited abnormally, including workers
+killed because they did not drain within the graceful timeout.
+
+On SIGHUP the master reloads its settings (so workers it forks later start
+with them) and forwards the signal, and every worker swaps in a new settings
+snapshot without restarting.
+"""
+
+import argparse
+import os
+import signal
+import socket
+import sys
+import time
+
+from core.log import configure_logging, get_logger
+from core.settings import get_settings
+
+logger = get_logger("serve")
+
+
+def default_workers() -> int:
+    """Reads the worker count from WEB_CONCURRENCY, defaulting to the CPU count."""
+    return get_settings().web_concurrency or max(1, os.cpu_count() or 1)
+
+
+def parse_args(argv=None):
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="Writon production API server")
+    parser.add_argument("--host", default=settings.host, help="Interface to bind")
+    parser.add_argument("--port", type=int, default=settings.port, help="Port to bind")
+    parser.add_argument("-w", "--workers", type=int, default=default_workers(), help="Number of worker processes")
+    parser.add_argument(
+        "--graceful-timeout",
+        type=float,
+        default=settings.graceful_timeout_seconds,
+        help="Seconds a draining worker waits for in-flight requests before exiting",
+    )
+    parser.add_argument("--backlog", type=int, default=2048, help="Listen backlog for the shared socket")
+    parser.add_argument(
+        "--log-level",
+        default=(settings.log_level or ("debug" if settings.debug_mode else "info")).lower(),
+        help="Uvicorn log level",
+    )
+    return parser.parse_args(argv)
+
+
+def preload():
+    """
+    Imports the application and provider clients and loads mode configurations
+    in the master, so forked workers inherit them instead of repeating the work. No upstream
+    connections are opened here; those must not be shared across forks.
+    """
+    import api
+
+    api.core.preload_modes()
+    api.core.preload_providers()
+    return api.app
+
+
+def bind_socket(host: str, port: int, backlog: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app, sock: socket.socket, args) -> None:
+    """Runs a single Uvicorn server on the shared, already-bound socket."""
+    import uvicorn
+
+    class DrainingServer(uvicorn.Server):
+        def handle_exit(self, sig, frame):
+            # Flip readiness first so load balancers stop routing here while
+            # in-flight requests are allowed to finish.
+            app.state.draining = True
+            super().handle_exit(sig, frame)
+
+    config = uvicorn.Config(
+        app,
+        log_level=args.log_level,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        # The API emits its own structured per-request log records.
+        access_log=False,
+        proxy_headers=True,
+        forwarded_allow_ips="*",
+    )
+    DrainingServer(config).run(sockets=[sock])
+
+
+class Supervisor:
+    """Forks workers, restarts crashed ones, and forwards shutdown and reload signals."""
+
+    def __init__(self, app, sock, args):
+        self.app = app
+        self.sock = sock
+        self.args = args
+        self.workers = {}
+        self.stopping = False
+        self.failed_workers = 0
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            # The API lifespan installs the reload handler; until then a SIGHUP must not kill the worker.
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+            code = 1
+            try:
+                run_worker(self.app, self.sock, self.args)
+                code = 0
+            except SystemExit as e:
+                code = e.code if isinstance(e.code, int) else 1
+            except BaseException:
+                logger.exception("Worker failed")
+            finally:
+                os._exit(code)
+        self.workers[pid] = time.monotonic()
+        logger.info("Started worker", extra={"pid": pid})
+
+    def stop(self, signum, frame):
+        if self.stopping:
+            return
+        self.stopping = True
+        logger.info("Received shutdown signal, draining workers", extra={"signal": signum, "workers": len(self.workers)})
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def reload(self, signum, frame):
+        from core.settings import reload_settings
+        from core.writon import ConfigurationError
+
+        try:
+            _, changed = reload_settings()
+        except ConfigurationError as e:
+            logger.error("Settings reload failed; workers keep their settings", extra={"error": str(e)})
+            return
+        logger.info("Reloading settings in workers", extra={"changed": changed, "workers": len(self.workers)})
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGHUP)
+            except ProcessLookupError:
+                pass
+
+    def run(self) -> int:
+        """Runs until every worker has stopped; returns the master's exit status."""
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGHUP, self.reload)
+        for _ in range(self.args.workers):
+            self.spawn()
+
+        deadline = None
+        while self.workers:
+            if self.stopping and deadline is None:
+                deadline = time.monotonic() + self.args.graceful_timeout + 5
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                if deadline is not None and time.monotonic() > deadline:
+                    for pid in list(self.workers):
+                        logger.warning("Worker did not drain in time, killing it", extra={"pid": pid})
+                        os.kill(pid, signal.SIGKILL)
+                    deadline = float("inf")
+                time.sleep(0.2)
+                continue
+
+            started = self.workers.pop(pid, None)
+            exit_code = os.waitstatus_to_exitcode(status)
+            if exit_code != 0:
+                self.failed_workers += 1
+            if self.stopping or started is None:
+                if exit_code != 0:
+                    logger.warning("Worker exited abnormally while draining", extra={"pid": pid, "exit_code": exit_code})
+                continue
+            logger.warning("Worker exited, restarting", extra={"pid": pid, "exit_code": exit_code})
+            if time.monotonic() - started < 1:
+                # Avoid a tight crash loop when a worker cannot even start.
+                time.sleep(1)
+            self.spawn()
+        if self.failed_workers:
+            logger.error("All workers stopped; some exited abnormally", extra={"failed_workers": self.failed_workers})
+            return 1
+        logger.info("All workers stopped")
+        return 0
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_logging(level=args.log_level)
+
+    if get_settings().profile_startup:
+        from core.startup import API_MODULES, profile_imports, format_import_profile
+
+        logger.info("Import-time profile:\n" + format_import_profile(profile_imports(API_MODULES)))
+
+    app = preload()
+    sock = bind_socket(args.host, args.port, args.backlog)
+    logger.info("🚀 Serving Writon", extra={"host": args.host, "port": args.port, "workers": args.workers})
+
+    if args.workers == 1 or not hasattr(os, "fork"):
+        run_worker(app, sock, args)
+        return 0
+    return Supervisor(app, sock, args).run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
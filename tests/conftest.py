@@ -0,0 +1,11 @@
+import pytest
+
+from core.settings import reset_settings
+
+
+@pytest.fixture(autouse=True)
+def fresh_settings():
+    """Rebuilds the settings snapshot from the environment for every test, so `monkeypatch.setenv` applies."""
+    reset_settings()
+    yield
+    reset_settings()
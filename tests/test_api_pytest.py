@@ -100,4 +100,473 @@ def test_byok_headers(provider, mocker):
     user_keys_arg = call_args.get('user_keys', {})
     
     assert user_keys_arg.get("provider") == provider
-    assert user_keys_arg.get(f"{provider}_key") == "test-key-1234"
\ No newline at end of file
+    assert user_keys_arg.get(f"{provider}_key") == "test-key-1234"
+
+# --- Readiness and Warm-up ---
+
+def test_ready_before_startup():
+    """Tests that /ready reports not-ready until warm-up has run."""
+    response = client.get("/ready")
+    assert response.status_code == 503
+    assert response.json()["ready"] is False
+
+def test_ready_after_warm_up(mocker, monkeypatch):
+    """Tests that the lifespan warms up connections and then reports ready."""
+    monkeypatch.setenv("WARMUP_PROVIDERS", "groq")
+    mock_warm_up = mocker.patch("api.core.warm_up", return_value={"groq": True})
+
+    with TestClient(app) as warm_client:
+        response = warm_client.get("/ready")
+
+    mock_warm_up.assert_called_once()
+    assert mock_warm_up.call_args[0][0] == ["groq"]
+    assert response.status_code == 200
+    assert response.json()["warmed_providers"] == {"groq": True}
+
+# --- Document Sessions ---
+
+def test_document_id_uses_incremental_processing(mocker):
+    """Tests that a document_id routes the request through document sessions."""
+    mock_process_document = mocker.patch(
+        "api.core.process_document",
+        return_value=("Fixed.", {"paragraphs": 2, "processed": 1, "reused": 1}),
+    )
+
+    response = client.post("/grammar", json={"text": "fixed.", "document_id": "doc-42"})
+
+    assert response.status_code == 200
+    assert response.json()["document"] == {"document_id": "doc-42", "paragraphs": 2, "processed": 1, "reused": 1}
+    scoped_id = mock_process_document.call_args[1]["document_id"]
+    assert scoped_id.endswith(":doc-42") and scoped_id != "doc-42"
+
+# --- Multi-target Translation ---
+
+def test_translate_multiple_languages(mocker):
+    """Tests that target_languages returns a per-language map of results."""
+    mock_translate_many = mocker.patch(
+        "api.core.translate_many",
+        return_value=({"French": "bonjour"}, {"German": "Error processing text: boom"}),
+    )
+
+    response = client.post("/translate", json={"text": "hello", "target_languages": ["French", "German"]})
+
+    assert response.status_code == 200
+    json_response = response.json()
+    assert json_response["success"] is False
+    assert json_response["translations"]["French"] == {"success": True, "processed_text": "bonjour", "error": None}
+    assert json_response["translations"]["German"]["success"] is False
+    assert mock_translate_many.call_args[1]["strategy"] == "parallel"
+
+def test_translate_rejects_both_target_fields():
+    """Tests that target_language and target_languages are mutually exclusive."""
+    response = client.post("/translate", json={"text": "hello", "target_language": "French", "target_languages": ["German"]})
+    assert response.status_code == 422
+
+# --- Deadlines and Cancellation ---
+
+def test_request_timeout_header_returns_504(mocker):
+    """Tests that X-Request-Timeout bounds how long the route waits for the provider."""
+    import time
+    mock_process_text = mocker.patch("api.core.process_text", side_effect=lambda **kwargs: time.sleep(1) or "late")
+
+    response = client.post("/grammar", json={"text": "slow"}, headers={"X-Request-Timeout": "0.2"})
+
+    assert response.status_code == 504
+    assert mock_process_text.call_args[1]["context"].cancelled
+
+def test_invalid_request_timeout_header():
+    """Tests that a malformed X-Request-Timeout is rejected."""
+    response = client.post("/grammar", json={"text": "test"}, headers={"X-Request-Timeout": "soon"})
+    assert response.status_code == 400
+
+def test_client_disconnect_cancels_context():
+    """Tests that a disconnect cancels the context and stops waiting on the call."""
+    import asyncio
+    import threading
+    from api import run_in_context
+    from core.context import RequestContext
+    from core.writon import RequestCancelled
+
+    class DisconnectedRequest:
+        class state:
+            pass
+
+    async def scenario():
+        DisconnectedRequest.state.disconnected = asyncio.Event()
+        asyncio.get_running_loop().call_later(0.1, DisconnectedRequest.state.disconnected.set)
+        await run_in_context(DisconnectedRequest(), context, release.wait, 5)
+
+    context = RequestContext(timeout=30)
+    release = threading.Event()
+
+    with pytest.raises(RequestCancelled):
+        asyncio.run(scenario())
+    release.set()
+    assert context.cancelled
+
+def test_request_id_is_echoed():
+    """Tests that a client-supplied X-Request-ID is returned, and one is generated otherwise."""
+    response = client.get("/health", headers={"X-Request-ID": "req-123"})
+    assert response.headers["X-Request-ID"] == "req-123"
+    assert client.get("/health").headers["X-Request-ID"]
+
+# --- Idempotency Keys ---
+
+def test_idempotency_key_replays_stored_response(mocker):
+    """Tests that a retried request with the same Idempotency-Key is not processed again."""
+    mock_process_text = mocker.patch("api.core.process_text", return_value="Fixed text.")
+    headers = {"Idempotency-Key": "retry-test-1"}
+
+    first = client.post("/grammar", json={"text": "fixed text"}, headers=headers)
+    second = client.post("/grammar", json={"text": "fixed text"}, headers=headers)
+
+    assert first.status_code == second.status_code == 200
+    assert mock_process_text.call_count == 1
+    assert second.json() == first.json()
+    assert second.headers["Idempotent-Replayed"] == "true"
+    assert "Idempotent-Replayed" not in first.headers
+
+def test_idempotency_key_reused_with_different_payload(mocker):
+    """Tests that reusing an Idempotency-Key for a different request is rejected."""
+    mocker.patch("api.core.process_text", return_value="Fixed text.")
+    headers = {"Idempotency-Key": "retry-test-2"}
+
+    client.post("/grammar", json={"text": "first text"}, headers=headers)
+    response = client.post("/grammar", json={"text": "second text"}, headers=headers)
+
+    assert response.status_code == 422
+
+# --- Pipelines ---
+
+def test_process_pipeline_returns_steps(mocker):
+    """Tests that /process runs a pipeline and reports its steps."""
+    mock_pipeline = mocker.patch("api.core.run_pipeline", return_value=(
+        "Hola mundo.", [{"modes": ["grammar", "translate"], "fused": True, "skipped": False, "duration_ms": 12.0}],
+    ))
+
+    response = client.post("/process", json={"text": "helo world", "pipeline": ["grammar", "translate"], "target_language": "Spanish"})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["mode"] == "pipeline"
+    assert body["processed_text"] == "Hola mundo."
+    assert body["pipeline"][0]["fused"] is True
+    assert mock_pipeline.call_args.kwargs["steps"] == ["grammar", "translate"]
+
+def test_process_requires_mode_or_pipeline():
+    """Tests that /process takes exactly one of mode and pipeline, with known steps."""
+    assert client.post("/process", json={"text": "test"}).status_code == 422
+    assert client.post("/process", json={"text": "test", "mode": "grammar", "pipeline": ["grammar"]}).status_code == 422
+    assert client.post("/process", json={"text": "test", "pipeline": ["grammar", "rewrite"]}).status_code == 422
+
+# --- Translation Memory ---
+
+def test_translate_reports_translation_memory_hits(mocker, tmp_path):
+    """Tests that /translate fills remembered sentences locally and reports the hit rate."""
+    from core.translation_memory import TranslationMemory
+    memory = TranslationMemory(str(tmp_path / "tm.db"))
+    mocker.patch("api.core.translation_memory", memory)
+    mocker.patch("api.core._call_ai", return_value="Gracias a todos.")
+    memory.store({"Version 2.4 fixes a crash.": "La versión 2.4 corrige un fallo."}, "Spanish", namespace="ip:testclient")
+
+    response = client.post("/translate", json={"text": "Version 2.4 fixes a crash. Thanks to everyone.", "target_language": "Spanish"})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["processed_text"] == "La versión 2.4 corrige un fallo. Gracias a todos."
+    assert body["translation_memory"]["exact_hits"] == 1
+    assert body["translation_memory"]["hit_rate"] == 0.5
+
+# --- Upstream Usage ---
+
+def test_process_reports_upstream_usage(mocker, monkeypatch):
+    """Tests that usage is returned and aggregated in /metrics, per key hash only behind METRICS_TOKEN."""
+    from core.settings import reset_settings
+    from core.usage import AIResult
+
+    def fake_process_text(**kwargs):
+        kwargs["context"].record_usage(AIResult("Fixed text.", model="m1", input_tokens=10, output_tokens=4, latency_ms=120.0, ttfb_ms=80.0))
+        return "Fixed text."
+
+    mocker.patch("api.core.process_text", side_effect=fake_process_text)
+    response = client.post("/grammar", json={"text": "fixed text"}, headers={"X-Provider": "groq", "X-Groq-Key": "usage-test-key"})
+
+    assert response.status_code == 200
+    assert response.json()["usage"] == {"calls": 1, "input_tokens": 10, "output_tokens": 4, "upstream_ms": 120.0, "ttfb_ms": 80.0, "model": "m1", "tier": None}
+    metrics = client.get("/metrics").text
+    assert 'writon_upstream_output_tokens_total{provider="groq",mode="grammar"}' in metrics
+    assert "key=" not in metrics
+
+    monkeypatch.setenv("METRICS_TOKEN", "metrics-secret")
+    reset_settings()
+    assert client.get("/metrics").status_code == 403
+    metrics = client.get("/metrics", headers={"Authorization": "Bearer metrics-secret"}).text
+    assert 'writon_upstream_output_tokens_total{provider="groq",mode="grammar",key="key:' in metrics
+
+# --- Summarize Compression ---
+
+def test_summarize_reports_compression(mocker, monkeypatch):
+    """Tests that a compressed summarize input is sent trimmed and reported in the response."""
+    monkeypatch.setenv("SUMMARIZE_COMPRESSION", "true")
+    monkeypatch.setenv("SUMMARIZE_COMPRESSION_MAX_TOKENS", "40")
+    mock_call_ai = mocker.patch("api.core._call_ai", return_value="Summary.")
+    text = " ".join(f"Point {i} about the river bridge repairs and their cost." for i in range(20))
+
+    response = client.post("/summarize", json={"text": text})
+
+    assert response.status_code == 200
+    compression = response.json()["compression"]
+    assert compression["sentences"] == 20 and compression["kept_sentences"] < 20
+    assert compression["kept_tokens"] <= 40 < compression["original_tokens"]
+    assert len(mock_call_ai.call_args[0][0]["user"]) < len(text)
+
+def test_summarize_compresses_long_input_with_default_budget(mocker, monkeypatch):
+    """Tests that the default budget trims an input close to the API's length limit."""
+    monkeypatch.setenv("SUMMARIZE_COMPRESSION", "true")
+    mock_call_ai = mocker.patch("api.core._call_ai", return_value="Summary.")
+    sentences = [f"Report {i} covers the harbour works, the budget and the delays." for i in range(200)]
+    text = " ".join(sentences)[:9900]
+
+    response = client.post("/summarize", json={"text": text})
+
+    assert response.status_code == 200
+    compression = response.json()["compression"]
+    assert compression["kept_tokens"] <= 1500 < compression["original_tokens"]
+    assert len(mock_call_ai.call_args[0][0]["user"]) < len(text)
+
+# --- Markdown ---
+
+def test_grammar_markdown_keeps_code_untouched(mocker):
+    """Tests that text_format markdown sends only prose and returns code blocks as they were."""
+    mock_call_ai = mocker.patch("api.core._call_ai", return_value="Fixed text with ⟦0⟧.")
+    text = "Teh text with `code`.\n\n```\nteh = 1\n```\n"
+
+    response = client.post("/grammar", json={"text": text, "text_format": "markdown"})
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["processed_text"] == "Fixed text with `code`.\n\n```\nteh = 1\n```\n"
+    assert data["markdown"] == {"blocks": 2, "prose_blocks": 1, "sent_chars": 18, "kept_original": 0}
+    assert "teh = 1" not in mock_call_ai.call_args[0][0]["user"]
+
+def test_markdown_rejected_with_document_id():
+    """Tests that markdown processing cannot be combined with document sessions."""
+    response = client.post("/grammar", json={"text": "Hi", "text_format": "markdown", "document_id": "doc-1"})
+    assert response.status_code == 422
+
+# --- Settings Reload ---
+
+def test_admin_reload_requires_token(monkeypatch):
+    """Tests that /admin/reload is hidden without ADMIN_TOKEN and swaps the settings with it."""
+    assert client.post("/admin/reload").status_code == 404
+
+    from core.settings import get_settings, reload_settings
+    monkeypatch.setenv("ADMIN_TOKEN", "admin-secret")
+    reload_settings()
+    assert client.post("/admin/reload", headers={"X-Admin-Token": "wrong"}).status_code == 403
+
+    monkeypatch.setenv("REQUEST_TIMEOUT_SECONDS", "42")
+    response = client.post("/admin/reload", headers={"X-Admin-Token": "admin-secret"})
+    assert response.status_code == 200
+    assert "request_timeout_seconds" in response.json()["changed"]
+    assert get_settings().request_timeout_seconds == 42.0
+
+# --- Admission Control ---
+
+def test_shed_request_returns_503_with_retry_after(mocker):
+    """Tests that a request shed by admission control gets 503 with Retry-After."""
+    from contextlib import asynccontextmanager
+    from core.writon import AdmissionRejected
+    mock_process_text = mocker.patch("api.core.process_text", return_value="Fixed text.")
+
+    @asynccontextmanager
+    async def reject(provider=None, congestion_errors=()):
+        raise AdmissionRejected("Too many requests in flight (global); try again shortly.", 3)
+        yield
+
+    mocker.patch("api.admission.admit", side_effect=reject)
+    response = client.post("/grammar", json={"text": "fixed text"})
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "3"
+    mock_process_text.assert_not_called()
+
+def test_metrics_reports_admission_pools(mocker):
+    """Tests that /metrics exposes admission counters in Prometheus text format."""
+    mocker.patch("api.core.process_text", return_value="Fixed text.")
+    client.post("/grammar", json={"text": "fixed text"})
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'writon_admission_inflight{pool="global"} 0' in response.text
+    assert "writon_admission_admitted_total" in response.text
+
+def test_unknown_provider_header_shares_one_admission_pool(mocker):
+    """Tests that arbitrary X-Provider values neither create pools nor break the metrics output."""
+    from api import admission
+
+    mocker.patch("api.core.process_text", return_value="Fixed text.")
+    for value in ('evil0"} 1', "evil1", "evil2"):
+        client.post("/grammar", json={"text": "fixed text"}, headers={"X-Provider": value})
+
+    assert not any(name.startswith("evil") for name in admission.provider_pools)
+    assert "other" in admission.provider_pools
+    assert "evil" not in client.get("/metrics").text
+
+# --- Profiling ---
+
+def test_profile_header_writes_profile(mocker, tmp_path):
+    """Tests that a request carrying the profiling token is profiled and only with the right token."""
+    from api import ProfilingMiddleware
+    mocker.patch("api.core.process_text", return_value="Fixed text.")
+    profiled = TestClient(ProfilingMiddleware(app, directory=str(tmp_path), token="secret"))
+
+    response = profiled.post("/grammar", json={"text": "fixed text"}, headers={"X-Writon-Profile": "secret"})
+    assert response.status_code == 200
+    profile_id = response.headers["X-Writon-Profile-Id"]
+    assert (tmp_path / f"{profile_id}.collapsed").exists()
+    assert (tmp_path / f"{profile_id}.pstats").exists()
+
+    response = profiled.post("/grammar", json={"text": "fixed text"}, headers={"X-Writon-Profile": "wrong"})
+    assert "X-Writon-Profile-Id" not in response.headers
+    assert len(list(tmp_path.glob("*.pstats"))) == 1
+
+# --- Traffic Capture ---
+
+def test_capture_records_request_shape(mocker, tmp_path):
+    """Tests that captured requests keep their shape and timing but not the text or keys."""
+    from api import CaptureMiddleware
+    from core.capture import TrafficCapture, load_capture
+    mocker.patch("api.core.process_text", return_value="Hola.")
+    capture = TrafficCapture(path=str(tmp_path / "traffic.ndjson"))
+    client_with_capture = TestClient(CaptureMiddleware(app, capture))
+
+    response = client_with_capture.post(
+        "/translate",
+        json={"text": "Hello, mail me at a@b.com", "target_language": "Spanish", "force_translation": True},
+        headers={"X-Provider": "groq", "X-Groq-Key": "gsk-secret"},
+    )
+    assert response.status_code == 200
+    client_with_capture.get("/health")
+    capture.close()
+
+    [record] = load_capture(list(tmp_path.glob("traffic.*.ndjson")))
+    assert record["path"] == "/translate" and record["mode"] == "translate" and record["status"] == 200
+    assert record["target_language"] == "Spanish" and record["provider"] == "groq" and record["text_chars"] == 25
+    assert "text" not in record and "gsk-secret" not in str(record)
+
+# --- Source Language Detection ---
+
+def test_translate_reports_detected_language(mocker, monkeypatch):
+    """Tests that /translate reports the detected source language and whether it skipped the provider."""
+    monkeypatch.setenv("LANGID_ENABLED", "true")
+    mocker.patch("api.core.process_text", return_value="I went to the store yesterday.")
+    text = "I went to the store yesterday and bought some milk and bread for breakfast."
+
+    response = client.post("/translate", json={"text": text, "target_language": "English"})
+    assert response.status_code == 200
+    detection = response.json()["detected_language"]
+    assert detection["language"] == "English"
+    assert detection["translation_skipped"] is True
+
+    forced = client.post("/translate", json={"text": text, "target_language": "English", "force_translation": True})
+    assert forced.json()["detected_language"]["translation_skipped"] is False
+
+# --- Response Formats ---
+
+def test_compact_response_omits_echo_fields(mocker):
+    """Tests that compact responses leave out the request echoes and null fields."""
+    mocker.patch("api.core.process_text", return_value="Fixed text.")
+
+    full = client.post("/grammar", json={"text": "fixed text"}).json()
+    by_query = client.post("/grammar?compact=true", json={"text": "fixed text"}).json()
+    by_accept = client.post(
+        "/grammar", json={"text": "fixed text"}, headers={"Accept": "application/vnd.writon.compact+json"}
+    ).json()
+
+    assert full["original_text"] == "fixed text"
+    for compact in (by_query, by_accept):
+        assert compact["processed_text"] == "Fixed text."
+        assert "original_text" not in compact
+        assert "mode" not in compact
+        assert "document" not in compact
+
+def test_msgpack_response_when_requested(mocker):
+    """Tests MessagePack content negotiation, falling back to JSON without msgpack."""
+    import api
+
+    mocker.patch("api.core.process_text", return_value="Fixed text.")
+    response = client.post("/grammar", json={"text": "fixed text"}, headers={"Accept": "application/msgpack"})
+
+    assert response.status_code == 200
+    if api.msgpack is None:
+        assert response.headers["content-type"] == "application/json"
+    else:
+        assert response.headers["content-type"] == "application/msgpack"
+        assert api.msgpack.unpackb(response.content)["processed_text"] == "Fixed text."
+
+# --- WebSocket Sessions ---
+
+def _fake_stream_provider(delay=0.05):
+    import time
+
+    class FakeProvider:
+        def stream_ai(self, prompt, system=None, context=None):
+            for word in ["hello ", "world"]:
+                time.sleep(delay)
+                if context.cancelled:
+                    return
+                yield word
+
+    return FakeProvider()
+
+def test_websocket_streams_and_supersedes(mocker):
+    """Tests that /ws streams deltas and that reusing an id cancels the earlier request."""
+    mock_create_provider = mocker.patch("api.core.create_provider", return_value=_fake_stream_provider())
+
+    with client.websocket_connect("/ws") as ws:
+        ws.send_json({"type": "auth", "provider": "groq", "api_key": "test-key"})
+        assert ws.receive_json() == {"type": "ready", "provider": "groq"}
+
+        ws.send_json({"type": "process", "id": "p1", "text": "hello world", "mode": "grammar"})
+        ws.send_json({"type": "process", "id": "p1", "text": "hello world!", "mode": "grammar"})
+        messages = [ws.receive_json() for _ in range(4)]
+
+    assert messages[0] == {"type": "cancelled", "id": "p1", "superseded": True}
+    assert [m["text"] for m in messages[1:3]] == ["hello ", "world"]
+    assert messages[3]["type"] == "result" and messages[3]["processed_text"] == "Hello world"
+    # Credentials are resolved once per session, not per request.
+    mock_create_provider.assert_called_once_with({"provider": "groq", "groq_key": "test-key"})
+
+def test_websocket_limits_server_key_requests_per_ip(mocker, monkeypatch):
+    """Tests that sessions on the server's keys get a per-IP rate limit and markdown is rejected."""
+    import api
+
+    mocker.patch("api.core.create_provider", return_value=_fake_stream_provider(delay=0))
+    monkeypatch.setattr(api, "WS_SERVER_KEY_LIMIT", "2/minute")
+    api.limiter.reset()
+
+    with client.websocket_connect("/ws") as ws:
+        ws.send_json({"type": "auth"})
+        assert ws.receive_json()["type"] == "ready"
+
+        ws.send_json({"type": "process", "id": "md", "text": "# Title", "mode": "grammar", "text_format": "markdown"})
+        error = ws.receive_json()
+        assert (error["id"], error["status"]) == ("md", 400) and "text_format" in error["message"]
+
+        ws.send_json({"type": "process", "id": "p2", "text": "hello world", "mode": "grammar"})
+        assert [ws.receive_json()["type"] for _ in range(3)] == ["delta", "delta", "result"]
+
+        ws.send_json({"type": "process", "id": "p3", "text": "hello world", "mode": "grammar"})
+        error = ws.receive_json()
+        assert (error["id"], error["status"]) == ("p3", 429) and error["retry_after"] >= 1
+    api.limiter.reset()
+
+def test_websocket_requires_auth_message(mocker):
+    """Tests that a session must start with a valid auth message."""
+    mocker.patch("api.core.create_provider", return_value=_fake_stream_provider())
+
+    with client.websocket_connect("/ws") as ws:
+        ws.send_json({"type": "process", "id": "p1", "text": "hello", "mode": "grammar"})
+        assert ws.receive_json()["status"] == 401
@@ -0,0 +1,210 @@
+import json
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from core.bulk import run_direct, wait_for_batch
+from core.providers import AnthropicProvider, OpenAIProvider
+from core.writon import AIProviderError, WritonCore
+
+
+class BatchStub(BaseHTTPRequestHandler):
+    """
+    Local stand-in for the OpenAI and Anthropic batch endpoints. Batches
+    finish after `POLLS_UNTIL_DONE` status checks; each request is answered
+    with its user prompt upper-cased, except prompts containing "fail".
+    Results come back shuffled to check that they are mapped by id.
+    """
+
+    POLLS_UNTIL_DONE = 2
+    state = {}
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, payload, status=200):
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self) -> bytes:
+        return self.rfile.read(int(self.headers["Content-Length"]))
+
+    def do_POST(self):
+        state = self.state
+        if self.path == "/v1/files":
+            boundary = self.headers["Content-Type"].split("boundary=")[1].encode()
+            part = next(p for p in self._body().split(b"--" + boundary) if b'name="file"' in p)
+            file_id = f"file-{len(state['files'])}"
+            state["files"][file_id] = part.split(b"\r\n\r\n", 1)[1].rsplit(b"\r\n", 1)[0].decode()
+            return self._send({"id": file_id})
+        if self.path == "/v1/batches":
+            request = json.loads(self._body())
+            batch_id = f"batch_{len(state['batches'])}"
+            lines = [json.loads(line) for line in state["files"][request["input_file_id"]].splitlines()]
+            state["batches"][batch_id] = {"kind": "openai", "polls": 0, "requests": lines}
+            return self._send({"id": batch_id, "status": "validating"})
+        if self.path == "/v1/messages/batches":
+            batch_id = f"msgbatch_{len(state['batches'])}"
+            state["batches"][batch_id] = {"kind": "anthropic", "polls": 0, "requests": json.loads(self._body())["requests"]}
+            return self._send({"id": batch_id, "processing_status": "in_progress"})
+        self._send({"error": {"message": "not found"}}, 404)
+
+    def do_GET(self):
+        state = self.state
+        parts = self.path.strip("/").split("/")
+        if parts[:2] == ["v1", "batches"]:
+            batch = state["batches"][parts[2]]
+            batch["polls"] += 1
+            done = batch["polls"] >= self.POLLS_UNTIL_DONE
+            total = len(batch["requests"])
+            return self._send({
+                "id": parts[2],
+                "status": "completed" if done else "in_progress",
+                "request_counts": {"total": total, "completed": total if done else 0, "failed": 0},
+                "output_file_id": f"out-{parts[2]}" if done else None,
+                "error_file_id": None,
+            })
+        if parts[:2] == ["v1", "files"] and parts[3] == "content":
+            batch = state["batches"][parts[2][len("out-"):]]
+            lines = []
+            for request in batch["requests"]:
+                prompt = request["body"]["messages"][-1]["content"]
+                if "fail" in prompt:
+                    response = {"status_code": 400, "body": {"error": {"message": "bad request"}}}
+                else:
+                    response = {"status_code": 200, "body": {"choices": [{"message": {"content": prompt.upper()}}], "model": "stub"}}
+                lines.append({"custom_id": request["custom_id"], "response": response})
+            random.shuffle(lines)
+            return self._send("\n".join(json.dumps(line) for line in lines).encode())
+        if parts[:3] == ["v1", "messages", "batches"] and len(parts) == 4:
+            batch = state["batches"][parts[3]]
+            batch["polls"] += 1
+            done = batch["polls"] >= self.POLLS_UNTIL_DONE
+            return self._send({
+                "id": parts[3],
+                "processing_status": "ended" if done else "in_progress",
+                "request_counts": {"processing": 0 if done else len(batch["requests"]), "succeeded": len(batch["requests"]) if done else 0},
+                "results_url": f"{state['url']}/v1/messages/batches/{parts[3]}/results" if done else None,
+            })
+        if parts[:3] == ["v1", "messages", "batches"] and parts[4] == "results":
+            lines = []
+            for request in state["batches"][parts[3]]["requests"]:
+                prompt = request["params"]["messages"][-1]["content"]
+                if "fail" in prompt:
+                    result = {"type": "errored", "error": {"type": "error", "error": {"message": "invalid request"}}}
+                else:
+                    result = {"type": "succeeded", "message": {"content": [{"text": prompt.upper()}], "model": "stub"}}
+                lines.append({"custom_id": request["custom_id"], "result": result})
+            random.shuffle(lines)
+            return self._send("\n".join(json.dumps(line) for line in lines).encode())
+        self._send({"error": {"message": "not found"}}, 404)
+
+
+@pytest.fixture
+def batch_stub(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), BatchStub)
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    BatchStub.state = {"files": {}, "batches": {}, "url": url}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(OpenAIProvider, "BASE_URL", url)
+    monkeypatch.setattr(AnthropicProvider, "BASE_URL", url)
+    yield BatchStub.state
+    server.shutdown()
+    server.server_close()
+
+
+def _core(monkeypatch, provider):
+    monkeypatch.setenv("API_PROVIDER", provider)
+    monkeypatch.setenv(f"{provider.upper()}_API_KEY", "test-key")
+    monkeypatch.setenv("BULK_POLL_SECONDS", "1")
+    return WritonCore()
+
+
+@pytest.mark.parametrize("provider", ["openai", "anthropic"])
+def test_bulk_job_maps_batch_results_in_order(batch_stub, monkeypatch, provider):
+    """Tests a full batch round trip against the local stub: submit, poll, fetch and reorder."""
+    core = _core(monkeypatch, provider)
+    texts = [f"text number {i}" for i in range(12)] + ["please fail"]
+    delays, statuses = [], []
+
+    results, stats = core.process_bulk(texts, "grammar", "lower", on_status=lambda batch: statuses.append(batch["status"]), sleep=delays.append)
+
+    assert len(batch_stub["batches"]) == 1
+    assert delays == [1.0]
+    assert statuses[-1] in ("completed", "ended")
+    for text, result in zip(texts[:-1], results):
+        assert text.upper() in result["text"].upper() and result["text"] == result["text"].lower()
+    assert "error" in results[-1]
+    assert stats["method"] == "batch" and stats["succeeded"] == 12 and stats["failed"] == 1
+    assert stats["batch_ids"] == list(batch_stub["batches"])
+
+
+def test_bulk_job_splits_into_provider_sized_batches(batch_stub, monkeypatch):
+    """Tests that jobs larger than MAX_BATCH_REQUESTS are submitted as several batches."""
+    monkeypatch.setattr(OpenAIProvider, "MAX_BATCH_REQUESTS", 4)
+    core = _core(monkeypatch, "openai")
+    texts = [f"item {i}" for i in range(10)]
+
+    results, stats = core.process_bulk(texts, "grammar", "upper", sleep=lambda seconds: None)
+
+    assert len(stats["batch_ids"]) == 3
+    assert [sorted(r["custom_id"] for r in b["requests"]) for b in batch_stub["batches"].values()][2] == ["writon-8", "writon-9"]
+    assert all(f"ITEM {i}" in result["text"] for i, result in enumerate(results))
+
+
+def test_bulk_job_falls_back_to_direct_calls(mocker, monkeypatch):
+    """Tests that providers without a batch API get concurrent direct calls with per-item errors."""
+    core = _core(monkeypatch, "groq")
+
+    def fake_call_ai(prompt_data, user_keys=None, context=None):
+        if "broken" in prompt_data["user"]:
+            raise AIProviderError("upstream failed")
+        return "fixed"
+
+    mock_call_ai = mocker.patch.object(core, "_call_ai", side_effect=fake_call_ai)
+    results, stats = core.process_bulk(["one", "broken", "three"], "grammar", "upper")
+
+    assert results == [{"text": "FIXED"}, {"error": "upstream failed"}, {"text": "FIXED"}]
+    assert mock_call_ai.call_count == 3
+    assert stats["method"] == "direct" and stats["batch_ids"] == []
+
+
+def test_wait_for_batch_backs_off_and_times_out():
+    """Tests the growing poll interval, tolerance of failed checks and the overall timeout."""
+    now = [0.0]
+    delays = []
+
+    def sleep(seconds):
+        delays.append(seconds)
+        now[0] += seconds
+
+    class Provider:
+        def __init__(self, answers):
+            self.answers = list(answers)
+
+        def get_batch(self, batch_id):
+            answer = self.answers.pop(0)
+            if isinstance(answer, Exception):
+                raise answer
+            return {"id": batch_id, "status": answer, "done": answer == "completed", "counts": {}}
+
+    provider = Provider(["in_progress", AIProviderError("503"), "in_progress", "completed"])
+    batch = wait_for_batch(provider, "b1", 10, 20, 3600, sleep=sleep, clock=lambda: now[0])
+    assert batch["status"] == "completed"
+    assert delays == [10, 15, 20]
+
+    with pytest.raises(AIProviderError, match="did not finish"):
+        wait_for_batch(Provider(["in_progress"] * 10), "b2", 10, 20, 30, sleep=sleep, clock=lambda: now[0])
+
+
+def test_run_direct_keeps_input_order():
+    """Tests that direct fallback results line up with their prompts."""
+    assert run_direct(lambda prompt: prompt["user"] * 2, [{"user": "a"}, {"user": "b"}], max_workers=2) == [
+        {"text": "aa"},
+        {"text": "bb"},
+    ]
@@ -0,0 +1,49 @@
+from core.capture import capture_record, latency_report, load_capture, percentile, redact_text, replay_payload, TrafficCapture
+
+
+def test_capture_record_keeps_shape_and_optionally_redacted_text():
+    """Tests that records keep workload fields, and text only when asked, with contacts and numbers masked."""
+    payload = {"text": "Call 555-0100 or mail a@b.com", "case_style": "title", "target_language": "French"}
+    record = capture_record("/translate", payload, 200, 12.5, provider="groq", started_at=100.0)
+    assert record == {"ts": 100.0, "path": "/translate", "status": 200, "duration_ms": 12.5, "mode": "translate",
+                      "case_style": "title", "target_language": "French", "provider": "groq", "text_chars": 29}
+
+    record = capture_record("/process", {**payload, "pipeline": ["grammar", "translate"]}, 200, 1.0, keep_text=True)
+    assert record["pipeline"] == ["grammar", "translate"] and "mode" not in record
+    assert record["text"] == "Call 000-0000 or mail <email>"
+    assert redact_text("see https://x.io/a?id=7") == "see <url>"
+
+
+def test_replay_payload_rebuilds_requests():
+    """Tests that replayed bodies match the captured shape and length."""
+    payload = replay_payload({"ts": 1, "path": "/grammar", "mode": "grammar", "text_chars": 500})
+    assert len(payload["text"]) == 500 and "mode" not in payload and payload["case_style"] == "sentence"
+
+    payload = replay_payload({"ts": 1, "path": "/process", "mode": "summarize", "case_style": "upper", "text": "x" * 10})
+    assert payload == {"text": "x" * 10, "mode": "summarize", "case_style": "upper"}
+
+
+def test_capture_files_round_trip_in_time_order(tmp_path):
+    """Tests that written records are read back ordered by time, skipping damaged lines."""
+    capture = TrafficCapture(path=str(tmp_path / "traffic.ndjson"))
+    capture.write({"ts": 2.0, "path": "/grammar"})
+    capture.write({"ts": 1.0, "path": "/summarize"})
+    capture.close()
+    [path] = tmp_path.glob("traffic.*.ndjson")
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"ts": 3.0, "path"\n')
+
+    assert [record["path"] for record in load_capture([str(path)])] == ["/summarize", "/grammar"]
+
+
+def test_latency_report_percentiles():
+    """Tests nearest-rank percentiles and per-mode error counts."""
+    assert percentile(list(range(1, 101)), 99) == 99
+    assert percentile([5.0], 50) == 5.0 and percentile([], 50) is None
+
+    results = [{"mode": "grammar", "status": 200, "latency_ms": ms} for ms in (10, 20, 30, 40)]
+    results.append({"mode": "translate", "status": None, "latency_ms": 5000})
+    report = latency_report(results)
+    assert report["modes"]["grammar"]["p50_ms"] == 20 and report["modes"]["grammar"]["errors"] == 0
+    assert report["modes"]["translate"]["errors"] == 1
+    assert report["overall"]["requests"] == 5 and report["overall"]["max_ms"] == 5000
@@ -0,0 +1,47 @@
+from core.compression import compress_text, score_sentences
+
+
+def _estimate(text):
+    return (len(text) + 3) // 4
+
+
+def _budget(sentences):
+    return sum(_estimate(sentence) + 1 for sentence in sentences)
+
+
+def test_short_text_is_left_alone():
+    """Tests that text within the budget is returned unchanged without stats."""
+    assert compress_text("One sentence. Two sentences.", 100, _estimate) == ("One sentence. Two sentences.", None)
+
+
+def test_compression_keeps_central_sentences_in_order():
+    """Tests that off-topic sentences are dropped first and the kept ones stay in their original order."""
+    on_topic = [
+        "The city council approved the new budget for public transport.",
+        "The transport budget adds ten bus lines and longer tram hours.",
+        "Council members said the budget for transport was overdue.",
+        "Residents welcomed the public transport budget at the council meeting.",
+    ]
+    off_topic = ["My cat enjoys sleeping on warm windowsills.", "Pancakes taste great with maple syrup."]
+    sentences = [on_topic[0], off_topic[0], on_topic[1], on_topic[2], off_topic[1], on_topic[3]]
+    text = " ".join(sentences)
+
+    compressed, stats = compress_text(text, _budget(on_topic), _estimate)
+
+    assert compressed == " ".join(on_topic)
+    assert stats["sentences"] == 6 and stats["kept_sentences"] == 4
+    assert stats["kept_tokens"] <= stats["original_tokens"] and 0 < stats["removed_ratio"] < 1
+
+
+def test_compression_keeps_paragraph_breaks():
+    """Tests that a paragraph break survives when the sentence before it is dropped."""
+    text = "Solar power is cheap. Unrelated pancake remark.\n\nSolar power keeps getting cheaper."
+    compressed, _ = compress_text(text, _budget(["Solar power is cheap.", "Solar power keeps getting cheaper."]), _estimate)
+    assert compressed == "Solar power is cheap.\n\nSolar power keeps getting cheaper."
+
+
+def test_centroid_scoring_for_long_inputs():
+    """Tests that inputs above the TextRank limit are still scored, one score per sentence."""
+    sentences = [f"Sentence number {i} talks about rivers and bridges." for i in range(200)]
+    scores = score_sentences(sentences)
+    assert len(scores) == 200 and scores[0] == max(scores)
@@ -48,4 +48,466 @@ def test_error_handling_in_process_text(core, mocker):
             text="some text",
             mode="grammar",
             case_style="sentence"
-        )
\ No newline at end of file
+        )
+
+def test_preload_modes_caches_configs(core, mocker):
+    """Tests that mode configurations are read from disk only once."""
+    core.preload_modes()
+    assert set(core._mode_configs) == set(WritonCore.MODES)
+
+    mock_open = mocker.patch('builtins.open')
+    mocker.patch.object(core, '_call_ai', return_value="fixed.")
+    core.process_text(text="fix me", mode="grammar", case_style="sentence")
+    mock_open.assert_not_called()
+
+def test_warm_up_reports_unreachable_providers(core, mocker):
+    """Tests that warm-up opens connections and reports network failures."""
+    import requests
+
+    def fake_head(url, timeout):
+        if "groq" in url:
+            raise requests.ConnectionError("unreachable")
+
+    session = mocker.Mock()
+    session.head.side_effect = fake_head
+    mocker.patch('core.providers.get_http_session', return_value=session)
+
+    result = core.warm_up(["openai", "groq"], timeout=1)
+
+    assert result == {"openai": True, "groq": False}
+    assert session.head.call_count == 2
+
+def test_process_document_reuses_unchanged_paragraphs(core, mocker):
+    """Tests that only edited paragraphs are sent upstream on resubmission."""
+    mocker.patch.object(core, '_resolve_provider', return_value=("groq", "key", "model"))
+    mock_call_ai = mocker.patch.object(core, '_call_ai', side_effect=lambda prompt, keys, context=None: prompt['user'].split("\n\n")[1].upper())
+
+    first, stats = core.process_document("one.\n\ntwo.\n\nthree.", "grammar", "upper", "doc-1")
+    assert first == "ONE.\n\nTWO.\n\nTHREE."
+    assert stats == {"paragraphs": 3, "processed": 3, "reused": 0}
+
+    second, stats = core.process_document("one.\n\n2.\n\nthree.", "grammar", "upper", "doc-1")
+    assert second == "ONE.\n\n2.\n\nTHREE."
+    assert stats == {"paragraphs": 3, "processed": 1, "reused": 2}
+    assert mock_call_ai.call_count == 4
+
+def test_process_document_rejects_summarize(core):
+    """Tests that document sessions are limited to paragraph-local modes."""
+    with pytest.raises(ValueError, match="not supported for 'summarize'"):
+        core.process_document("text", "summarize", "sentence", "doc-1")
+
+def test_document_store_evicts_by_size_and_ttl(mocker):
+    """Tests LRU size eviction and TTL expiry of document sessions."""
+    from core.documents import DocumentSessionStore
+
+    clock = mocker.patch('core.documents.time.monotonic', return_value=0)
+    store = DocumentSessionStore(ttl_seconds=10, max_documents=2)
+    store.put("a", {"x": "1"})
+    store.put("b", {"y": "2"})
+    store.get("a")
+    store.put("c", {"z": "3"})
+    assert store.get("b") == {}
+    assert store.get("a") == {"x": "1"}
+
+    clock.return_value = 11
+    assert store.get("a") == {}
+    assert len(store) == 0
+
+def test_translate_many_reports_per_language_failures(core, mocker):
+    """Tests that one failing language does not fail the whole batch."""
+    def fake_process_text(text, mode, case_style, target_language, user_keys, context=None, force_translation=False):
+        if target_language == "Klingon":
+            raise ValueError("Error processing text: unsupported")
+        return f"{text} in {target_language}"
+
+    mocker.patch.object(core, 'process_text', side_effect=fake_process_text)
+
+    results, errors = core.translate_many("hello", ["French", "Klingon", "french", "German"], "lower")
+
+    assert results == {"French": "hello in French", "German": "hello in German"}
+    assert list(errors) == ["Klingon"]
+
+def test_translate_many_combined_strategy_falls_back_for_missing(core, mocker):
+    """Tests the single-prompt strategy and per-language fallback."""
+    mock_call_ai = mocker.patch.object(core, '_call_ai', return_value='```json\n{"french": "bonjour"}\n```')
+    mock_process_text = mocker.patch.object(core, 'process_text', return_value="hallo")
+
+    results, errors = core.translate_many("hello", ["French", "German"], "lower", strategy="combined")
+
+    assert results == {"French": "bonjour", "German": "hallo"}
+    assert errors == {}
+    assert "French, German" in mock_call_ai.call_args[0][0]["user"]
+    mock_process_text.assert_called_once_with("hello", "translate", "lower", "German", None, context=None, force_translation=False)
+
+def test_idempotency_store_coalesces_concurrent_duplicates():
+    """Tests that duplicates wait for the in-flight call and later ones replay its result."""
+    import asyncio
+    from core.idempotency import IdempotencyStore
+    from core.writon import IdempotencyKeyReused
+
+    store = IdempotencyStore()
+    calls = []
+
+    async def handler():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def scenario():
+        first, second = await asyncio.gather(store.run("k", "fp", handler), store.run("k", "fp", handler))
+        third = await store.run("k", "fp", handler)
+        with pytest.raises(IdempotencyKeyReused):
+            await store.run("k", "other", handler)
+        return first, second, third
+
+    first, second, third = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert first == ("result", False)
+    assert second == ("result", True)
+    assert third == ("result", True)
+
+def test_idempotency_store_releases_key_on_failure():
+    """Tests that a failed call is not stored and a waiting duplicate runs it again."""
+    import asyncio
+    from core.idempotency import IdempotencyStore
+
+    store = IdempotencyStore()
+    outcomes = iter([RuntimeError("boom"), "recovered"])
+
+    async def handler():
+        await asyncio.sleep(0.01)
+        outcome = next(outcomes)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    async def scenario():
+        return await asyncio.gather(store.run("k", "fp", handler), store.run("k", "fp", handler), return_exceptions=True)
+
+    first, second = asyncio.run(scenario())
+    assert isinstance(first, RuntimeError)
+    assert second == ("recovered", False)
+
+def test_admission_sheds_when_queue_is_full():
+    """Tests that requests beyond the in-flight limit queue, and are shed once the queue is full or times out."""
+    import asyncio
+    from core.admission import AdmissionController
+    from core.writon import AdmissionRejected
+
+    admission = AdmissionController(max_inflight=1, max_inflight_per_provider=0, max_queue=1, queue_timeout=0.05)
+
+    async def hold(seconds):
+        async with admission.admit("openai"):
+            await asyncio.sleep(seconds)
+        return "done"
+
+    async def scenario():
+        return await asyncio.gather(hold(0.02), hold(0), hold(0), return_exceptions=True)
+
+    first, second, third = asyncio.run(scenario())
+    assert first == second == "done"
+    assert isinstance(third, AdmissionRejected) and third.retry_after >= 1
+
+    async def timeout_scenario():
+        return await asyncio.gather(hold(0.2), hold(0), return_exceptions=True)
+
+    _, waited = asyncio.run(timeout_scenario())
+    assert isinstance(waited, AdmissionRejected)
+    snapshot = admission.snapshot()["global"]
+    assert snapshot["inflight"] == snapshot["queue_depth"] == 0
+    assert snapshot["shed_total"] == {"queue_full": 1, "queue_timeout": 1}
+
+def test_admission_adaptive_limit_backs_off_on_congestion():
+    """Tests that the adaptive limit is cut on congestion errors and never drops below the minimum."""
+    import asyncio
+    from core.admission import AdmissionController
+    from core.writon import DeadlineExceeded
+
+    admission = AdmissionController(max_inflight=10, max_inflight_per_provider=10, adaptive=True, min_inflight=2)
+
+    async def timed_out():
+        async with admission.admit("openai", congestion_errors=(DeadlineExceeded,)):
+            raise DeadlineExceeded("slow")
+
+    for _ in range(10):
+        with pytest.raises(DeadlineExceeded):
+            asyncio.run(timed_out())
+    pools = admission.snapshot()
+    assert pools["global"]["limit"] == pools["provider:openai"]["limit"] == 2
+
+def test_admission_slot_held_until_abandoned_work_finishes():
+    """Tests that a slot handed to unfinished work is released only when that work is done."""
+    import asyncio
+    from core.admission import AdmissionController
+
+    admission = AdmissionController(max_inflight=1, max_inflight_per_provider=0)
+
+    async def scenario():
+        work = asyncio.get_running_loop().create_future()
+        async with admission.admit("openai") as slot:
+            slot.hold_until(work)
+        held = admission.snapshot()["global"]["inflight"]
+        work.set_result(None)
+        await asyncio.sleep(0)
+        return held, admission.snapshot()["global"]["inflight"]
+
+    assert asyncio.run(scenario()) == (1, 0)
+
+def test_admission_buckets_unknown_providers():
+    """Tests that provider names outside the known set share one pool."""
+    import asyncio
+    from core.admission import AdmissionController
+
+    admission = AdmissionController(max_inflight=10, max_inflight_per_provider=10, providers=("openai", "groq"))
+
+    async def call(provider):
+        async with admission.admit(provider):
+            pass
+
+    for provider in ("openai", "x1", "x2", 'x"3'):
+        asyncio.run(call(provider))
+    assert set(admission.snapshot()) == {"global", "provider:openai", "provider:other"}
+    assert admission.snapshot()["provider:other"]["admitted_total"] == 3
+
+def test_micro_batching_shares_one_upstream_call(mocker, monkeypatch):
+    """Tests that concurrent short grammar requests are sent as one tagged prompt."""
+    from concurrent.futures import ThreadPoolExecutor
+    import re
+
+    monkeypatch.setenv("MICROBATCH_WINDOW_MS", "200")
+    monkeypatch.setenv("API_PROVIDER", "groq")
+    monkeypatch.setenv("GROQ_API_KEY", "test-key")
+    core = WritonCore()
+
+    def fake_call_ai(prompt_data, user_keys=None, context=None):
+        items = re.findall(r'<item id="(\d+)">(.*?)</item>', prompt_data["user"])
+        return "\n".join(f'<item id="{i}">{text.upper()}</item>' for i, text in items)
+
+    mock_call_ai = mocker.patch.object(core, "_call_ai", side_effect=fake_call_ai)
+    texts = ["one.", "two.", "three."]
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        results = list(executor.map(lambda t: core.process_text(t, "grammar", "none"), texts))
+
+    assert results == ["ONE.", "TWO.", "THREE."]
+    assert mock_call_ai.call_count == 1
+    assert "<item id=" in mock_call_ai.call_args[0][0]["system"]
+
+def test_micro_batching_falls_back_when_split_fails(mocker, monkeypatch):
+    """Tests that an answer that cannot be split falls back to individual calls."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    monkeypatch.setenv("MICROBATCH_WINDOW_MS", "200")
+    monkeypatch.setenv("API_PROVIDER", "groq")
+    monkeypatch.setenv("GROQ_API_KEY", "test-key")
+    core = WritonCore()
+
+    def fake_call_ai(prompt_data, user_keys=None, context=None):
+        if "<item" in prompt_data["user"]:
+            return "Sorry, here are the corrections: ONE. TWO."
+        return "fixed"
+
+    mock_call_ai = mocker.patch.object(core, "_call_ai", side_effect=fake_call_ai)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results = list(executor.map(lambda t: core.process_text(t, "grammar", "none"), ["one.", "two."]))
+
+    assert results == ["fixed", "fixed"]
+    assert mock_call_ai.call_count == 3
+
+def test_process_markdown_sends_only_prose(mocker, monkeypatch):
+    """Tests that markdown prose goes upstream in one batch and code, URLs and case of code stay untouched."""
+    import re
+
+    monkeypatch.setenv("API_PROVIDER", "groq")
+    monkeypatch.setenv("GROQ_API_KEY", "test-key")
+    core = WritonCore()
+
+    def fake_call_ai(prompt_data, user_keys=None, context=None):
+        items = re.findall(r'<item id="(\d+)">(.*?)</item>', prompt_data["user"], re.DOTALL)
+        return "\n".join(f'<item id="{i}">{text.replace("teh", "the")}</item>' for i, text in items)
+
+    mock_call_ai = mocker.patch.object(core, "_call_ai", side_effect=fake_call_ai)
+    text = "# teh title\n\nSee `teh_var` at https://example.com/teh.\n\n```\nteh code\n```\n"
+    result, stats = core.process_markdown(text, "grammar", "upper")
+
+    assert result == "# THE TITLE\n\nSEE `teh_var` AT https://example.com/teh.\n\n```\nteh code\n```\n"
+    assert mock_call_ai.call_count == 1
+    sent = mock_call_ai.call_args[0][0]
+    assert "teh code" not in sent["user"] and "example.com" not in sent["user"]
+    assert "⟦0⟧" in sent["system"]
+    assert stats == {"blocks": 3, "prose_blocks": 2, "sent_chars": len("teh title") + len("See ⟦0⟧ at ⟦1⟧."), "kept_original": 0}
+
+def test_split_batch_requires_every_item():
+    """Tests validation of tagged batch answers."""
+    from core.batching import split_batch
+
+    assert split_batch('<item id="1">a</item><item id="2">b</item>', 2) == ["a", "b"]
+    assert split_batch('<item id="1">a</item>', 2) is None
+    assert split_batch('<item id="1">a</item><item id="1">b</item>', 2) is None
+    assert split_batch('<item id="1">a</item><item id="2"> </item>', 2) is None
+
+def test_detect_language():
+    """Tests local language identification by trigram profile and by script."""
+    from core.langid import detect_language, normalize_language
+
+    language, confidence = detect_language("I went to the store yesterday and bought some milk and bread for breakfast.")
+    assert language == "English" and confidence >= 0.9
+    assert detect_language("Gisteren ging ik naar de winkel en kocht ik melk en brood voor het ontbijt.")[0] == "Dutch"
+    assert detect_language("Привет, ты можешь помочь мне с домашним заданием сегодня вечером?")[0] == "Russian"
+    assert detect_language("こんにちは、元気ですか？今日は天気がいいですね。")[0] == "Japanese"
+    assert detect_language("hi there") is None
+    assert normalize_language("en-US") == normalize_language("english") == "English"
+    assert normalize_language("Español") == "Spanish"
+    assert normalize_language("nb-NO") == "Norwegian" and normalize_language("polski") == "Polish"
+
+@pytest.mark.parametrize("target, text", [
+    ("Italian", "Gmina postanowiła, że w przyszłym roku zbuduje nowy most na rzece, żeby rowerzyści szybciej dojeżdżali do centrum."),
+    ("Dutch", "Kommunen har bestämt att bygga en ny bro över ån nästa år, så att cyklisterna snabbare kommer in till centrum."),
+    ("Dutch", "Die munisipaliteit het besluit om volgende jaar 'n nuwe brug oor die rivier te bou sodat fietsryers vinniger in die middestad kom."),
+    ("Dutch", "Kommunen har bestemt at de skal bygge en ny bro over elva neste år, slik at syklistene kommer raskere inn til sentrum."),
+    ("English", "Thành phố đã quyết định xây một cây cầu mới bắc qua sông vào năm tới để người đi xe đạp đến trung tâm nhanh hơn."),
+    ("Spanish", "Mae'r cyngor wedi penderfynu adeiladu pont newydd dros yr afon y flwyddyn nesaf fel bod beicwyr yn cyrraedd canol y dref yn gyflymach."),
+    ("Swedish", "Sveitarfélagið hefur ákveðið að byggja nýja brú yfir ána á næsta ári svo að hjólreiðamenn komist hraðar inn í miðbæinn."),
+])
+def test_translation_from_other_languages_is_not_skipped(core, mocker, monkeypatch, target, text):
+    """Tests that text in a neighbouring or unprofiled language still reaches the provider."""
+    from core.settings import reload_settings
+    monkeypatch.setenv("LANGID_ENABLED", "true")
+    reload_settings()
+    mock_call_ai = mocker.patch.object(core, '_call_ai', return_value="translated")
+
+    assert core.process_text(text, "translate", "none", target_language=target) == "translated"
+    mock_call_ai.assert_called_once()
+
+def test_langid_is_off_by_default(core, mocker):
+    """Tests that without LANGID_ENABLED even text in the target language is sent to the provider."""
+    mock_call_ai = mocker.patch.object(core, '_call_ai', return_value="translated")
+
+    core.process_text("I went to the store yesterday and bought some milk and bread for breakfast.", "translate", "none", target_language="English")
+    mock_call_ai.assert_called_once()
+
+def test_translation_into_source_language_skips_provider(core, mocker, monkeypatch):
+    """Tests that text already in the target language is only case-converted."""
+    from core.settings import reload_settings
+    monkeypatch.setenv("LANGID_ENABLED", "true")
+    reload_settings()
+    mock_call_ai = mocker.patch.object(core, '_call_ai', return_value="hola")
+    text = "i went to the store yesterday and bought some milk and bread for breakfast."
+
+    result = core.process_text(text, "translate", "sentence", target_language="English")
+
+    assert result == "I went to the store yesterday and bought some milk and bread for breakfast."
+    mock_call_ai.assert_not_called()
+
+    core.process_text(text, "translate", "sentence", target_language="English", force_translation=True)
+    mock_call_ai.assert_called_once()
+
+@pytest.mark.parametrize("target, text", [
+    ("zh-TW", "我们今天下午去公园散步，然后在附近的餐厅吃晚饭。这个城市的天气很好。"),
+    ("Chinese (Traditional)", "我们今天下午去公园散步，然后在附近的餐厅吃晚饭。这个城市的天气很好。"),
+    ("pt-BR", "Ontem fui ao mercado e comprei leite, pão e fruta para o pequeno-almoço da família."),
+])
+def test_translation_to_regional_variant_is_not_skipped(core, mocker, target, text):
+    """Tests that a region or script qualifier on the target always reaches the provider."""
+    from core.langid import language_qualifier
+
+    mock_call_ai = mocker.patch.object(core, '_call_ai', return_value="translated")
+
+    assert language_qualifier(target)
+    assert core.process_text(text, "translate", "none", target_language=target) == "translated"
+    mock_call_ai.assert_called_once()
+
+def test_pipeline_fuses_grammar_and_translate(core, mocker, monkeypatch):
+    """Tests that grammar followed by translate is sent as one fused prompt."""
+    from core.settings import reload_settings
+    monkeypatch.setenv("API_PROVIDER", "groq")
+    reload_settings()
+    mock_call_ai = mocker.patch.object(core, '_call_ai', return_value="hola mundo")
+
+    result, steps = core.run_pipeline("helo world", ["grammar", "translate"], "sentence", target_language="Spanish")
+
+    assert result == "Hola mundo"
+    mock_call_ai.assert_called_once()
+    prompt = mock_call_ai.call_args[0][0]['user']
+    assert "Fix grammar" in prompt and "Spanish" in prompt
+    assert [(step["modes"], step["fused"]) for step in steps] == [(["grammar", "translate"], True)]
+
+def test_pipeline_without_fusion_chains_steps(core, mocker, monkeypatch):
+    """Tests that unfused steps run in order, each on the previous raw output, with case applied once."""
+    monkeypatch.setenv("API_PROVIDER", "groq")
+    mock_call_ai = mocker.patch.object(core, '_call_ai', side_effect=["the summary.", "el resumen."])
+
+    result, steps = core.run_pipeline("a long text to summarize", ["summarize", "translate"], "upper", target_language="Spanish", fuse=False)
+
+    assert result == "EL RESUMEN."
+    assert "the summary." in mock_call_ai.call_args_list[1][0][0]['user']
+    assert [step["modes"] for step in steps] == [["summarize"], ["translate"]]
+
+def test_pipeline_rejects_translate_without_language(core):
+    """Tests that a pipeline with a translate step requires a target language."""
+    with pytest.raises(ValueError, match="target_language"):
+        core.run_pipeline("text", ["grammar", "translate"], "sentence")
+
+def test_translate_with_memory_only_sends_new_sentences(core, mocker, tmp_path):
+    """Tests that remembered sentences are filled locally and new ones are sent with fuzzy hints."""
+    from core.translation_memory import TranslationMemory
+    core.translation_memory = TranslationMemory(str(tmp_path / "tm.db"))
+    mock_call_ai = mocker.patch.object(core, '_call_ai', side_effect=[
+        '<item id="1">La versión 2.4 corrige un fallo.</item>\n<item id="2">Gracias a todos.</item>',
+        "La versión 2.5 corrige un fallo.",
+    ])
+
+    first, stats = core.translate_with_memory("Version 2.4 fixes a crash. Thanks to everyone.", "Spanish", "sentence")
+    assert first == "La versión 2.4 corrige un fallo. Gracias a todos."
+    assert stats["translated"] == 2 and stats["exact_hits"] == 0
+
+    second, stats = core.translate_with_memory("Version 2.5 fixes a crash. Thanks to everyone.", "Spanish", "sentence")
+    assert second == "La versión 2.5 corrige un fallo. Gracias a todos."
+    assert stats == {"segments": 2, "exact_hits": 1, "fuzzy_hits": 1, "translated": 1, "hit_rate": 0.5}
+    prompt = mock_call_ai.call_args[0][0]
+    assert "Version 2.5 fixes a crash." in prompt["user"] and "Thanks to everyone" not in prompt["user"]
+    assert "Version 2.4 fixes a crash. => La versión 2.4 corrige un fallo." in prompt["system"]
+
+def test_usage_tracker_aggregates_per_provider_mode_and_key():
+    """Tests that request usage is summed per group and unreported fields count as zero."""
+    from core.usage import AIResult, UsageTracker, summarize_usage
+
+    usage = summarize_usage([
+        AIResult("a", model="m1", input_tokens=10, output_tokens=5, latency_ms=100.0, ttfb_ms=40.0),
+        AIResult("b", model="m2", input_tokens=None, output_tokens=7, latency_ms=50.0),
+    ])
+    assert usage == {"calls": 2, "input_tokens": 10, "output_tokens": 12, "upstream_ms": 150.0, "ttfb_ms": 40.0, "model": "m2", "tier": None}
+    assert summarize_usage([]) is None
+
+    tracker = UsageTracker(max_keys=1)
+    tracker.record("groq", "grammar", "key:abc", usage)
+    tracker.record("groq", "grammar", "key:abc", usage)
+    tracker.record("groq", "grammar", "key:def", usage)
+    totals = {group["key"]: group for group in tracker.snapshot()}
+    assert totals["key:abc"]["requests"] == 2 and totals["key:abc"]["output_tokens"] == 24
+    assert totals["other"]["requests"] == 1
+
+def test_model_tier_follows_input_size(core, monkeypatch):
+    """Tests that the mode's model tier is picked by input size and a pinned or configured model wins."""
+    from core.settings import reload_settings
+    monkeypatch.delenv("MODEL_TIERS_ENABLED", raising=False)
+    monkeypatch.delenv("OPENAI_MODEL", raising=False)
+    keys = {"provider": "openai", "openai_key": "sk-test"}
+
+    provider = core.create_provider(keys, "summarize", "short text")
+    assert (provider.model, provider.tier) == ("gpt-4o-mini", "small")
+    # The longest API input (10000 characters) gets the default tier.
+    assert core.provider_identity(keys, "summarize", "word " * 2000) == ("openai", "gpt-4o")
+    assert core.create_provider(keys, "grammar", "word " * 1000).tier == "default"
+    assert core.create_provider({"provider": "groq", "groq_key": "gsk-test"}, "grammar", "short text").tier is None
+
+    pinned = core.create_provider({**keys, "openai_model": "gpt-4.1"}, "summarize", "short text")
+    assert (pinned.model, pinned.tier) == ("gpt-4.1", None)
+
+    monkeypatch.setenv("OPENAI_MODEL", "gpt-4o")
+    reload_settings()
+    configured = core.create_provider(keys, "summarize", "short text")
+    assert (configured.model, configured.tier) == ("gpt-4o", None)
+
+    monkeypatch.setenv("MODEL_TIERS_ENABLED", "false")
+    reload_settings()
+    assert core.create_provider(keys, "summarize", "short text").tier is None
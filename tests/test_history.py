@@ -0,0 +1,53 @@
+import io
+import json
+
+import pytest
+
+from core.history import HistoryStore
+
+
+@pytest.fixture
+def history(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.db"))
+    yield store
+    store.close()
+
+
+def test_lookup_matches_exact_input_and_settings(history):
+    result_id = history.record("this have errors", "This has errors.", "grammar", "sentence", provider="groq", model="m1", duration_ms=12.5)
+
+    hit = history.lookup("this have errors", "grammar", "sentence", provider="groq", model="m1")
+    assert hit["id"] == result_id
+    assert hit["output"] == "This has errors."
+    assert history.lookup("this have errors", "grammar", "upper", provider="groq", model="m1") is None
+    assert history.lookup("this have errors", "grammar", "sentence", provider="groq", model="m2") is None
+
+
+def test_search_and_export(history):
+    history.record("the quick brown fox", "The quick brown fox.", "grammar", "sentence")
+    history.record("hello world", "hola mundo", "translate", "lower", target_language="Spanish")
+
+    assert [row["output"] for row in history.search("mundo")] == ["hola mundo"]
+    assert history.search('fox" OR "') == []
+
+    buffer = io.StringIO()
+    assert history.export_jsonl(buffer) == 2
+    rows = [json.loads(line) for line in buffer.getvalue().splitlines()]
+    assert rows[1]["target_language"] == "Spanish"
+
+
+def test_import_legacy_file(history, tmp_path):
+    legacy = tmp_path / "trans_spanish_20250101_120000.txt"
+    legacy.write_text(
+        "--- Original Text ---\nhello\n\n--- Processed Text ---\nHola\n\n--- Stats ---\n"
+        "Mode: translate\nCase Style: sentence\nAI Provider: groq\nOriginal Character Count: 5",
+        encoding="utf-8",
+    )
+
+    result_id = history.import_legacy_file(str(legacy))
+    assert history.import_legacy_file(str(legacy)) == result_id
+    assert len(history) == 1
+
+    row = history.search("hola")[0]
+    assert (row["original"], row["target_language"], row["provider"]) == ("hello", "Spanish", "groq")
+    assert row["created_at"] == "2025-01-01T12:00:00"
@@ -0,0 +1,65 @@
+import io
+import json
+import logging
+
+from core.log import JsonFormatter, SamplingFilter, TracebackLimiter, configure_logging, flush_logging, get_logger, log_exception
+
+
+def _record(**extra):
+    record = logging.LogRecord("writon.test", logging.INFO, __file__, 1, "Request completed", (), None)
+    for key, value in extra.items():
+        setattr(record, key, value)
+    return record
+
+def test_json_formatter_includes_extra_fields():
+    entry = json.loads(JsonFormatter().format(_record(request_id="abc", duration_ms=12.5, sample=True)))
+    assert entry["message"] == "Request completed"
+    assert entry["level"] == "info"
+    assert entry["request_id"] == "abc"
+    assert entry["duration_ms"] == 12.5
+    assert "sample" not in entry
+
+def test_sampling_filter_only_drops_sampled_records():
+    sampler = SamplingFilter(rate=0.0)
+    assert sampler.filter(_record(sample=True)) is False
+    assert sampler.filter(_record()) is True
+    assert SamplingFilter(rate=1.0).filter(_record(sample=True)) is True
+
+def test_traceback_limiter():
+    limiter = TracebackLimiter(per_minute=2)
+    assert [limiter.allow() for _ in range(3)] == [True, True, False]
+
+def test_records_are_written_by_background_listener():
+    stream = io.StringIO()
+    configure_logging(stream=stream, level="INFO", fmt="json", sample_rate=1.0)
+    try:
+        logger = get_logger("test")
+        try:
+            raise RuntimeError("boom")
+        except RuntimeError as e:
+            log_exception(logger, "Processing failed", e, route="/grammar")
+        flush_logging()
+        entry = json.loads(stream.getvalue().strip().splitlines()[-1])
+        assert entry["logger"] == "writon.test"
+        assert entry["route"] == "/grammar"
+        assert entry["error_type"] == "RuntimeError"
+        assert "traceback" in entry or entry.get("traceback_suppressed")
+    finally:
+        configure_logging()
+
+def test_configure_logging_reads_the_settings_snapshot(monkeypatch):
+    monkeypatch.setenv("DEBUG_MODE", "true")
+    monkeypatch.setenv("LOG_TRACEBACKS_PER_MINUTE", "3")
+    try:
+        configure_logging(stream=io.StringIO())
+        from core.log import _traceback_limiter
+
+        assert logging.getLogger("writon").level == logging.DEBUG
+        assert _traceback_limiter.per_minute == 3
+    finally:
+        monkeypatch.delenv("DEBUG_MODE")
+        monkeypatch.delenv("LOG_TRACEBACKS_PER_MINUTE")
+        from core.settings import reset_settings
+
+        reset_settings()
+        configure_logging()
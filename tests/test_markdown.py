@@ -0,0 +1,90 @@
+from core.markdown import ProseNode, batch_texts, parse_markdown, prose_nodes
+
+DOCUMENT = """---
+title: Release notes
+---
+# Using `writon` ##
+
+Install it from https://pypi.org/project/writon/ and read the [guide](https://writon.xyz/docs "Docs").
+It also works with <kbd>Ctrl</kbd> shortcuts.
+
+- [ ] first task
+- second item
+  continued here
+
+> quoted text
+
+```python
+print("do not touch")
+```
+
+    indented code
+
+| name | value |
+|------|-------|
+| a    | 1     |
+
+[docs]: https://writon.xyz/docs
+"""
+
+
+def _kinds(nodes):
+    return [node.kind for node in nodes if node.kind != "blank"]
+
+
+def test_parse_reassembles_exactly():
+    """Tests that joining the parsed nodes gives back the document byte for byte."""
+    for text in (DOCUMENT, DOCUMENT.replace("\n", "\r\n"), "no trailing newline", "", "```\nunclosed fence"):
+        assert "".join(node.text for node in parse_markdown(text)) == text
+
+
+def test_parse_separates_prose_from_structure():
+    """Tests which blocks are prose and which are kept verbatim."""
+    nodes = parse_markdown(DOCUMENT)
+    assert _kinds(nodes) == [
+        "front_matter", "heading", "paragraph", "list_item", "list_item",
+        "paragraph", "code", "code", "table", "reference",
+    ]
+    masked = [node.masked for node in prose_nodes(nodes)]
+    assert masked[0] == "Using ⟦0⟧"
+    assert masked[1] == "Install it from ⟦0⟧ and read the [guide⟦1⟧.\nIt also works with ⟦2⟧Ctrl⟦3⟧ shortcuts."
+    assert masked[2:] == ["first task", "second item\ncontinued here", "quoted text"]
+
+
+def test_render_reapplies_markers_and_spans():
+    """Tests that processed prose is written back with its line markers and protected spans."""
+    nodes = parse_markdown(DOCUMENT)
+    output = "".join(node.render(node.masked.upper()) if isinstance(node, ProseNode) else node.render() for node in nodes)
+
+    assert "# USING `writon` ##\n" in output
+    assert "[GUIDE](https://writon.xyz/docs \"Docs\")" in output
+    assert "- [ ] FIRST TASK\n- SECOND ITEM\n  CONTINUED HERE\n" in output
+    assert "> QUOTED TEXT\n" in output
+    assert 'print("do not touch")' in output and "    indented code" in output
+
+
+def test_render_keeps_original_when_placeholders_change():
+    """Tests that an answer that drops or duplicates a placeholder is rejected."""
+    node = prose_nodes(parse_markdown("Call `run()` now.\n"))[0]
+    assert node.render("Call ⟦0⟧ later.") == "Call `run()` later.\n"
+    assert node.render("Call it later.") == "Call `run()` now.\n"
+    assert node.render("Call ⟦0⟧ and ⟦0⟧.") == "Call `run()` now.\n"
+
+
+def test_render_joins_lines_when_line_count_changes():
+    """Tests that a multi-line paragraph answered on one line keeps its first marker."""
+    node = prose_nodes(parse_markdown("> first line\n> second line\n"))[0]
+    assert node.render("One line.") == "> One line.\n"
+
+
+def test_nodes_without_prose_are_not_sent():
+    """Tests that list items holding only a link or a number are left out."""
+    nodes = parse_markdown("- https://example.com\n- 42\n- real words\n")
+    assert [node.masked for node in prose_nodes(nodes)] == ["real words"]
+
+
+def test_batch_texts_respects_size_limit():
+    """Tests grouping of prose into batches of limited size."""
+    assert batch_texts(["aaaa", "bbbb", "cc"], 8) == [["aaaa", "bbbb"], ["cc"]]
+    assert batch_texts(["a", "x" * 20, "b"], 8) == [["a"], ["x" * 20], ["b"]]
+    assert batch_texts(["a", "<item id=\"1\">", "b"], 8) == [["a"], ["<item id=\"1\">"], ["b"]]
@@ -0,0 +1,82 @@
+import asyncio
+import pstats
+import sys
+import threading
+import time
+
+from core.profiling import SamplingProfiler, active_profile, bind_thread, save_profile
+
+
+def busy_work(seconds):
+    end = time.perf_counter() + seconds
+    total = 0
+    while time.perf_counter() < end:
+        total += sum(range(100))
+    return total
+
+
+def test_bound_worker_thread_is_sampled(tmp_path):
+    profile = SamplingProfiler(interval=0.001)
+    token = active_profile.set(profile)
+    try:
+        worker = threading.Thread(target=bind_thread(busy_work), args=(0.1,))
+    finally:
+        active_profile.reset(token)
+    profile.start()
+    worker.start()
+    worker.join()
+    profile.stop()
+
+    collapsed = profile.collapsed()
+    assert collapsed.startswith("worker;")
+    assert "busy_work (tests/test_profiling.py:" in collapsed
+
+    prefix = save_profile(profile, str(tmp_path), "20250101T000000000000_process", max_profiles=5)
+    stats = pstats.Stats(prefix + ".pstats")
+    busy = [key for key in stats.stats if key[2] == "busy_work"]
+    assert busy and stats.stats[busy[0]][3] > 0
+
+
+def test_bind_thread_is_a_no_op_without_a_profile():
+    assert bind_thread(busy_work) is busy_work
+
+
+def test_save_profile_keeps_newest(tmp_path):
+    profile = SamplingProfiler()
+    for i in range(4):
+        save_profile(profile, str(tmp_path), f"2025010{i}T000000000000_process", max_profiles=2)
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "20250102T000000000000_process.collapsed",
+        "20250102T000000000000_process.pstats",
+        "20250103T000000000000_process.collapsed",
+        "20250103T000000000000_process.pstats",
+    ]
+
+
+
+
+def other_request(profile):
+    profile.sample()
+
+
+def test_loop_samples_are_limited_to_the_anchored_task():
+    profile = SamplingProfiler()
+
+    async def profiled():
+        profile.add_thread(threading.get_ident(), "loop", anchor=sys._getframe())
+        await asyncio.sleep(0)
+        profile.sample()
+
+    async def other():
+        await asyncio.sleep(0)
+        other_request(profile)
+
+    async def main():
+        await asyncio.gather(profiled(), other())
+
+    asyncio.run(main())
+
+    collapsed = profile.collapsed()
+    assert "profiled (tests/test_profiling.py:" in collapsed
+    assert "other_request" not in collapsed
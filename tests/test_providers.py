@@ -0,0 +1,204 @@
+import pytest
+from core.providers import OpenAIProvider, GroqProvider, GoogleProvider, AnthropicProvider
+
+
+def _provider_with_response(mocker, provider_class, payload):
+    """Builds a provider whose HTTP session returns `payload` as JSON."""
+    provider = provider_class(api_key="test-key", model="test-model")
+    provider.session = mocker.Mock()
+    provider.session.post.return_value.json.return_value = payload
+    return provider
+
+
+CHAT_RESPONSE = {"choices": [{"message": {"content": " done "}}]}
+
+
+@pytest.mark.parametrize("provider_class", [OpenAIProvider, GroqProvider])
+def test_chat_providers_send_native_system_message(provider_class, mocker):
+    """Tests that OpenAI-compatible providers use a single system role message."""
+    provider = _provider_with_response(mocker, provider_class, CHAT_RESPONSE)
+
+    assert provider.call_ai("fix this", system="You fix grammar.") == "done"
+
+    messages = provider.session.post.call_args[1]["json"]["messages"]
+    assert messages == [
+        {"role": "system", "content": "You fix grammar."},
+        {"role": "user", "content": "fix this"},
+    ]
+
+
+def test_anthropic_sends_cacheable_system_field(mocker):
+    """Tests that Anthropic receives the system prompt with a cache breakpoint."""
+    provider = _provider_with_response(mocker, AnthropicProvider, {"content": [{"text": "done"}]})
+
+    provider.call_ai("fix this", system="You fix grammar.")
+
+    data = provider.session.post.call_args[1]["json"]
+    assert data["system"] == [{"type": "text", "text": "You fix grammar.", "cache_control": {"type": "ephemeral"}}]
+    assert data["messages"] == [{"role": "user", "content": "fix this"}]
+
+
+def test_google_sends_system_instruction(mocker):
+    """Tests that Gemini receives the system prompt as systemInstruction."""
+    payload = {"candidates": [{"content": {"parts": [{"text": "done"}]}}]}
+    provider = _provider_with_response(mocker, GoogleProvider, payload)
+
+    provider.call_ai("fix this", system="You fix grammar.")
+
+    data = provider.session.post.call_args[1]["json"]
+    assert data["systemInstruction"] == {"parts": [{"text": "You fix grammar."}]}
+    assert data["contents"] == [{"role": "user", "parts": [{"text": "fix this"}]}]
+
+
+def test_call_ai_passes_system_separately(mocker):
+    """Tests that WritonCore no longer inlines the system prompt into the user turn."""
+    from core.writon import WritonCore
+
+    core = WritonCore()
+    provider = mocker.Mock()
+    provider.call_ai.return_value = "done"
+    mocker.patch.object(core, "_get_provider", return_value=provider)
+
+    core._call_ai({"system": "You fix grammar.", "user": "fix this"})
+
+    provider.call_ai.assert_called_once_with("fix this", system="You fix grammar.", context=None)
+
+
+# --- Deadlines, Retries and Cancellation ---
+
+def _response(status_code, payload=None, headers=None):
+    from unittest.mock import Mock
+    response = Mock(status_code=status_code, headers=headers or {})
+    response.json.return_value = payload
+    return response
+
+
+def test_retries_transient_errors_within_budget(mocker):
+    """Tests that a 503 is retried when the remaining budget allows it."""
+    from core.context import RequestContext
+
+    provider = _provider_with_response(mocker, OpenAIProvider, None)
+    provider.session.post.side_effect = [_response(503, headers={"retry-after": "0"}), _response(200, CHAT_RESPONSE)]
+
+    assert provider.call_ai("fix this", context=RequestContext(timeout=30)) == "done"
+    assert provider.session.post.call_count == 2
+    assert provider.session.post.call_args[1]["timeout"] <= 30
+
+
+def test_no_retry_when_budget_is_exhausted(mocker):
+    """Tests that the remaining budget vetoes a retry and bounds the attempt timeout."""
+    from core.context import RequestContext
+
+    provider = _provider_with_response(mocker, OpenAIProvider, None)
+    provider.session.post.side_effect = [_response(503, headers={"retry-after": "0"})]
+
+    with pytest.raises(Exception, match="OpenAI API call failed"):
+        provider.call_ai("fix this", context=RequestContext(timeout=1))
+    assert provider.session.post.call_count == 1
+    assert provider.session.post.call_args[1]["timeout"] <= 1
+
+
+@pytest.mark.parametrize("provider_class", [OpenAIProvider, AnthropicProvider])
+def test_batch_creation_is_never_retried(provider_class, mocker):
+    """Tests that a batch is created in a single attempt, so a timeout cannot submit it twice."""
+    import requests
+    from core.writon import AIProviderError
+
+    provider = _provider_with_response(mocker, provider_class, None)
+    upload = _response(200, {"id": "file-1"})
+    creations = [requests.Timeout("read timed out"), _response(200, {"id": "batch-1"})]
+    provider.session.post.side_effect = ([upload] if provider_class is OpenAIProvider else []) + creations
+
+    with pytest.raises(AIProviderError, match="batch submission failed"):
+        provider.submit_batch([("writon-0", "fix this", None)])
+    assert provider.session.post.call_count == (2 if provider_class is OpenAIProvider else 1)
+
+
+def test_cancelled_context_skips_upstream_call(mocker):
+    """Tests that a cancelled request never reaches the provider."""
+    from core.context import RequestContext
+    from core.writon import RequestCancelled
+
+    provider = _provider_with_response(mocker, OpenAIProvider, CHAT_RESPONSE)
+    context = RequestContext(timeout=30)
+    context.cancel()
+
+    with pytest.raises(RequestCancelled):
+        provider.call_ai("fix this", context=context)
+    provider.session.post.assert_not_called()
+
+
+@pytest.mark.parametrize("provider_class,lines", [
+    (OpenAIProvider, ['data: {"choices": [{"delta": {"content": "Hel"}}]}', "", 'data: {"choices": [{"delta": {"content": "lo"}}]}', "data: [DONE]"]),
+    (AnthropicProvider, ["event: content_block_delta", 'data: {"type": "content_block_delta", "delta": {"text": "Hel"}}', 'data: {"type": "content_block_delta", "delta": {"text": "lo"}}', 'data: {"type": "message_stop"}']),
+    (GoogleProvider, ['data: {"candidates": [{"content": {"parts": [{"text": "Hel"}]}}]}', 'data: {"candidates": [{"content": {"parts": [{"text": "lo"}]}}]}']),
+])
+def test_stream_ai_yields_deltas(provider_class, lines, mocker):
+    """Tests that server-sent events are parsed into text deltas."""
+    provider = provider_class(api_key="test-key", model="test-model")
+    provider.session = mocker.MagicMock()
+    response = provider.session.post.return_value.__enter__.return_value
+    response.iter_lines.return_value = iter(lines)
+
+    assert list(provider.stream_ai("hi", system="Be brief.")) == ["Hel", "lo"]
+    assert provider.session.post.call_args[1]["stream"] is True
+
+
+def test_stream_ai_stops_when_cancelled(mocker):
+    """Tests that a cancelled context ends the stream at the next chunk."""
+    from core.context import RequestContext
+    from core.writon import RequestCancelled
+
+    context = RequestContext(timeout=10)
+    provider = GroqProvider(api_key="test-key", model="test-model")
+    provider.session = mocker.MagicMock()
+    response = provider.session.post.return_value.__enter__.return_value
+    response.iter_lines.return_value = iter(['data: {"choices": [{"delta": {"content": "a"}}]}'] * 3)
+
+    stream = provider.stream_ai("hi", context=context)
+    assert next(stream) == "a"
+    context.cancel()
+    with pytest.raises(RequestCancelled):
+        next(stream)
+
+
+@pytest.mark.parametrize("provider_class,payload", [
+    (OpenAIProvider, {**CHAT_RESPONSE, "model": "gpt-4o-2024-08-06", "usage": {"prompt_tokens": 12, "completion_tokens": 3}}),
+    (AnthropicProvider, {"content": [{"text": "done"}], "model": "claude-3-haiku-20240307", "usage": {"input_tokens": 12, "output_tokens": 3}}),
+    (GoogleProvider, {"candidates": [{"content": {"parts": [{"text": "done"}]}}], "modelVersion": "gemini-1.5-flash-002", "usageMetadata": {"promptTokenCount": 12, "candidatesTokenCount": 3}}),
+])
+def test_call_ai_reports_usage(provider_class, payload, mocker):
+    """Tests that call_ai returns token counts and the serving model, and records them on the context."""
+    from core.context import RequestContext
+
+    provider = _provider_with_response(mocker, provider_class, payload)
+    provider.session.post.return_value.status_code = 200
+    context = RequestContext(timeout=30)
+
+    result = provider.call_ai("fix this", context=context)
+
+    assert result == "done"
+    assert (result.input_tokens, result.output_tokens) == (12, 3)
+    assert result.model == payload.get("model", payload.get("modelVersion"))
+    assert result.latency_ms >= 0
+    assert context.usage == [result]
+
+
+def test_stream_ai_records_usage(mocker):
+    """Tests that a stream's token usage and time to first token are recorded on the context."""
+    from core.context import RequestContext
+
+    provider = AnthropicProvider(api_key="test-key", model="test-model")
+    provider.session = mocker.MagicMock()
+    response = provider.session.post.return_value.__enter__.return_value
+    response.iter_lines.return_value = iter([
+        'data: {"type": "message_start", "message": {"model": "claude-x", "usage": {"input_tokens": 20}}}',
+        'data: {"type": "content_block_delta", "delta": {"text": "Hi"}}',
+        'data: {"type": "message_delta", "usage": {"output_tokens": 2}}',
+    ])
+    context = RequestContext(timeout=30)
+
+    assert list(provider.stream_ai("hi", context=context)) == ["Hi"]
+    [usage] = context.usage
+    assert (usage, usage.model, usage.input_tokens, usage.output_tokens) == ("Hi", "claude-x", 20, 2)
+    assert usage.ttfb_ms is not None
@@ -0,0 +1,59 @@
+import argparse
+
+import pytest
+
+import main
+from main import CliSession
+
+
+def _args(**overrides):
+    return argparse.Namespace(**{"no_history": True, "no_cache": True, **overrides})
+
+
+def test_session_commands_update_settings():
+    """Tests that :mode, :lang and :case change the settings used for the next texts."""
+    session = CliSession()
+    session.command(":mode translate Spanish")
+    session.command(":case title")
+    assert (session.mode, session.target_language, session.case_style) == ("translate", "Spanish", "title")
+    session.command(":lang German")
+    assert "-> German" in session.prompt
+
+    with pytest.raises(ValueError, match="Unknown mode"):
+        session.command(":mode poetry")
+    with pytest.raises(ValueError, match="Unknown command"):
+        session.command(":frobnicate")
+
+
+def test_session_reuses_one_core_across_inputs(mocker, monkeypatch, capsys):
+    """Tests that a session builds one WritonCore, remembers settings and reports latency per call."""
+    core = mocker.Mock()
+    core.provider_identity.return_value = ("groq", "llama")
+    core.process_text.side_effect = lambda text, mode, case_style, target_language: f"{mode}:{target_language}:{text}"
+    core_class = mocker.patch("core.writon.WritonCore", return_value=core)
+    mocker.patch("core.log.configure_logging")
+
+    lines = iter([
+        "first text",
+        ":mode translate French",
+        "second text",
+        ":paste",
+        "line one",
+        "line two",
+        ".",
+        ":quit",
+    ])
+    monkeypatch.setattr("builtins.input", lambda prompt="": next(lines))
+
+    main.run_session(_args())
+
+    assert core_class.call_count == 1
+    calls = [call.kwargs for call in core.process_text.call_args_list]
+    assert [(c["mode"], c["target_language"], c["text"]) for c in calls] == [
+        ("grammar", None, "first text"),
+        ("translate", "French", "second text"),
+        ("translate", "French", "line one\nline two"),
+    ]
+    out = capsys.readouterr().out
+    assert "translate:French:line one\nline two" in out
+    assert "3 text(s) processed; first call" in out
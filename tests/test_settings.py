@@ -0,0 +1,51 @@
+import pytest
+
+from core.settings import RESTART_FIELDS, Settings, get_settings, reload_settings
+from core.writon import ConfigurationError
+
+
+def test_settings_parse_types_and_provider_credentials():
+    """Tests that values are typed, lists split and provider keys and models collected."""
+    settings = Settings.from_env({
+        "API_PROVIDER": "Groq",
+        "GROQ_API_KEY": "gsk-1",
+        "OPENAI_MODEL": "gpt-4.1",
+        "MODEL_TIERS_ENABLED": "false",
+        "REQUEST_TIMEOUT_SECONDS": "30",
+        "ALLOWED_ORIGINS": "https://a.example, https://b.example",
+        "WEB_CONCURRENCY": "3",
+        "PROFILE_STARTUP": "true",
+    })
+    assert settings.api_provider == "groq" and settings.api_key("groq") == "gsk-1" and settings.api_key("openai") is None
+    assert settings.model("openai") == "gpt-4.1" and settings.model_tiers_enabled is False
+    assert settings.request_timeout_seconds == 30.0
+    assert settings.allowed_origins == ("https://a.example", "https://b.example")
+    assert settings.web_concurrency == 3 and settings.profile_startup is True and settings.port == 8000
+    assert Settings.from_env({}).summarize_compression_max_tokens == 1500
+
+
+def test_invalid_settings_report_every_problem():
+    """Tests that validation fails with all invalid values listed at once."""
+    with pytest.raises(ConfigurationError) as excinfo:
+        Settings.from_env({"API_PROVIDER": "cohere", "MICROBATCH_MAX_SIZE": "0", "TM_ENABLED": "maybe", "HTTP_POOL_SIZE": "ten"})
+    message = str(excinfo.value)
+    for name in ("API_PROVIDER", "MICROBATCH_MAX_SIZE", "TM_ENABLED", "HTTP_POOL_SIZE"):
+        assert name in message
+
+
+def test_reload_swaps_snapshot_and_keeps_it_on_error(monkeypatch):
+    """Tests that a reload reports changed fields and an invalid one leaves the snapshot in place."""
+    monkeypatch.setenv("LANGID_MIN_CONFIDENCE", "0.9")
+    before = get_settings()
+
+    monkeypatch.setenv("LANGID_MIN_CONFIDENCE", "0.7")
+    monkeypatch.setenv("ADMISSION_MAX_INFLIGHT", "64")
+    after, changed = reload_settings()
+    assert before.langid_min_confidence == 0.9 and after.langid_min_confidence == 0.7
+    assert set(changed) == {"langid_min_confidence", "admission_max_inflight"}
+    assert "admission_max_inflight" in RESTART_FIELDS and "langid_min_confidence" not in RESTART_FIELDS
+
+    monkeypatch.setenv("LANGID_MIN_CONFIDENCE", "2")
+    with pytest.raises(ConfigurationError):
+        reload_settings()
+    assert get_settings() is after
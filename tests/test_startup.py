@@ -0,0 +1,76 @@
+import os
+import subprocess
+import sys
+import time
+
+from core.startup import parse_importtime, format_import_profile
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Generous wall-clock budgets (seconds) for a cold interpreter; override on slow CI machines.
+VERSION_BUDGET = float(os.getenv("STARTUP_BUDGET_VERSION_SECONDS", "1.5"))
+HEALTH_BUDGET = float(os.getenv("STARTUP_BUDGET_HEALTH_SECONDS", "4.0"))
+
+
+def _run_timed(args):
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, *args], cwd=PROJECT_ROOT, capture_output=True, text=True)
+    return result, time.perf_counter() - start
+
+
+def test_cli_import_does_not_load_providers():
+    """Tests that importing the CLI does not pull in requests, dotenv or the providers."""
+    result, _ = _run_timed([
+        "-c",
+        "import main, sys; print(sorted(m for m in ('requests', 'dotenv', 'core.writon', 'core.providers') if m in sys.modules))",
+    ])
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "[]"
+
+
+def test_api_import_does_not_load_providers():
+    """Tests that the API starts without importing provider clients."""
+    result, _ = _run_timed(["-c", "import api, sys; print('core.providers' in sys.modules, 'requests' in sys.modules)"])
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "False False"
+
+
+def test_api_import_does_not_load_optional_stores():
+    """Tests that the translation memory, history and capture (and sqlite3/difflib) load only when used."""
+    modules = ("sqlite3", "difflib", "core.translation_memory", "core.history", "core.capture")
+    result, _ = _run_timed(["-c", f"import api, sys; print(sorted(m for m in {modules!r} if m in sys.modules))"])
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "[]"
+
+
+def test_version_startup_budget():
+    """Fails if `writon --version` regresses past its startup budget."""
+    result, elapsed = _run_timed(["main.py", "--version"])
+    assert result.returncode == 0, result.stderr
+    assert "0.1.0" in result.stdout
+    assert elapsed < VERSION_BUDGET, f"`--version` took {elapsed:.2f}s (budget {VERSION_BUDGET}s)"
+
+
+def test_first_health_response_budget():
+    """Fails if the first /health response of a fresh process regresses past its budget."""
+    script = (
+        "from fastapi.testclient import TestClient; import api; "
+        "response = TestClient(api.app).get('/health'); print(response.status_code)"
+    )
+    result, elapsed = _run_timed(["-c", script])
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip().endswith("200")
+    assert elapsed < HEALTH_BUDGET, f"first /health took {elapsed:.2f}s (budget {HEALTH_BUDGET}s)"
+
+
+def test_parse_importtime():
+    """Tests parsing and formatting of `-X importtime` output."""
+    output = (
+        "import time: self [us] | cumulative | imported package\n"
+        "import time:       120 |        120 |   json.decoder\n"
+        "import time:       300 |        420 | json\n"
+        "not an import line\n"
+    )
+    rows = parse_importtime(output)
+    assert rows == [("json", 300, 420), ("json.decoder", 120, 120)]
+    assert "json.decoder" in format_import_profile(rows, top=2)
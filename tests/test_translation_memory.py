@@ -0,0 +1,50 @@
+import pytest
+
+from core.translation_memory import TranslationMemory, split_segments
+
+
+@pytest.fixture
+def memory(tmp_path):
+    store = TranslationMemory(str(tmp_path / "tm.db"))
+    yield store
+    store.close()
+
+
+def test_split_segments_round_trips():
+    text = "Hello there. How are you?\nFine!  Thanks."
+    segments, separators = split_segments(text)
+    assert segments == ["Hello there.", "How are you?", "Fine!", "Thanks."]
+    assert "".join(s + sep for s, sep in zip(segments, separators + [""])) == text
+
+
+def test_exact_lookup_is_scoped_by_language_and_namespace(memory):
+    memory.store({"The release is out.": "La versión ya está disponible."}, "Spanish", namespace="a")
+
+    assert memory.lookup(["The  release is out."], "es", namespace="a") == {"The release is out.": "La versión ya está disponible."}
+    assert memory.lookup(["The release is out."], "French", namespace="a") == {}
+    assert memory.lookup(["The release is out."], "Spanish", namespace="b") == {}
+    assert len(memory) == 1
+
+
+def test_regional_variants_do_not_share_entries(memory):
+    memory.store({"The bus is late.": "O ônibus está atrasado."}, "pt-BR")
+    memory.store({"The bus is late.": "公車誤點了。"}, "zh-TW")
+
+    assert memory.lookup(["The bus is late."], "Portuguese (BR)") == {"The bus is late.": "O ônibus está atrasado."}
+    assert memory.lookup(["The bus is late."], "pt-PT") == {}
+    assert memory.lookup(["The bus is late."], "Portuguese") == {}
+    assert memory.lookup(["The bus is late."], "Chinese") == {}
+    assert memory.lookup(["The bus is late."], "Chinese (Traditional)") == {}
+    assert memory.lookup(["The bus is late."], "zh_TW") == {"The bus is late.": "公車誤點了。"}
+
+
+def test_fuzzy_lookup_finds_similar_sentences(memory):
+    memory.store({
+        "Version 2.4 fixes a crash when opening large files.": "La versión 2.4 corrige un fallo al abrir archivos grandes.",
+        "Thanks to everyone who reported bugs.": "Gracias a todos los que informaron errores.",
+    }, "Spanish")
+
+    matches = memory.fuzzy("Version 2.5 fixes a crash when opening large files.", "Spanish")
+    assert [source for source, _, _ in matches] == ["Version 2.4 fixes a crash when opening large files."]
+    assert matches[0][2] >= memory.fuzzy_threshold
+    assert memory.fuzzy("Completely unrelated sentence here.", "Spanish") == []